@@ -1,17 +1,22 @@
 import math
 import random
+import threading
 
 import chess
 import numpy as np
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Any, Dict
+from typing import List, Tuple, Any, Dict, Optional
 from enum import Enum
-from game import Game
-from collections import namedtuple
-from util import flip_move, mirror, mirror_sense_result
+from game import Game, SimGame
+from collections import namedtuple, OrderedDict
+from util import flip_move, mirror, move_to_id, SenseObservation
 
 eps = 1e-3
+# nodes are locked through a fixed pool of striped locks so that threaded searches don't need a lock object per node
+NODE_LOCKS = [threading.RLock() for _ in range(1024)]
 EngineSpec = namedtuple('Engine', ['sense_engine', 'sim_engine', 'ucb_engine'])
+# stand-in for a candidate move of a play node whose child hasn't been created yet
+UnexpandedChild = namedtuple('UnexpandedChild', ['incoming_edge', 'visit_count', 'total_reward', 'availability_count'])
 
 
 def purify(sq: chess.Square):
@@ -64,8 +69,18 @@ class InformationSet(ABC):
         """
         pass
 
+    def random_samples(self, n: int) -> List[Game]:
+        """
+        randomly generates n sample board states
+        """
+        return [self.random_sample() for _ in range(n)]
+
     @abstractmethod
     def update_with_sense(self, sense_result: List[Tuple[chess.Square, chess.Piece]]):
+        """
+        :param sense_result: a SenseObservation, or a list of (square, chess.Piece or None) as Game.handle_sense
+                             gives it
+        """
         pass
 
     @abstractmethod
@@ -73,8 +88,8 @@ class InformationSet(ABC):
         pass
 
     @abstractmethod
-    def propagate_opponent_move(self, possible_moves: List[chess.Move], captured_square: chess.Piece,
-                                captured_piece: bool):
+    def propagate_opponent_move(self, possible_moves: List[chess.Move], captured_piece: bool,
+                                captured_square: Optional[chess.Square]):
         pass
 
     @abstractmethod
@@ -94,6 +109,9 @@ class InformationSet(ABC):
 
 
 class SenseEngine(ABC):
+    # whether choose_sense always picks the same square for the same belief, which lets nodes memoize the choice
+    deterministic = True
+
     @abstractmethod
     def choose_sense(self, board: InformationSet) -> chess.Square:
         """
@@ -104,8 +122,91 @@ class SenseEngine(ABC):
         pass
 
 
+class PriorEngine(ABC):
+    @abstractmethod
+    def move_priors(self, info_set: InformationSet, game_state: Game, moves: List[chess.Move]) -> np.ndarray:
+        """
+        cheaply rates moves before they have been searched
+        :param info_set: belief of the player to move
+        :param game_state: determinization the moves are played in
+        :param moves: moves requested on game_state
+        :return: numpy array of priors, higher is better
+        """
+        pass
+
+
+class ProgressiveWidening:
+    """
+    limits the moves a play node considers to the ceil(c * n^alpha) moves with the highest prior, where n is the
+    node's visit count
+    """
+
+    def __init__(self, prior_engine: PriorEngine, c=2.0, alpha=0.5, min_moves=1):
+        self.prior_engine = prior_engine
+        self.c = c
+        self.alpha = alpha
+        self.min_moves = min_moves
+
+    def limit(self, visit_count):
+        return max(self.min_moves, math.ceil(self.c * max(visit_count, 0) ** self.alpha))
+
+    def admit(self, info_set: InformationSet, game_state: Game, moves, requested_moves, visit_count,
+              move_visits=None):
+        """
+        :param moves: moves from the node's perspective
+        :param requested_moves: the same moves as requested on game_state
+        :param move_visits: visit counts of the moves' children, none visited by default
+        :return: the admitted moves, best prior first. ties go to the most visited move, then to the lowest
+                 move_to_id, so the admitted moves only grow with the visit count whatever order moves come in
+        """
+        limit = self.limit(visit_count)
+        if len(moves) <= limit:
+            return moves
+        priors = self.prior_engine.move_priors(info_set, game_state, requested_moves)
+        if move_visits is None:
+            move_visits = [0] * len(moves)
+        order = sorted(range(len(moves)), key=lambda i: (-priors[i], -move_visits[i], move_to_id(moves[i])))
+        return [moves[i] for i in order[:limit]]
+
+
+class BeliefCache:
+    """
+    bounded LRU cache of information sets that were materialized for tree nodes
+    """
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # bumped on every clear, so values derived from cached beliefs can tell when they went stale
+        self.generation = 0
+
+    def get(self, node):
+        with self.lock:
+            info_set = self.entries.get(node)
+            if info_set is not None:
+                self.entries.move_to_end(node)
+            return info_set
+
+    def put(self, node, info_set):
+        with self.lock:
+            self.entries[node] = info_set
+            self.entries.move_to_end(node)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class Node:
-    info_set: InformationSet
+    belief: InformationSet
+    belief_cache: BeliefCache
 
     children: Dict
     incoming_edge: Any
@@ -116,8 +217,16 @@ class Node:
     availability_count: int
     total_reward: float
 
-    def __init__(self, info_set: InformationSet, player, incoming_edge, parent):
-        self.info_set = info_set.__copy__()
+    def __init__(self, info_set: InformationSet, player, incoming_edge, parent, belief_cache: BeliefCache = None):
+        """
+        :param info_set: belief at this node. pass None to derive the belief lazily from the parent's belief and the
+                         incoming edge when it is first needed
+        :param belief_cache: cache for lazily materialized beliefs, shared with the parent by default
+        """
+        self.belief = None if info_set is None else info_set.__copy__()
+        if belief_cache is None:
+            belief_cache = BeliefCache() if parent is None else parent.belief_cache
+        self.belief_cache = belief_cache
         self.children = {}
         self.incoming_edge = incoming_edge
         self.parent = parent
@@ -126,6 +235,29 @@ class Node:
         self.total_reward = 0
         self.availability_count = 0
 
+    @property
+    def info_set(self) -> InformationSet:
+        if self.belief is not None:
+            return self.belief
+        info_set = self.belief_cache.get(self)
+        if info_set is None:
+            info_set = self.parent.info_set.__copy__()
+            self.update_belief(info_set)
+            self.belief_cache.put(self, info_set)
+        return info_set
+
+    @info_set.setter
+    def info_set(self, info_set: InformationSet):
+        self.belief = info_set
+        # the beliefs below this node were derived from the old one
+        self.belief_cache.clear()
+
+    def update_belief(self, info_set: InformationSet):
+        """
+        applies the observation on the incoming edge of this node to a copy of the parent's belief
+        """
+        pass
+
     def unexplored_children(self, game_state: Game, engine):
         return 1 if len(self.children) == 0 else 0
 
@@ -138,6 +270,49 @@ class Node:
     def expand(self, game_state: Game, engine_spec: EngineSpec):
         raise NotImplementedError
 
+    def new_child(self, node_type, *args, **kwargs):
+        """
+        constructs a child node of the given type in the same tree backend as this node
+        :param node_type: one of SelfNode, PlayNode or OpponentNode
+        :return: the new node
+        """
+        return node_type(*args, **kwargs)
+
+    def prune(self, key):
+        """
+        drops every child except the one reached through key
+        """
+        self.children = {key: self.children[key]} if key in self.children else {}
+
+    def promote(self, info_set: InformationSet):
+        """
+        makes this node the root of its tree. the rest of the old tree becomes unreachable and is freed.
+        :param info_set: belief at the new root
+        :return: the new root
+        """
+        self.parent = None
+        self.belief = info_set.__copy__()
+        # cached beliefs were derived from the old root's belief
+        self.belief_cache.clear()
+        return self
+
+    @property
+    def lock(self):
+        return NODE_LOCKS[hash(self) % len(NODE_LOCKS)]
+
+    def backprop(self, reward, visits=1):
+        """
+        adds visits and the reward to this node and all of its ancestors
+        :param reward: simulation reward from the perspective of this tree's player
+        :param visits: number of visits to add, 0 when only settling a virtual loss
+        """
+        node = self
+        while node is not None:
+            with node.lock:
+                node.visit_count += visits
+                node.total_reward += reward
+            node = node.parent
+
     @property
     def first(self):
         return list(self.children.values())[0]
@@ -155,26 +330,26 @@ class Node:
 
 
 class OpponentNode(Node):
-    def __init__(self, info_set: InformationSet, player, incoming_edge=None, parent=None):
-        super().__init__(info_set, player, incoming_edge, parent)
+    def __init__(self, info_set: InformationSet, player, incoming_edge=None, parent=None, belief_cache=None):
+        super().__init__(info_set, player, incoming_edge, parent, belief_cache)
 
     @staticmethod
     def new(parent: Node, edge, engine: EngineSpec):
-        req_move, move, captured_square = edge
-        captured_piece = captured_square is not None
-
-        new_node = OpponentNode(parent.info_set, parent.player, edge, parent)
-        if move is not None:
-            # TODO; make sure this is correct
-            new_node.info_set.update_with_move((move, captured_piece))
+        new_node = parent.new_child(OpponentNode, None, parent.player, edge, parent)
         # num_samples = 1
         # samples = [new_node.info_set.random_sample().truth_board for i in range(num_samples)]
         # avg_score = np.sum(engine.sim_engine.score_boards(samples)) / num_samples / 100
         new_node.total_reward = 0
-        new_node.info_set.propagate_opponent_move([], captured_square,
-                                                  captured_piece)
         return new_node
 
+    def update_belief(self, info_set: InformationSet):
+        req_move, move, captured_square = self.incoming_edge
+        captured_piece = captured_square is not None
+        if move is not None:
+            # TODO; make sure this is correct
+            info_set.update_with_move((move, captured_piece))
+        info_set.propagate_opponent_move([], captured_piece, captured_square)
+
     def unexplored_children(self, game_state: Game, engine):
         if len(self.children) == 0:
             return ['_pass']
@@ -190,26 +365,60 @@ class OpponentNode(Node):
 
 
 class SelfNode(Node):
+    sense_memo: Tuple
+
+    def __init__(self, info_set: InformationSet, player, incoming_edge=None, parent=None, belief_cache=None):
+        super().__init__(info_set, player, incoming_edge, parent, belief_cache)
+        # (sense engine, belief cache generation, sense location) of the last sense choice
+        self.sense_memo = None
+
     @staticmethod
     def new(parent: OpponentNode, incoming_edge=None):
-        return SelfNode(parent.info_set, parent.player, incoming_edge, parent)
+        return parent.new_child(SelfNode, None, parent.player, incoming_edge, parent)
+
+    @property
+    def info_set(self) -> InformationSet:
+        # the opponent's move result is already part of the parent's belief, so self nodes share it instead of copying
+        if self.belief is not None:
+            return self.belief
+        return self.parent.info_set
+
+    @info_set.setter
+    def info_set(self, info_set: InformationSet):
+        self.belief = info_set
+        # the beliefs below this node were derived from the old one
+        self.belief_cache.clear()
+
+    def choose_sense(self, engine: SenseEngine):
+        """
+        runs engine.choose_sense on this node's belief once. the belief only changes when it or an ancestor's belief is
+        explicitly replaced, which clears the belief cache and with it the memoized choice
+        """
+        if not engine.deterministic:
+            return engine.choose_sense(self.info_set)
+        generation = self.belief_cache.generation
+        memo = self.sense_memo
+        if memo is None or memo[0] is not engine or memo[1] != generation:
+            memo = (engine, generation, engine.choose_sense(self.info_set))
+            self.sense_memo = memo
+        return memo[2]
 
     def select_child(self, game_state: Game, engine: SenseEngine, T):
-        sense_location = engine.choose_sense(self.info_set)
+        sense_location = self.choose_sense(engine)
         return sense_location
 
     def unexplored_children(self, game_state: Game, engine: SenseEngine):
-        sense_location = engine.choose_sense(self.info_set)
+        sense_location = self.choose_sense(engine)
         if self.player == chess.BLACK:
-            sense_result = game_state.handle_sense(mirror(sense_location))
+            sense_result = game_state.sense(mirror(sense_location))
         else:
-            sense_result = game_state.handle_sense(sense_location)
+            sense_result = game_state.sense(sense_location)
 
         # if self.player == chess.BLACK:
         #   sense_location = mirror(sense_location)
-        #  sense_result = mirror_sense_result(sense_result)
+        #  sense_result = sense_result.mirror()
 
-        edge = (sense_location, tuple(sense_result))
+        edge = (sense_location, sense_result)
 
         if edge not in self.children:
             self.children[edge] = PlayNode.new(self, sense_location, sense_result)
@@ -225,32 +434,60 @@ class SelfNode(Node):
         :return:
         """
         if self.player == chess.BLACK:
-            sense_result = game_state.handle_sense(mirror(sense_location))
+            sense_result = game_state.sense(mirror(sense_location))
             # game state gives us sense result in terms of player, so flip it
-            sense_result = mirror_sense_result(sense_result)
+            sense_result = sense_result.mirror()
         else:
-            sense_result = game_state.handle_sense(sense_location)
+            sense_result = game_state.sense(sense_location)
 
-        edge = (sense_location, tuple(sense_result))
+        edge = (sense_location, sense_result)
         if edge not in self.children:
             self.children[edge] = PlayNode.new(self, sense_location, sense_result)
         return self.children[edge]
 
 
 class PlayNode(Node):
+    candidates: dict
+
+    def __init__(self, info_set: InformationSet, player, incoming_edge=None, parent=None, belief_cache=None):
+        super().__init__(info_set, player, incoming_edge, parent, belief_cache)
+        # ids of the moves found while expanding, their children are only created once select_child picks them. each
+        # id maps to the number of times the child keyed by that move was available before it was created.
+        self.candidates = {}
+
     @staticmethod
     def new(parent: SelfNode, sense_location, sense_result):
-        new_node = PlayNode(parent.info_set, parent.player, incoming_edge=sense_location, parent=parent)
-        new_node.info_set.update_with_sense(sense_result)
-        return new_node
+        """
+        :param sense_result: SenseObservation, or a sense result as Game.handle_sense gives it
+        """
+        sense_result = SenseObservation.from_result(sense_location, sense_result)
+        return parent.new_child(PlayNode, None, parent.player, incoming_edge=(sense_location, sense_result),
+                                parent=parent)
 
-    def expand(self, game_state: Game, engine_spec: EngineSpec):
+    def update_belief(self, info_set: InformationSet):
+        sense_location, sense_result = self.incoming_edge
+        info_set.update_with_sense(sense_result)
+
+    def is_expanded(self):
+        return len(self.children) > 0 or len(self.candidates) > 0
+
+    def expand(self, game_state: SimGame, engine_spec: EngineSpec, lazy=True):
+        """
+        :param lazy: only record the candidate moves instead of playing out every move and creating its child
+        """
         moves = game_state.get_moves()
+        if lazy:
+            if self.player == chess.BLACK:
+                moves = [flip_move(move) for move in moves]
+            for move in moves:
+                self.candidates.setdefault(move_to_id(move), 0)
+            return
+
         for move in moves:
             # game state expects non-mirrored moves
-            move_result = game_state.handle_move(move)
+            move_result = game_state.push(move)
+            game_state.pop()
             if move_result[1] is None:  # illegal move happened, like moving pawn to the left/right and nothing there
-                game_state.truth_board.pop()
                 continue
             edge = move_result[0:3]
             if self.player == chess.BLACK:
@@ -258,9 +495,11 @@ class PlayNode(Node):
             key = edge[1]
             if key not in self.children:
                 self.children[key] = OpponentNode.new(self, edge, engine_spec)
-            game_state.truth_board.pop()
 
-    def select_child(self, game_state: Game, engine: UCBEngine, T):
+    def select_child(self, game_state: Game, engine: UCBEngine, T, widening: ProgressiveWidening = None):
+        """
+        :param widening: when given, only the moves admitted by progressive widening are considered
+        """
         available_moves = game_state.get_moves()
 
         if self.player == chess.BLACK:
@@ -268,16 +507,40 @@ class PlayNode(Node):
                 available_moves[i] = flip_move(move)
         if len(available_moves) == 1:
             return available_moves[0]
-        moves = []
+        # children are keyed by the move actually taken, as traverse and expand create them. moves revised to the
+        # same move lead to the same child, so only the first of them is considered.
+        keys, taken_keys = {}, set()
+        pseudo_legal_moves = game_state._pseudo_legal_moves()
         for move in available_moves:
-            if move in self.children:
-                self.children[move].availability_count += 1
-                moves.append(move)
+            requested_move = flip_move(move) if self.player == chess.BLACK else move
+            taken_move = game_state.revised_move(requested_move, pseudo_legal_moves)
+            if taken_move is None:
+                # like expand, skip moves that turn into a pass in this determinization
+                continue
+            key = flip_move(taken_move) if self.player == chess.BLACK else taken_move
+            if key not in taken_keys and (key in self.children or move_to_id(move) in self.candidates):
+                keys[move] = key
+                taken_keys.add(key)
+        moves = list(keys)
+
+        if widening is not None:
+            requested_moves = [flip_move(move) for move in moves] if self.player == chess.BLACK else moves
+            move_visits = [self.children[keys[move]].visit_count if keys[move] in self.children else 0
+                           for move in moves]
+            moves = widening.admit(self.info_set, game_state, moves, requested_moves, self.visit_count, move_visits)
+        # shuffled after widening, which has to admit the same moves every time
+        random.shuffle(moves)
 
         children = []
-        random.shuffle(moves)
         for move in moves:
-            children.append(self.children[move])
+            key = keys[move]
+            if key in self.children:
+                self.children[key].availability_count += 1
+                children.append(self.children[key])
+            else:
+                key_id = move_to_id(key)
+                self.candidates[key_id] = self.candidates.get(key_id, 0) + 1
+                children.append(UnexpandedChild((move, key, None), 0, 0, self.candidates[key_id]))
         ucbs = sorted(zip(engine.ucb(self.info_set, children, T), moves), key=lambda item: item[0], reverse=True)
         if len(ucbs) == 0:
             return None
@@ -296,6 +559,8 @@ class PlayNode(Node):
         key = edge[1]
         if key not in self.children:
             self.children[key] = OpponentNode.new(self, edge, engine)
+            # a lazily expanded child keeps the availability it gathered before it was created
+            self.children[key].availability_count = self.candidates.get(move_to_id(key), 0)
         return self.children[key]
 
 
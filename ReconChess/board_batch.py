@@ -0,0 +1,189 @@
+from typing import List
+
+import chess
+import numpy as np
+
+import geometry
+from util import SenseObservation
+
+# plane of each piece: white pawn to king, then black pawn to king. plane + 1 is the piece's SenseObservation code.
+NUM_PLANES = 12
+
+
+def plane(piece_type: chess.PieceType, color: chess.Color) -> int:
+    return piece_type - 1 + (0 if color == chess.WHITE else 6)
+
+
+def bitboards(masks) -> np.ndarray:
+    return np.array([int(mask) for mask in masks], dtype=np.uint64)
+
+
+SQUARE_BITS = bitboards(chess.BB_SQUARES)
+KNIGHT_ATTACKS = bitboards(chess.BB_KNIGHT_ATTACKS)
+KING_ATTACKS = bitboards(chess.BB_KING_ATTACKS)
+PAWN_ATTACKS = {color: bitboards(chess.BB_PAWN_ATTACKS[color]) for color in chess.COLORS}
+# RAY_MASKS[square, i] are the squares of geometry.RAYS[square][i]
+RAY_MASKS = np.array([[sum(chess.BB_SQUARES[s] for s in ray) for ray in rays] for rays in geometry.RAYS],
+                     dtype=np.uint64)
+# rays running towards higher squares meet their first piece at the lowest set bit, the others at the highest
+RISING = [8 * rank_step + file_step > 0 for file_step, rank_step in geometry.DIRECTIONS]
+
+
+def lowest_bit(x: np.ndarray) -> np.ndarray:
+    return x & (np.uint64(0) - x)
+
+
+def highest_bit(x: np.ndarray) -> np.ndarray:
+    for shift in (1, 2, 4, 8, 16, 32):
+        x = x | (x >> np.uint64(shift))
+    return x ^ (x >> np.uint64(1))
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """
+    :return: number of set bits of every entry of a uint64 array
+    """
+    return np.unpackbits(np.ascontiguousarray(x).view(np.uint8).reshape(x.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+class BoardBatch:
+    """
+    n positions as (n, 12) piece bitboards with the side to move and castling rights of each, for working on whole
+    batches of boards at once instead of one chess.Board after the other
+    """
+
+    def __init__(self, pieces: np.ndarray, turn: np.ndarray = None, castling_rights: np.ndarray = None):
+        """
+        :param pieces: (n, 12) uint64 bitboards, see plane
+        :param turn: (n,) side to move, white by default
+        :param castling_rights: (n,) uint64 castling rights like chess.Board keeps them, the corners by default
+        """
+        self.pieces = pieces
+        n = len(pieces)
+        self.turn = np.full(n, chess.WHITE) if turn is None else turn
+        self.castling_rights = np.full(n, chess.BB_CORNERS, dtype=np.uint64) if castling_rights is None \
+            else castling_rights
+
+    @staticmethod
+    def from_boards(boards: List[chess.Board]) -> 'BoardBatch':
+        pieces = np.array([[board.pieces_mask(piece_type, color) for color in (chess.WHITE, chess.BLACK)
+                            for piece_type in chess.PIECE_TYPES] for board in boards], dtype=np.uint64)
+        return BoardBatch(pieces.reshape(len(boards), NUM_PLANES), np.array([board.turn for board in boards]),
+                          np.array([board.castling_rights for board in boards], dtype=np.uint64))
+
+    @staticmethod
+    def from_squares(squares: np.ndarray, piece_types: List[str]) -> 'BoardBatch':
+        """
+        :param squares: (n, len(piece_types)) squares of each piece, -1 for pieces off the board, as
+                        PiecewiseGrid.gen_boards draws them
+        :param piece_types: symbol of every piece
+        """
+        pieces = np.zeros((len(squares), NUM_PLANES), dtype=np.uint64)
+        on_board = squares >= 0
+        bits = np.where(on_board, SQUARE_BITS[np.where(on_board, squares, 0)], np.uint64(0))
+        for i, symbol in enumerate(piece_types):
+            piece = chess.Piece.from_symbol(symbol)
+            pieces[:, plane(piece.piece_type, piece.color)] |= bits[:, i]
+        return BoardBatch(pieces)
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def __getitem__(self, index) -> 'BoardBatch':
+        return BoardBatch(self.pieces[index], self.turn[index], self.castling_rights[index])
+
+    def board(self, i: int) -> chess.Board:
+        board = chess.Board.empty()
+        planes = [int(bb) for bb in self.pieces[i]]
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = \
+            [planes[j] | planes[j + 6] for j in range(6)]
+        board.occupied_co[chess.WHITE] = planes[0] | planes[1] | planes[2] | planes[3] | planes[4] | planes[5]
+        board.occupied_co[chess.BLACK] = planes[6] | planes[7] | planes[8] | planes[9] | planes[10] | planes[11]
+        board.occupied = board.occupied_co[chess.WHITE] | board.occupied_co[chess.BLACK]
+        board.turn = bool(self.turn[i])
+        board.castling_rights = int(self.castling_rights[i])
+        return board
+
+    def to_boards(self) -> List[chess.Board]:
+        return [self.board(i) for i in range(len(self))]
+
+    def occupied(self, color: chess.Color = None) -> np.ndarray:
+        """
+        :return: (n,) bitboards of the squares color's pieces are on, of all pieces without a color
+        """
+        planes = self.pieces if color is None else self.pieces[:, plane(chess.PAWN, color):plane(chess.KING, color) + 1]
+        return np.bitwise_or.reduce(planes, axis=1)
+
+    def kings(self, color: chess.Color) -> np.ndarray:
+        """
+        :return: (n,) square of color's king, -1 on boards without one
+        """
+        kings = self.pieces[:, plane(chess.KING, color)]
+        # a single bit converts to float exactly
+        return np.where(kings > 0, np.log2(np.maximum(kings, np.uint64(1)).astype(np.float64)), -1).astype(np.int64)
+
+    def attackers(self, color: chess.Color, squares: np.ndarray) -> np.ndarray:
+        """
+        :param squares: (n,) the square to look at on every board, boards with a negative square get no attackers
+        :return: (n,) bitboards of color's pieces attacking the square, like chess.Board.attackers
+        """
+        squares = np.asarray(squares)
+        valid = squares >= 0
+        squares = np.where(valid, squares, 0)
+        occupied = self.occupied()
+        pieces = self.pieces
+
+        def of(piece_type):
+            return pieces[:, plane(piece_type, color)]
+
+        attackers = (KNIGHT_ATTACKS[squares] & of(chess.KNIGHT)) | (KING_ATTACKS[squares] & of(chess.KING)) | \
+                    (PAWN_ATTACKS[not color][squares] & of(chess.PAWN))
+        straight = of(chess.ROOK) | of(chess.QUEEN)
+        diagonal = of(chess.BISHOP) | of(chess.QUEEN)
+        for i, rising in enumerate(RISING):
+            blockers = RAY_MASKS[squares, i] & occupied
+            first = lowest_bit(blockers) if rising else highest_bit(blockers)
+            attackers |= first & (straight if i in geometry.STRAIGHT_DIRECTIONS else diagonal)
+        return np.where(valid, attackers, np.uint64(0))
+
+    def can_capture_king(self, color: chess.Color) -> np.ndarray:
+        """
+        :return: (n,) True where the other side has no king or color attacks it
+        """
+        kings = self.kings(not color)
+        return (kings < 0) | (self.attackers(color, kings) > 0)
+
+    def piece_counts(self) -> np.ndarray:
+        """
+        :return: (n, 12) number of pieces of every plane
+        """
+        return popcount(self.pieces)
+
+    def material(self, values=(1, 3, 3, 5, 9, 0)) -> np.ndarray:
+        """
+        :param values: worth of a pawn, knight, bishop, rook, queen and king
+        :return: (n,) material of white minus material of black
+        """
+        values = np.asarray(values)
+        return self.piece_counts() @ np.concatenate([values, -values])
+
+    def codes(self) -> np.ndarray:
+        """
+        :return: (n, 64) SenseObservation piece code of every square
+        """
+        bits = np.unpackbits(self.pieces.view(np.uint8).reshape(len(self), NUM_PLANES, 8), axis=2,
+                             bitorder='little')
+        return np.einsum('npq,p->nq', bits, np.arange(1, NUM_PLANES + 1, dtype=np.uint8)).astype(np.uint8)
+
+    def sense(self, square: chess.Square) -> np.ndarray:
+        """
+        :return: (n, len(geometry.SENSE_WINDOWS[square])) piece codes of the window around square on every board
+        """
+        return self.codes()[:, list(geometry.SENSE_WINDOWS[square])]
+
+    def observations(self, square: chess.Square) -> List[SenseObservation]:
+        """
+        :return: what a sense on square sees on every board
+        """
+        prefix = bytes([square])
+        return [SenseObservation(prefix + row.tobytes()) for row in self.sense(square)]
@@ -16,18 +16,24 @@ from player import Player
 import chess
 
 from engines import ISMCTSPolicyEngine, PiecewiseSenseEngine, StockFishBasicEvaluationEngine, PiecewiseInformationSet, \
-    ExpUCB, StockFishEvaluationEngine, PolicyNetworkUCB, StaticSenseEngine
+    ExpUCB, StockFishEvaluationEngine, PolicyNetworkUCB, StaticSenseEngine, CachedSimulationEngine
 from game import Game
 import base as base
 from eval_engine_network import feature_output_to_move
+from time_manager import TimeManager
 from util import flip_move, mirror, mirror_sense_result
 
 
 class CrapAgent(Player):
 
-    def __init__(self):
+    def __init__(self, use_clock=False):
+        """
+        :param use_clock: search every move for a share of the game clock, see TimeManager. by default every move is
+                          searched for self.iters iterations
+        """
         super().__init__()
         self.iters = 100
+        self.use_clock = use_clock
 
     def handle_game_start(self, color, board):
         """
@@ -37,9 +43,10 @@ class CrapAgent(Player):
         :param board: chess.Board -- initial board state
         """
         sense_engine = PiecewiseSenseEngine()
-        sim_engine = StockFishEvaluationEngine(depth=1)
+        sim_engine = CachedSimulationEngine(StockFishEvaluationEngine(depth=1))
         ucb_engine = ExpUCB()
         self.engine_spec = base.EngineSpec(sense_engine, sim_engine, ucb_engine)
+        self.time_manager = TimeManager() if self.use_clock else None
         self.policy_engine = ISMCTSPolicyEngine(self.engine_spec, num_iters=self.iters)
         if color == chess.BLACK:
             board: chess.Board
@@ -128,7 +135,8 @@ class CrapAgent(Player):
                 attacker_square = enemy_king_attackers.pop()
                 return chess.Move(attacker_square, enemy_king_square)
 
-        policy = self.policy_engine.generate_policy(self.info_set)
+        time_budget = None if self.time_manager is None else self.time_manager.allocate(seconds_left)
+        policy = self.policy_engine.generate_policy(self.info_set, time_budget)
         move = feature_output_to_move(policy)
         if self.color == chess.WHITE:
             pass
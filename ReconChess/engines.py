@@ -1,15 +1,20 @@
 from eval_engine_random import *
+from eval_engine_cache import *
 from eval_engine_stockfish import *
 from eval_engine_stockfish_nn import *
 
 from policy_engine_ismcts import *
+from policy_engine_ismcts_parallel import *
 
 from sense_engine_random import *
 from info_set_piecewise import *
+from info_set_particle import *
 from sense_engine_piecewise import *
 
 from eval_engine_network import *
 from ucb_engine_nn import *
 from ucb_engine_exp import *
 from sense_engine_static import *
+from prior_engine_heuristic import *
+from prior_engine_network import *
 from eval_engine_stockfish_bnn import *
\ No newline at end of file
@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+from typing import List
+
+import chess
+import chess.polyglot
+import numpy as np
+
+import base as base
+
+
+def board_key(board: chess.Board):
+    return chess.polyglot.zobrist_hash(board), board.turn
+
+
+class LRUScoreTable:
+    """
+    score table that evicts the least recently used board
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        score = self.entries.get(key)
+        if score is not None:
+            self.entries.move_to_end(key)
+        return score
+
+    def put(self, key, score):
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ClockScoreTable:
+    """
+    score table with clock (second chance) eviction. lookups only set a reference bit instead of reordering entries,
+    which keeps hits cheap.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = {}
+        self.keys = [None] * capacity
+        self.scores = np.zeros(capacity)
+        self.referenced = np.zeros(capacity, dtype=np.bool_)
+        self.hand = 0
+
+    def get(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        self.referenced[slot] = True
+        return self.scores[slot]
+
+    def put(self, key, score):
+        slot = self.slots.get(key)
+        if slot is None:
+            # advance the hand past referenced slots, clearing their bits
+            while self.referenced[self.hand]:
+                self.referenced[self.hand] = False
+                self.hand = (self.hand + 1) % self.capacity
+            slot = self.hand
+            self.hand = (self.hand + 1) % self.capacity
+            if self.keys[slot] is not None:
+                del self.slots[self.keys[slot]]
+            self.keys[slot] = key
+            self.slots[key] = slot
+        else:
+            # new entries only earn their second chance once they are used again
+            self.referenced[slot] = True
+        self.scores[slot] = score
+
+    def __len__(self):
+        return len(self.slots)
+
+
+SCORE_TABLES = {'lru': LRUScoreTable, 'clock': ClockScoreTable}
+
+
+class CachedSimulationEngine(base.SimulationEngine):
+    """
+    transposition cache in front of a simulation engine. boards are keyed by their zobrist hash and side to move, so
+    identical determinizations are only scored once, across iterations, turns and both players of a search.
+    """
+
+    def __init__(self, sim_engine: base.SimulationEngine, capacity=65536, eviction='lru'):
+        """
+        :param sim_engine: engine that scores the boards missing from the cache
+        :param capacity: maximum number of cached scores
+        :param eviction: 'lru' or 'clock'
+        """
+        if eviction not in SCORE_TABLES:
+            raise ValueError(f'unknown eviction policy {eviction}')
+        self.sim_engine = sim_engine
+        self.capacity = capacity
+        self.eviction = eviction
+        self.table = SCORE_TABLES[eviction](capacity)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def score_boards(self, boards: List[chess.Board]) -> np.ndarray:
+        scores = np.zeros(len(boards))
+        keys = [board_key(board) for board in boards]
+
+        # boards missing from the cache, each distinct board is scored once
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                score = self.table.get(key)
+                if score is not None:
+                    scores[i] = score
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if len(missing) > 0:
+            missing_scores = self.sim_engine.score_boards([boards[indices[0]] for indices in missing.values()])
+            with self.lock:
+                for (key, indices), score in zip(missing.items(), missing_scores):
+                    score = float(score)
+                    self.table.put(key, score)
+                    scores[indices] = score
+        return scores
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.table = SCORE_TABLES[self.eviction](self.capacity)
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getattr__(self, name):
+        # forward everything else (best_moves, close, ...) to the wrapped engine
+        if name == 'sim_engine':
+            raise AttributeError(name)
+        return getattr(self.sim_engine, name)
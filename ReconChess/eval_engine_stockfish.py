@@ -4,6 +4,7 @@ import chess.engine
 import numpy as np
 from typing import List
 import util
+from board_batch import BoardBatch
 
 STOCKFISH_PATH = '/usr/local/Cellar/stockfish/14.1/bin/stockfish'
 EVAL_TIME_LIMIT = 0.05
@@ -20,27 +21,17 @@ class StockFishEvaluationEngine(base.SimulationEngine):
     def restart_engine(self):
         self.engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH, setpgrp=True)
 
-    def check_king_under_attack(self, board, color):
-        enemy_king_square = board.king(not color)
-        if enemy_king_square is not None:
-            # if there are any ally pieces that can take king, execute one of those moves
-            enemy_king_attackers = board.attackers(color, enemy_king_square)
-            if enemy_king_attackers:
-                return 10000 if color == self.color else -10000
-        else:
-            return 10000 if color == self.color else -10000
-
     def score_boards(self, boards: List[chess.Board]) -> np.ndarray:
         arr = []
-        for board in boards:
-            opp_king = self.check_king_under_attack(board, self.color)
-            self_king = self.check_king_under_attack(board, not self.color)
-
-            if self_king is not None:
-                arr.append(self_king)
+        batch = BoardBatch.from_boards(boards)
+        # boards where the enemy can take our king are lost, those where we can take theirs are won
+        lost, won = batch.can_capture_king(not self.color), batch.can_capture_king(self.color)
+        for i, board in enumerate(boards):
+            if lost[i]:
+                arr.append(-10000)
                 continue
-            if opp_king is not None:
-                arr.append(opp_king)
+            if won[i]:
+                arr.append(10000)
                 continue
 
             score = 0
@@ -4,6 +4,7 @@ import chess.engine
 import numpy as np
 from typing import List
 import util
+from board_batch import BoardBatch
 import torch
 import stockfish_nn_train
 
@@ -19,33 +20,27 @@ class StockFishBasicEvaluationEngine(base.SimulationEngine):
         self.depth = depth
         self.color = color
 
-    def check_king_under_attack(self, board, color):
-        enemy_king_square = board.king(not color)
-        if enemy_king_square is not None:
-            # if there are any ally pieces that can take king, execute one of those moves
-            enemy_king_attackers = board.attackers(color, enemy_king_square)
-            if enemy_king_attackers:
-                return 10000 if color == self.color else -10000
-            else:
-                return None
-        else:
-            return 10000 if color == self.color else -10000
-
     def score_boards(self, boards: List[chess.Board]) -> np.ndarray:
-        scores = []
-        for board in boards:
-            self_king = self.check_king_under_attack(board, self.color)
-            opp_king = self.check_king_under_attack(board, not self.color)
-            if self_king:
-                scores.append(self_king)
-                continue
-            if opp_king:
-                scores.append(opp_king)
+        scores = np.zeros(len(boards))
+        vecs = []
+        net_indices = []
+        batch = BoardBatch.from_boards(boards)
+        # boards where we can take the enemy's king are won, those where the enemy can take ours are lost
+        won, lost = batch.can_capture_king(self.color), batch.can_capture_king(not self.color)
+        scores[lost] = -10000
+        scores[won] = 10000
+        for i, board in enumerate(boards):
+            if won[i] or lost[i]:
                 continue
 
-            vec = stockfish_nn_train.fen_to_bit_vector(board.fen())
-            scores.append(self.model(vec).detach().numpy()[0])
-        return np.array(scores)
+            vecs.append(stockfish_nn_train.fen_to_bit_vector(board.fen()))
+            net_indices.append(i)
+
+        # run every remaining board through the network in a single batch
+        if len(vecs) > 0:
+            with torch.no_grad():
+                scores[net_indices] = self.model(np.stack(vecs)).numpy()[:, 0]
+        return scores
 
     def best_moves(self, boards: List[chess.Board], color=chess.WHITE) -> List[chess.Move]:
         moves = []
@@ -4,6 +4,7 @@ import numpy as np
 import torch
 from collections import namedtuple
 from typing import List
+from board_batch import BoardBatch
 
 FeatureSet = namedtuple('FeatureSet',
                         ['num_sq', 'num_pt', 'num_planes', 'inputs', 'max_active_features', 'king_buckets'])
@@ -37,76 +38,48 @@ class SparseBatch:
         self.feature_set = feature_set
         self.encode_board(boards)
 
-    def num_pieces(self, board: chess.Board, color):
-        num_pieces = 0
-        for piece in self.piece_types:
-            num_pieces += len(board.pieces(piece, color))
-        return num_pieces
-
-    def fill_board(self, board: chess.Board, i: int):
-        self.is_white[i] = board.turn
-        self.psqt_indices[i] = ((self.num_pieces(board, chess.WHITE) + self.num_pieces(board, chess.BLACK)) - 1) / 4
-        self.layer_stack_indices[i] = self.psqt_indices[i]
-        self.fill_features(board, i)
-
-    def fill_features(self, board: chess.Board, i: int):
-        self.num_active_black_features += self.fill_features_sparse(board, i, self.black, self.black_values,
-                                                                    chess.BLACK)
-        self.num_active_white_features += self.fill_features_sparse(board, i, self.white, self.white_values,
-                                                                    chess.WHITE)
-
-    def fill_features_sparse(self, board: chess.Board, i: int, features: np.ndarray, values: np.ndarray, color):
-        ksq = board.king(color)
-        j = 0
-        for sq in chess.SQUARES:
-            piece = board.piece_at(sq)
-            if piece is None:
-                continue
-            values[i, j] = 1.0
-            features[i, j] = self.feature_index(color, ksq, sq, piece)
-            j += 1
-        return j
-
-    def flip_vertical(self, sq: chess.Square):
-        file, rank = chess.square_file(sq), chess.square_rank(sq)
-        return chess.square(file, 7 - rank)
-
-    def flip_horizontal(self, sq: chess.Square):
-        file, rank = chess.square_file(sq), chess.square_rank(sq)
-        return chess.square(7 - file, rank)
-
-    def orient_flip_2(self, color, sq: chess.Square, ksq: chess.Square):
-        h = chess.square_file(ksq) < chess.square_file(chess.E1)
+    def fill_features(self, batch: BoardBatch, codes: np.ndarray, order: np.ndarray, active: np.ndarray, color):
+        """
+        :param codes: (n, 64) piece codes of batch
+        :param order: (n, max_active_features) squares of every board, the occupied ones first in ascending order
+        :param active: (n, max_active_features) marks the entries of order that are occupied
+        """
+        kings = batch.kings(color)
+        if np.any(kings < 0):
+            raise ValueError('every board needs both kings to be encoded')
+        squares = self.orient(color, order, kings[:, None])
+        pieces = codes[np.arange(self.size)[:, None], order].astype(np.int64) - 1
+        piece_types, piece_colors = pieces % 6 + 1, pieces < 6
+        p_idx = np.minimum((piece_types - 1) * 2 + (piece_colors != color), 10)
+        buckets = np.array(self.feature_set.king_buckets)[self.orient(color, kings, kings)]
+        features = squares + p_idx * self.feature_set.num_sq + buckets[:, None] * self.feature_set.num_planes
+        return np.where(active, features, -1), np.where(active, 1.0, 0.0)
+
+    @staticmethod
+    def orient(color, squares: np.ndarray, kings: np.ndarray) -> np.ndarray:
+        """
+        mirrors squares to color's side of the board and to the half its king is on
+        """
         if color == chess.BLACK:
-            sq = self.flip_vertical(sq)
-        if h:
-            sq = self.flip_horizontal(sq)
-        return sq
-
-    def feature_index(self, color, ksq: chess.Square, sq, p: chess.Piece):
-        o_ksq = self.orient_flip_2(color, ksq, ksq)
-        p_idx = (p.piece_type - 1) * 2 + (p.color != color)
-        if p_idx == 11:
-            p_idx -= 1
-        return self.orient_flip_2(color, sq, ksq) + p_idx * self.feature_set.num_sq + self.feature_set.king_buckets[
-            o_ksq] * self.feature_set.num_planes
+            squares = squares ^ 56
+        return np.where(kings % 8 < chess.square_file(chess.E1), squares ^ 7, squares)
 
     def encode_board(self, boards: List[chess.Board]):
         self.num_inputs = self.feature_set.inputs
         self.size = len(boards)
-        self.is_white = np.zeros((self.size, 1))
-        self.white = np.tile(-1, (self.size, self.feature_set.max_active_features))
-        self.black = np.tile(-1, (self.size, self.feature_set.max_active_features))
-        self.white_values = np.tile(0.0, (self.size, self.feature_set.max_active_features))
-        self.black_values = np.tile(0.0, (self.size, self.feature_set.max_active_features))
-        self.psqt_indices = np.zeros(self.size)
-        self.layer_stack_indices = np.zeros(self.size)
-
-        self.num_active_white_features = 0
-        self.num_active_black_features = 0
-
-        for i, board in enumerate(boards):
-            self.fill_board(board, i)
+        batch = BoardBatch.from_boards(boards)
+        codes = batch.codes()
+        occupied = codes > 0
+        num_pieces = occupied.sum(axis=1)
+        self.is_white = batch.turn.astype(np.float64)[:, None]
+        self.psqt_indices = (num_pieces - 1) / 4
+        self.layer_stack_indices = self.psqt_indices.copy()
+
+        order = np.argsort(~occupied, axis=1, kind='stable')[:, :self.feature_set.max_active_features]
+        active = np.arange(self.feature_set.max_active_features)[None, :] < num_pieces[:, None]
+        self.black, self.black_values = self.fill_features(batch, codes, order, active, chess.BLACK)
+        self.white, self.white_values = self.fill_features(batch, codes, order, active, chess.WHITE)
+        self.num_active_white_features = self.num_active_black_features = int(active.sum())
 
     def get_tensors(self):
         device = torch.device('cpu')
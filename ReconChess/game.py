@@ -10,10 +10,56 @@ Source:         Adapted from recon-chess (https://pypi.org/project/reconchess/)
 """
 
 import chess
+import math
 from datetime import datetime
 
+import geometry
+from util import SenseObservation
+
+
+def position_key(board: chess.Board):
+    """
+    everything move generation depends on, read straight off the bitboards. it is exact and much cheaper to build
+    than a zobrist hash.
+    """
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.castling_rights, board.ep_square, board.turn)
+
+
+class MoveCache:
+    """
+    moves of the positions seen lately, keyed by position_key and the side to generate for. the cache is emptied
+    all at once when it is full, which keeps lookups to a single dict access.
+    """
+
+    def __init__(self, capacity=4096):
+        """
+        :param capacity: number of positions kept, see Game.set_move_cache_capacity
+        """
+        self.capacity = capacity
+        self.entries = {}
+
+    def get(self, key, generate):
+        """
+        :param generate: function computing the moves of key when they aren't cached
+        """
+        moves = self.entries.get(key)
+        if moves is None:
+            if len(self.entries) >= self.capacity:
+                self.entries.clear()
+            moves = self.entries[key] = generate()
+        return moves
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        if len(self.entries) > capacity:
+            self.entries.clear()
+
 
 class Game:
+    # shared by all games, positions repeat a lot across the determinizations of a search
+    rbc_moves = MoveCache()
+    pseudo_legal_moves = MoveCache()
 
     def __init__(self, seconds_left=600):
         self.turn = chess.WHITE  # True for white, False for black
@@ -69,10 +115,17 @@ class Game:
 
         :return: a chess.Board object
         """
-        b = board.copy()
-        for piece_type in chess.PIECE_TYPES:
-            for sq in b.pieces(piece_type, not turn):
-                b.remove_piece_at(sq)
+        b = board.copy(stack=False)
+        own = b.occupied_co[turn]
+        b.pawns &= own
+        b.knights &= own
+        b.bishops &= own
+        b.rooks &= own
+        b.queens &= own
+        b.kings &= own
+        b.promoted &= own
+        b.occupied_co[not turn] = chess.BB_EMPTY
+        b.occupied = own
         return b
 
     def _moves_without_opponent_pieces(self, board, turn):
@@ -81,9 +134,85 @@ class Game:
         :param board: chess.Board -- a chess board where you want opponnet's pieces to be removed
         :param turn: bool - True(WHITE's turn) or False(BLACK's turn), the opponnet is the 'not turn'
 
+        The moves are generated from the board's bitboards with the opponent's pieces masked out, without copying the
+        board, in the order chess.Board.generate_pseudo_legal_moves gives them on _without_opponent_pieces(board, turn).
+
+        :return: List(chess.Move)
+        """
+        if board.turn != turn:
+            # the side to move has no pieces left on the masked board
+            return []
+        own = board.occupied_co[turn]
+        moves = []
+
+        # piece moves, only our own pieces block sliders
+        for from_square in chess.scan_reversed(own & ~board.pawns):
+            bb_square = chess.BB_SQUARES[from_square]
+            if bb_square & board.knights:
+                attacks = chess.BB_KNIGHT_ATTACKS[from_square]
+            elif bb_square & board.kings:
+                attacks = chess.BB_KING_ATTACKS[from_square]
+            else:
+                attacks = 0
+                if bb_square & (board.bishops | board.queens):
+                    attacks = geometry.diagonal_attacks(from_square, own)
+                if bb_square & (board.rooks | board.queens):
+                    attacks |= geometry.straight_attacks(from_square, own)
+            for to_square in chess.scan_reversed(attacks & ~own):
+                moves.append(chess.Move(from_square, to_square))
+
+        moves += self._castling_moves_without_opponent_pieces(board, turn)
+
+        # pawn pushes, there is nothing for pawns to capture
+        pawns = board.pawns & own
+        if turn == chess.WHITE:
+            single_moves = pawns << 8 & ~own
+            double_moves = single_moves << 8 & ~own & (chess.BB_RANK_3 | chess.BB_RANK_4)
+        else:
+            single_moves = pawns >> 8 & ~own
+            double_moves = single_moves >> 8 & ~own & (chess.BB_RANK_6 | chess.BB_RANK_5)
+        for to_square in chess.scan_reversed(single_moves):
+            from_square = to_square + (8 if turn == chess.BLACK else -8)
+            if chess.square_rank(to_square) in [0, 7]:
+                for piece_type in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]:
+                    moves.append(chess.Move(from_square, to_square, piece_type))
+            else:
+                moves.append(chess.Move(from_square, to_square))
+        for to_square in chess.scan_reversed(double_moves):
+            moves.append(chess.Move(to_square + (16 if turn == chess.BLACK else -16), to_square))
+
+        # en passant
+        if board.ep_square and not chess.BB_SQUARES[board.ep_square] & own:
+            capturers = pawns & chess.BB_PAWN_ATTACKS[not turn][board.ep_square] & chess.BB_RANKS[4 if turn else 3]
+            for from_square in chess.scan_reversed(capturers):
+                moves.append(chess.Move(from_square, board.ep_square))
+        return moves
+
+    def _castling_moves_without_opponent_pieces(self, board, turn):
+        """
+        Castling moves with the opponent's pieces removed: nothing attacks the king, only our own pieces are in the way.
         :return: List(chess.Move)
         """
-        return list(self._without_opponent_pieces(board, turn).generate_pseudo_legal_moves())
+        own = board.occupied_co[turn]
+        backrank = chess.BB_RANK_1 if turn == chess.WHITE else chess.BB_RANK_8
+        king = own & board.kings & ~board.promoted & backrank
+        king &= -king
+        # like chess.Board.clean_castling_rights, the rights need our rook in its corner and our king on the e-file
+        rights = board.castling_rights & board.rooks & own & backrank & chess.BB_CORNERS
+        if not king or not own & board.kings & ~board.promoted & backrank & chess.BB_FILE_E:
+            return []
+
+        moves = []
+        king_square = chess.msb(king)
+        for rook_square in chess.scan_reversed(rights):
+            a_side = rook_square < king_square
+            king_to = chess.square(2 if a_side else 6, chess.square_rank(king_square))
+            rook_to = chess.square(3 if a_side else 5, chess.square_rank(king_square))
+            path = int(geometry.BETWEEN_MASKS[king_square, king_to]) | int(geometry.BETWEEN_MASKS[rook_square, rook_to])
+            blockers = own & ~chess.BB_SQUARES[king_square] & ~chess.BB_SQUARES[rook_square]
+            if not blockers & (path | chess.BB_SQUARES[king_to] | chess.BB_SQUARES[rook_to]):
+                moves.append(chess.Move(king_square, king_to))
+        return moves
 
     def _pawn_capture_moves_on(self, board, turn):
         """
@@ -94,19 +223,15 @@ class Game:
         :return: List(chess.Move)
         """
         pawn_capture_moves = []
+        own = board.occupied_co[turn]
 
-        no_opponents_board = self._without_opponent_pieces(board, turn)
-
-        for pawn_square in board.pieces(chess.PAWN, turn):
-            for attacked_square in board.attacks(pawn_square):
-                # skip this square if one of our own pieces are on the square
-                if no_opponents_board.piece_at(attacked_square):
-                    continue
-
+        for pawn_square in chess.scan_forward(board.pawns & own):
+            # skip the squares one of our own pieces is on
+            for attacked_square in chess.scan_forward(chess.BB_PAWN_ATTACKS[turn][pawn_square] & ~own):
                 pawn_capture_moves.append(chess.Move(pawn_square, attacked_square))
 
                 # add in promotion moves
-                if attacked_square in chess.SquareSet(chess.BB_BACKRANKS):
+                if chess.BB_SQUARES[attacked_square] & chess.BB_BACKRANKS:
                     for piece_type in chess.PIECE_TYPES[1:-1]:
                         pawn_capture_moves.append(chess.Move(pawn_square, attacked_square, promotion=piece_type))
 
@@ -120,8 +245,29 @@ class Game:
         if self.is_finished:
             return None
 
-        return self._moves_without_opponent_pieces(self.truth_board,self.turn) + \
-                self._pawn_capture_moves_on(self.truth_board, self.turn)
+        # callers may modify the list they get
+        return list(self._rbc_moves()[0])
+
+    def _rbc_moves(self):
+        """
+        :return: the cached moves get_moves returns as a tuple, and the same moves as a frozenset for lookups
+        """
+        board, turn = self.truth_board, self.turn
+
+        def generate():
+            moves = self._moves_without_opponent_pieces(board, turn) + self._pawn_capture_moves_on(board, turn)
+            return tuple(moves), frozenset(moves)
+
+        return Game.rbc_moves.get((position_key(board), turn), generate)
+
+    @staticmethod
+    def set_move_cache_capacity(capacity):
+        """
+        sets how many positions the move caches shared by all games keep. every position holds a few dozen moves,
+        so a search over many determinizations can trade memory for move generation here.
+        """
+        Game.rbc_moves.resize(capacity)
+        Game.pseudo_legal_moves.resize(capacity)
 
     ###=== Make move and update board ===###
     def _capture_square_of_move(self, board, move):
@@ -160,17 +306,16 @@ class Game:
 
         # illegal if any pieces are between king & rook
         rook_square = chess.square(7 if board.is_kingside_castling(move) else 0, chess.square_rank(move.from_square))
-        between_squares = chess.SquareSet(chess.between(move.from_square,rook_square))
-        if any(map(lambda s: board.piece_at(s), between_squares)):
+        if board.occupied & int(geometry.BETWEEN_MASKS[move.from_square, rook_square]):
             return True
 
         # its legal
         return False
 
-    def _slide_move(self, board, move):
-        psuedo_legal_moves = list(board.generate_pseudo_legal_moves())
-        squares = list(chess.SquareSet(chess.between(move.from_square,move.to_square))) + [move.to_square]
-        squares = sorted(squares, key=lambda s: chess.square_distance(s, move.from_square), reverse=True)
+    def _slide_move(self, board, move, pseudo_legal_moves=None):
+        psuedo_legal_moves = set(board.generate_pseudo_legal_moves()) if pseudo_legal_moves is None else pseudo_legal_moves
+        # furthest square first
+        squares = [move.to_square] + geometry.BETWEEN_SQUARES[move.from_square][move.to_square][::-1]
         for slide_square in squares:
             revised = chess.Move(move.from_square, slide_square, move.promotion)
             if revised in psuedo_legal_moves:
@@ -184,10 +329,20 @@ class Game:
             move = chess.Move(move.from_square, move.to_square, chess.QUEEN)
         return move
 
-    def _revise_move(self, move):
+    def _pseudo_legal_moves(self, pseudo_legal_moves=None):
+        """
+        :return: the given set, otherwise the cached set of pseudo legal moves of the truth board
+        """
+        if pseudo_legal_moves is not None:
+            return pseudo_legal_moves
+        board = self.truth_board
+        return Game.pseudo_legal_moves.get(position_key(board),
+                                           lambda: frozenset(board.generate_pseudo_legal_moves()))
+
+    def _revise_move(self, move, pseudo_legal_moves=None):
         # if its a legal move, don't change it at all. note that board.generate_psuedo_legal_moves() does not
         # include psuedo legal castles
-        if move in self.truth_board.generate_pseudo_legal_moves() or self._is_psuedo_legal_castle(self.truth_board, move):
+        if move in self._pseudo_legal_moves(pseudo_legal_moves) or self._is_psuedo_legal_castle(self.truth_board, move):
             return move
 
         # note: if there are pieces in the way, we DONT capture them
@@ -197,9 +352,32 @@ class Game:
         # if the piece is a sliding piece, slide it as far as it can go
         piece = self.truth_board.piece_at(move.from_square)
         if piece.piece_type in [chess.PAWN, chess.ROOK, chess.BISHOP, chess.QUEEN]:
-            move = self._slide_move(self.truth_board, move)
+            move = self._slide_move(self.truth_board, move, self._pseudo_legal_moves(pseudo_legal_moves))
 
-        return move if move in self.truth_board.generate_pseudo_legal_moves() else None
+        return move if move in self._pseudo_legal_moves(pseudo_legal_moves) else None
+
+    def revised_move(self, requested_move, pseudo_legal_moves=None):
+        """
+        Finds the move handle_move would take for the requested move without making it
+
+        :param requested_move: chess.Move -- a move from get_moves()
+        :param pseudo_legal_moves: set(chess.Move) -- pseudo legal moves of the truth board, saves generating them
+                                   again when revising many moves on the same board
+        :return: chess.Move -- the move that would be taken, None if the requested move would be a pass
+        """
+        return self._revise_move(self._add_pawn_queen_promotion(requested_move), pseudo_legal_moves)
+
+    def _resolve_move(self, requested_move):
+        """
+        :return: the move taken for the requested move (None for a pass), the square it captures on and the reason
+                 for a pass
+        """
+        if requested_move is None:
+            return None, None, "Ran out of time or None object passed in"
+        if requested_move not in self._rbc_moves()[1]:  #checks legality of move
+            return None, None, "{} is an illegal move made.".format(requested_move)
+        taken_move = self._revise_move(self._add_pawn_queen_promotion(requested_move))
+        return taken_move, self._capture_square_of_move(self.truth_board, taken_move), ""
 
     def handle_move(self, requested_move):
         """
@@ -218,19 +396,7 @@ class Game:
         if self.took_to_long_to_move:
             return None, None, None, ""
 
-        if requested_move is None:
-            taken_move = None   #pass move
-            captured_square = None #doesn't capture anything
-            reason = "Ran out of time or None object passed in"
-        elif requested_move not in self.get_moves():  #checks legality of move
-            taken_move = None   #pass move
-            captured_square = None #doesn't capture anything
-            reason = "{} is an illegal move made.".format(requested_move)
-        else:
-            move = self._add_pawn_queen_promotion(requested_move)
-            taken_move = self._revise_move(move)
-            captured_square = self._capture_square_of_move(self.truth_board, taken_move)
-            reason = ""
+        taken_move, captured_square, reason = self._resolve_move(requested_move)
 
         # push move to appropriate boards for updates #
         self.truth_board.push(taken_move if taken_move is not None else chess.Move.null())
@@ -258,16 +424,10 @@ class Game:
         :return: A list of tuples, where each tuple contains a :class:`Square` in the sense, and if there
                  was a piece on the square, then the corresponding :class:`chess.Piece`, otherwise `None`.
         """
-        if square not in list(chess.SQUARES):
+        if square not in geometry.SENSE_WINDOWS:
             return []
 
-        rank, file = chess.square_rank(square), chess.square_file(square)
-        sense_result = []
-        for delta_rank in [1, 0, -1]:
-            for delta_file in [-1, 0, 1]:
-                if 0 <= rank + delta_rank <= 7 and 0 <= file + delta_file <= 7:
-                    sense_square = chess.square(file + delta_file, rank + delta_rank)
-                    sense_result.append((sense_square, self.truth_board.piece_at(sense_square)))
+        sense_result = self.sense(square).pieces()
 
         #update sense result for each respective color board
         if self.turn == chess.WHITE:
@@ -279,6 +439,15 @@ class Game:
 
         return sense_result
 
+    def sense(self, square):
+        """
+        The sense of handle_sense without updating the player's board
+
+        :param square: chess.SQUARES -- the square to sense around
+        :return: SenseObservation -- the pieces in the 3x3 section, read off the truth board's bitboards
+        """
+        return SenseObservation.from_board(self.truth_board, square)
+
     ###=== Return captured square ===###
     def opponent_move_result(self):
         """
@@ -334,3 +503,56 @@ class Game:
             return chess.BLACK, "BLACK won by king capture."
         elif self.truth_board.king(chess.BLACK) is None:
             return chess.WHITE, "WHITE won by king capture."
+
+
+class SimGame(Game):
+    """
+    game for playing out determinizations during search. moves follow the rules of Game, but only the truth board
+    is kept: there are no side boards and no clocks, and every move can be taken back exactly with pop.
+    """
+
+    def __init__(self, board: chess.Board = None):
+        self.turn = chess.WHITE
+        self.truth_board = chess.Board() if board is None else board
+        self.is_finished = False
+        self.move_result = None
+        # move results the pushed moves replaced, for pop to restore
+        self.move_results = []
+
+    def push(self, requested_move):
+        """
+        makes the move handle_move would make
+        :return: the same as handle_move
+        """
+        taken_move, captured_square, reason = self._resolve_move(requested_move)
+        self.truth_board.push(taken_move if taken_move is not None else chess.Move.null())
+        self.move_results.append(self.move_result)
+        self.move_result = captured_square
+        return requested_move, taken_move, captured_square, reason
+
+    def pop(self):
+        """
+        takes back the last pushed move
+        """
+        self.truth_board.pop()
+        self.move_result = self.move_results.pop()
+
+    handle_move = push
+
+    def handle_sense(self, square):
+        if square not in geometry.SENSE_WINDOWS:
+            return []
+        return self.sense(square).pieces()
+
+    def get_seconds_left(self):
+        return math.inf
+
+    def is_over(self):
+        return self.truth_board.king(chess.WHITE) is None or self.truth_board.king(chess.BLACK) is None
+
+    def get_winner(self):
+        if self.truth_board.king(chess.WHITE) is None:
+            return chess.BLACK, "BLACK won by king capture."
+        if self.truth_board.king(chess.BLACK) is None:
+            return chess.WHITE, "WHITE won by king capture."
+        return None
@@ -0,0 +1,151 @@
+import chess
+import numpy as np
+
+
+def bitboard_to_mask(bitboard):
+    """
+    :param bitboard: python-chess style integer bitboard
+    :return: (64,) boolean mask indexed by square
+    """
+    return np.unpackbits(np.array([bitboard], dtype='<u8').view(np.uint8), bitorder='little').astype(np.bool_)
+
+
+def mask_to_bitboard(mask):
+    """
+    :param mask: (64,) boolean mask indexed by square
+    :return: python-chess style integer bitboard
+    """
+    return int(np.packbits(np.asarray(mask, dtype=np.bool_), bitorder='little').view('<u8')[0])
+
+
+def straight_attacks(square, occupied):
+    """
+    squares a rook on square attacks. every ray runs up to and including its first occupied square.
+    :param occupied: bitboard of occupied squares
+    :return: bitboard
+    """
+    return chess.BB_RANK_ATTACKS[square][occupied & chess.BB_RANK_MASKS[square]] | \
+        chess.BB_FILE_ATTACKS[square][occupied & chess.BB_FILE_MASKS[square]]
+
+
+def diagonal_attacks(square, occupied):
+    """
+    squares a bishop on square attacks, see straight_attacks
+    :return: bitboard
+    """
+    return chess.BB_DIAG_ATTACKS[square][occupied & chess.BB_DIAG_MASKS[square]]
+
+
+# (file, rank) steps of the sliding directions, straight ones first
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+STRAIGHT_DIRECTIONS, DIAGONAL_DIRECTIONS = range(4), range(4, 8)
+
+
+def ray(square, direction):
+    file, rank = chess.square_file(square) + direction[0], chess.square_rank(square) + direction[1]
+    squares = []
+    while 0 <= file < 8 and 0 <= rank < 8:
+        squares.append(chess.square(file, rank))
+        file, rank = file + direction[0], rank + direction[1]
+    return squares
+
+
+# RAYS[square][i] are the squares from square outwards in DIRECTIONS[i]
+RAYS = [[ray(square, direction) for direction in DIRECTIONS] for square in chess.SQUARES]
+
+
+def squares_between(a, b):
+    for squares in RAYS[a]:
+        if b in squares:
+            return squares[:squares.index(b)]
+    return []
+
+
+# BETWEEN_SQUARES[a][b] are the squares strictly between a and b going out from a, empty unless they share a line
+BETWEEN_SQUARES = [[squares_between(a, b) for b in chess.SQUARES] for a in chess.SQUARES]
+BETWEEN_MASKS = np.array([[sum(chess.BB_SQUARES[s] for s in BETWEEN_SQUARES[a][b]) for b in chess.SQUARES]
+                          for a in chess.SQUARES], dtype=np.uint64)
+
+KNIGHT_SQUARES = [list(chess.SquareSet(bb)) for bb in chess.BB_KNIGHT_ATTACKS]
+KNIGHT_MASKS = np.array([bitboard_to_mask(bb) for bb in chess.BB_KNIGHT_ATTACKS])
+KING_MASKS = np.array([bitboard_to_mask(bb) for bb in chess.BB_KING_ATTACKS])
+# PAWN_ATTACKER_MASKS[color][square] marks the squares from which a pawn of color attacks square
+PAWN_ATTACKER_MASKS = {color: np.array([bitboard_to_mask(bb) for bb in chess.BB_PAWN_ATTACKS[not color]])
+                       for color in chess.COLORS}
+
+# rows of attacker_masks
+STRAIGHT, DIAGONAL, KNIGHT, KING, PAWN = range(5)
+ATTACK_PATTERNS = {chess.ROOK: [STRAIGHT], chess.BISHOP: [DIAGONAL], chess.QUEEN: [STRAIGHT, DIAGONAL],
+                   chess.KNIGHT: [KNIGHT], chess.KING: [KING], chess.PAWN: [PAWN]}
+
+
+def attacker_masks(square, occupied, color):
+    """
+    squares from which a piece of color attacks square, for each way of attacking. sliding attacks stop at (and
+    include) the first occupied square.
+    :param occupied: bitboard of occupied squares
+    :return: (5, 64) boolean array with rows STRAIGHT, DIAGONAL, KNIGHT, KING and PAWN
+    """
+    return np.stack([bitboard_to_mask(straight_attacks(square, occupied)),
+                     bitboard_to_mask(diagonal_attacks(square, occupied)),
+                     KNIGHT_MASKS[square], KING_MASKS[square], PAWN_ATTACKER_MASKS[color][square]])
+
+
+def attack_patterns(piece_types):
+    """
+    :param piece_types: list of piece symbols
+    :return: (5, len(piece_types)) array marking which rows of attacker_masks each piece attacks with
+    """
+    patterns = np.zeros((5, len(piece_types)))
+    for i, symbol in enumerate(piece_types):
+        patterns[ATTACK_PATTERNS[chess.Piece.from_symbol(symbol).piece_type], i] = 1.0
+    return patterns
+
+
+def window_sums(grid):
+    """
+    sums of every 3x3 window of an (8, 8) grid, read through an integral image
+    :return: (8, 8) array, entry [rank, file] holding the sum of the window centered there. squares off the board
+             count as zero.
+    """
+    integral = np.zeros((11, 11))
+    integral[1:, 1:] = np.cumsum(np.cumsum(np.pad(grid, 1), axis=0), axis=1)
+    return integral[3:, 3:] - integral[:-3, 3:] - integral[3:, :-3] + integral[:-3, :-3]
+
+
+# SENSE_WINDOWS[square] are the squares a sense on square reveals, top rank first and from the a file on
+SENSE_WINDOWS = {square: tuple(chess.square(file, rank)
+                               for rank in range(chess.square_rank(square) + 1, chess.square_rank(square) - 2, -1)
+                               for file in range(chess.square_file(square) - 1, chess.square_file(square) + 2)
+                               if 0 <= rank < 8 and 0 <= file < 8)
+                 for square in chess.SQUARES}
+
+
+def knight_distances(allowed=None):
+    """
+    shortest knight routes between all pairs of squares
+    :param allowed: (64,) boolean mask of the squares the knight may land on, all of them by default. the square
+                    it starts from doesn't have to be allowed.
+    :return: (distances, next_hops), both (64, 64) indexed by [from, to]. distances counts the moves, next_hops is
+             the first square of a shortest route. both are -1 where there is no route.
+    """
+    allowed = np.ones(64, dtype=np.bool_) if allowed is None else np.asarray(allowed, dtype=np.bool_)
+    distances = np.full((64, 64), -1, dtype=np.int8)
+    np.fill_diagonal(distances, 0)
+    # frontier[a, b]: a is first reached from b in the current number of moves
+    frontier = np.diag(allowed)
+    reached = np.eye(64, dtype=np.bool_)
+    moves = 0
+    while np.any(frontier):
+        moves += 1
+        frontier = (KNIGHT_MASKS.astype(np.int32) @ (frontier & allowed[:, None]) > 0) & ~reached
+        distances[frontier] = moves
+        reached |= frontier
+
+    hops = KNIGHT_MASKS[:, :, None] & allowed[None, :, None] & \
+        (distances[None, :, :] == distances[:, None, :] - 1) & (distances[:, None, :] > 0)
+    next_hops = np.where(np.any(hops, axis=1), np.argmax(hops, axis=1), -1).astype(np.int8)
+    return distances, next_hops
+
+
+KNIGHT_DISTANCES, KNIGHT_NEXT_HOPS = knight_distances()
@@ -0,0 +1,314 @@
+import chess
+import numpy as np
+from typing import List, Tuple, Any
+
+import base as base
+from game import Game
+from info_set_piecewise import PiecewiseInformationSet
+from prob_board import PiecewiseGrid
+from util import sense_symbols
+
+
+def multinomial_resample(weights: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    return rng.choice(len(weights), n, p=weights)
+
+
+def stratified_resample(weights: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    positions = (rng.random(n) + np.arange(n)) / n
+    return np.minimum(np.searchsorted(np.cumsum(weights), positions, side='right'), len(weights) - 1)
+
+
+def systematic_resample(weights: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    positions = (rng.random() + np.arange(n)) / n
+    return np.minimum(np.searchsorted(np.cumsum(weights), positions, side='right'), len(weights) - 1)
+
+
+def residual_resample(weights: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    counts = np.floor(n * weights).astype(int)
+    indices = np.repeat(np.arange(len(weights)), counts)
+    if len(indices) < n:
+        residuals = n * weights - counts
+        indices = np.concatenate([indices, rng.choice(len(weights), n - len(indices),
+                                                      p=residuals / np.sum(residuals))])
+    return indices
+
+
+RESAMPLERS = {'multinomial': multinomial_resample, 'stratified': stratified_resample,
+              'systematic': systematic_resample, 'residual': residual_resample}
+
+
+class ParticleInformationSet(base.InformationSet):
+    """
+    belief made of weighted concrete boards. unlike the piecewise grid every sample is a board the observations
+    could actually have led to, at the cost of a fixed number of particles.
+    particles are stored like PiecewiseGrid.gen_boards samples: the square of each of the 32 pieces, -1 once it is
+    captured, with the player's pieces in the upper half and their promotions kept alongside.
+    """
+
+    def __init__(self, board: Game, num_particles=256, resampling='systematic', resample_threshold=0.5):
+        """
+        constructs new information set from a board state
+        :param num_particles: number of boards kept, trading accuracy against the time every update takes
+        :param resampling: one of RESAMPLERS
+        :param resample_threshold: particles are resampled once the effective sample size drops below this
+                                   fraction of num_particles
+        """
+        super().__init__(board)
+        self.num_particles = num_particles
+        self.resampling = resampling
+        self.resample_threshold = resample_threshold
+        self.rng = np.random.default_rng(np.random.randint(2 ** 31))
+
+        grid = PiecewiseGrid(board.truth_board.copy())
+        self.piece_types = grid.piece_types
+        self.base_types = np.array([chess.Piece.from_symbol(symbol).piece_type for symbol in self.piece_types],
+                                   dtype=np.int8)
+        # our pieces are white, the opponent's black
+        self.signs = np.array([1 if symbol.isupper() else -1 for symbol in self.piece_types], dtype=np.int8)
+        self.particles = grid.gen_boards(num_particles, self.rng)
+        self.promotions = np.zeros_like(self.particles)
+        self.weights = np.full(num_particles, 1.0 / num_particles)
+        self.uniform = True
+
+    @property
+    def raw(self) -> Any:
+        """
+        returns the marginal (8, 8, 32) grid of the particles, laid out like PiecewiseGrid.piece_grids
+        """
+        rows, pieces = np.nonzero(self.particles >= 0)
+        grids = np.bincount(self.particles[rows, pieces].astype(int) * 32 + pieces, weights=self.weights[rows],
+                            minlength=64 * 32)
+        return grids.reshape(8, 8, 32)
+
+    def to_board(self, particle: int) -> chess.Board:
+        board = chess.Board()
+        piece_map = {}
+        for i, square in enumerate(self.particles[particle]):
+            if square >= 0:
+                piece_type = self.promotions[particle, i] or self.base_types[i]
+                piece_map[int(square)] = chess.Piece(int(piece_type), bool(self.signs[i] > 0))
+        board.set_piece_map(piece_map)
+        return board
+
+    def random_sample(self) -> Game:
+        """
+        randomly generates a sample board state
+        :return:
+        """
+        if self.uniform:
+            particle = self.rng.integers(self.num_particles)
+        else:
+            particle = min(np.searchsorted(self.cdf, self.rng.random(), side='right'), self.num_particles - 1)
+        return PiecewiseInformationSet.game_from_board(self.to_board(particle))
+
+    def random_samples(self, n: int) -> List[Game]:
+        if self.uniform:
+            particles = self.rng.integers(self.num_particles, size=n)
+        else:
+            particles = np.minimum(np.searchsorted(self.cdf, self.rng.random(n), side='right'),
+                                   self.num_particles - 1)
+        return [PiecewiseInformationSet.game_from_board(self.to_board(particle)) for particle in particles]
+
+    def size(self):
+        """
+        :return: number of distinct boards the belief still holds
+        """
+        alive = self.weights > 0
+        return len(np.unique(np.concatenate([self.particles[alive], self.promotions[alive]], axis=1), axis=0))
+
+    def signed_types(self) -> np.ndarray:
+        """
+        :return: (num_particles, 32) piece types of every particle, negative for the opponent's pieces
+        """
+        return np.where(self.promotions > 0, self.promotions, self.base_types) * self.signs
+
+    def occupancy(self) -> np.ndarray:
+        """
+        :return: (num_particles, 64) index of the piece on each square, -1 for empty squares
+        """
+        occupied = np.full((self.num_particles, 64), -1, dtype=np.int8)
+        rows, pieces = np.nonzero(self.particles >= 0)
+        occupied[rows, self.particles[rows, pieces]] = pieces
+        return occupied
+
+    def reweight(self, consistent: np.ndarray):
+        """
+        drops the particles that contradict an observation and resamples when too few effective ones are left
+        :param consistent: (num_particles,) boolean mask, not all False
+        """
+        self.weights = np.where(consistent, self.weights, 0.0)
+        self.weights /= np.sum(self.weights)
+        self.cdf = np.cumsum(self.weights)
+        self.uniform = False
+        if 1.0 / np.sum(self.weights ** 2) < self.resample_threshold * self.num_particles:
+            self.resample()
+
+    def resample(self):
+        indices = RESAMPLERS[self.resampling](self.weights, self.num_particles, self.rng)
+        self.particles = self.particles[indices]
+        self.promotions = self.promotions[indices]
+        self.weights = np.full(self.num_particles, 1.0 / self.num_particles)
+        self.uniform = True
+
+    def rebuild(self, update):
+        """
+        starts over from the marginals of the particles when none of them survive an observation. update applies
+        the observation to a PiecewiseGrid holding the marginals, which is then sampled for new particles.
+        """
+        grid = PiecewiseGrid(chess.Board())
+        grid.piece_grids = self.raw
+        grid.captured_list = [None if np.any(self.particles[:, i] >= 0) else [] for i in range(32)]
+        grid.enemy_pawn_columns = [list(range(8)) for _ in range(8)]
+        update(grid)
+        own_promotions = self.promotions[0, 16:]
+        self.particles = grid.gen_boards(self.num_particles, self.rng)
+        self.promotions = np.zeros_like(self.particles)
+        self.promotions[:, 16:] = own_promotions
+        self.weights = np.full(self.num_particles, 1.0 / self.num_particles)
+        self.uniform = True
+
+    def update_with_sense(self, sense_result: List[Tuple[chess.Square, chess.Piece]]):
+        # we don't check our own pieces in the sense result
+        observations = [(square, symbol) for square, symbol in sense_symbols(sense_result)
+                        if symbol is None or symbol.islower()]
+        if len(observations) == 0:
+            return
+        squares = np.array([square for square, symbol in observations])
+        expected = np.array([0 if symbol is None else -chess.PIECE_SYMBOLS.index(symbol)
+                             for square, symbol in observations])
+
+        occupants = self.occupancy()[:, squares]
+        types = np.take_along_axis(self.signed_types(), np.maximum(occupants, 0).astype(int), axis=1)
+        seen = np.where(occupants >= 0, types, 0)
+        consistent = np.all(seen == expected, axis=1)
+        if np.any(consistent):
+            self.reweight(consistent)
+        else:
+            self.rebuild(lambda grid: grid.handle_sense_result(sense_result))
+
+    def update_with_move(self, move_result):
+        move, captured_piece = move_result
+        # player passed and there is nothing to handle
+        if move is None:
+            return
+        movers = np.nonzero(self.particles[0, 16:] == move.from_square)[0]
+        if len(movers) == 0:
+            return
+        mover = movers[0] + 16
+
+        victims = self.particles[:, :16] == move.to_square
+        captured = np.any(victims, axis=1)
+        consistent = captured == captured_piece
+        if not np.any(consistent):
+            self.rebuild(lambda grid: grid.handle_player_move(move, captured_piece))
+            return
+
+        rows = np.nonzero(captured)[0]
+        self.particles[rows, np.argmax(victims[rows], axis=1)] = -1
+        self.particles[:, mover] = move.to_square
+        if move.promotion is not None:
+            self.promotions[:, mover] = move.promotion
+        if self.base_types[mover] == chess.KING and abs(move.to_square - move.from_square) == 2:
+            rook_from, rook_to = castling_rook_squares(move)
+            self.particles[:, 16:][self.particles[:, 16:] == rook_from] = rook_to
+        self.reweight(consistent)
+
+    def propagate_opponent_move(self, possible_moves, captured_piece: bool, captured_square: chess.Square):
+        """
+        moves every particle on by one opponent move that agrees with what we saw of it. boards that are held by
+        several particles only have their moves generated once.
+        :param possible_moves: (move, piece type, chance) tuples, moves listed there are drawn more often
+        """
+        hints = {move: chance for move, piece_type, chance in possible_moves}
+        states = np.concatenate([self.particles, self.promotions], axis=1)
+        alive = np.nonzero(self.weights > 0)[0]
+        unique, inverse = np.unique(states[alive], axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # (from, to, promotion, rook from, rook to) of the move each particle makes, from = -1 for passing
+        moves = np.full((self.num_particles, 5), -1)
+        moves[:, 2] = 0
+        consistent = np.zeros(self.num_particles, dtype=np.bool_)
+        for u in range(len(unique)):
+            particles = alive[inverse == u]
+            board = self.to_board(particles[0])
+            board.turn = chess.BLACK
+            options = opponent_options(board, captured_piece, captured_square)
+            if len(options) == 0:
+                continue
+            chances = np.array([1.0 / len(options) + hints.get(option, 0.0) for option in options])
+            for particle, choice in zip(particles, self.rng.choice(len(options), len(particles),
+                                                                   p=chances / np.sum(chances))):
+                option = options[choice]
+                if option is not None:
+                    moves[particle, :3] = option.from_square, option.to_square, option.promotion or 0
+                    if board.is_castling(option):
+                        moves[particle, 3:] = castling_rook_squares(option)
+            consistent[particles] = True
+
+        if not np.any(consistent):
+            self.rebuild(lambda grid: grid.handle_enemy_move(possible_moves, captured_piece, captured_square))
+            return
+
+        rows = np.nonzero(moves[:, 0] >= 0)[0]
+        from_squares, to_squares = moves[rows, 0], moves[rows, 1]
+        movers = np.argmax(self.particles[rows, :16] == from_squares[:, None], axis=1)
+        victims = self.particles[rows, 16:] == to_squares[:, None]
+        captures = np.nonzero(np.any(victims, axis=1))[0]
+        self.particles[rows[captures], np.argmax(victims[captures], axis=1) + 16] = -1
+        self.particles[rows, movers] = to_squares
+        promoted = np.nonzero(moves[rows, 2] > 0)[0]
+        self.promotions[rows[promoted], movers[promoted]] = moves[rows[promoted], 2]
+        castled = np.nonzero(moves[rows, 3] >= 0)[0]
+        rooks = np.argmax(self.particles[rows[castled], :16] == moves[rows[castled], 3][:, None], axis=1)
+        self.particles[rows[castled], rooks] = moves[rows[castled], 4]
+        self.reweight(consistent)
+
+    def mirror(self):
+        self.particles = np.where(self.particles >= 0, 63 - self.particles, -1).astype(np.int8)
+        self.particles = np.concatenate([self.particles[:, 16:], self.particles[:, :16]], axis=1)
+        self.promotions = np.concatenate([self.promotions[:, 16:], self.promotions[:, :16]], axis=1)
+
+    def __copy__(self):
+        new_infoset = ParticleInformationSet.__new__(ParticleInformationSet)
+        new_infoset.__dict__.update(self.__dict__)
+        new_infoset.particles = self.particles.copy()
+        new_infoset.promotions = self.promotions.copy()
+        new_infoset.weights = self.weights.copy()
+        new_infoset.rng = np.random.default_rng(self.rng.integers(2 ** 31))
+        return new_infoset
+
+    def __repr__(self):
+        sample = self.random_sample()
+        return str(sample.truth_board)
+
+    def __str__(self):
+        sample = self.random_sample()
+        return str(sample.truth_board)
+
+
+def castling_rook_squares(move: chess.Move):
+    """
+    :param move: castling move of a king, given as the king moving two squares
+    :return: (from, to) squares of the rook castling along
+    """
+    rank = chess.square_rank(move.from_square)
+    rook_file = 7 if move.to_square > move.from_square else 0
+    return chess.square(rook_file, rank), (move.from_square + move.to_square) // 2
+
+
+def opponent_options(board: chess.Board, captured_piece: bool, captured_square: chess.Square):
+    """
+    moves the opponent could have made on board, None standing for a pass, that capture a piece of ours on
+    captured_square if captured_piece and capture nothing otherwise
+    """
+    captured_piece = bool(captured_piece)
+    options = []
+    if not captured_piece:
+        options.append(None)
+    for move in board.pseudo_legal_moves:
+        target = board.piece_at(move.to_square)
+        captures = target is not None and target.color == chess.WHITE
+        if captures == captured_piece and (not captured_piece or move.to_square == captured_square):
+            options.append(move)
+    return options
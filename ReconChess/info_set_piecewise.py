@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 import chess
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Optional
 import base as base
 
 from prob_board import PiecewiseGrid
@@ -11,13 +11,15 @@ import numpy as np
 
 class PiecewiseInformationSet(base.InformationSet):
 
-    def __init__(self, board: Game):
+    def __init__(self, board: Game, sparse=False, motion_model=None):
         """
         constructs new information set from a board state
         :param board:
+        :param sparse: keep the grid as the support of every piece, see PiecewiseGrid
+        :param motion_model: MotionModel moving the enemy pieces on opponent moves without hypotheses
         """
         super().__init__(board)
-        self.piecewisegrid = PiecewiseGrid(board.truth_board)
+        self.piecewisegrid = PiecewiseGrid(board.truth_board, sparse, motion_model)
 
     @property
     def raw(self) -> Any:
@@ -25,14 +27,24 @@ class PiecewiseInformationSet(base.InformationSet):
         returns raw representation of information set
         :return:
         """
-        return self.piecewisegrid.piece_grids
+        return self.piecewisegrid.grids_view()
 
     def random_sample(self) -> Game:
         """
         randomly generates a sample board state
         :return:
         """
-        board = self.piecewisegrid.gen_board()
+        return self.game_from_board(self.piecewisegrid.gen_board())
+
+    def random_samples(self, n: int) -> List[Game]:
+        """
+        randomly generates n sample board states, drawn in one pass over the grid
+        """
+        return [self.game_from_board(board)
+                for board in self.piecewisegrid.to_boards(self.piecewisegrid.gen_boards(n))]
+
+    @staticmethod
+    def game_from_board(board: chess.Board) -> Game:
         g = Game()
         g.truth_board = board
         g.white_board = board.copy()
@@ -40,10 +52,8 @@ class PiecewiseInformationSet(base.InformationSet):
         return g
 
     def size(self):
-        entropy = 0
-        for i in range(32):
-            probs = self.piecewisegrid.piece_grids[:, :, i].flatten()
-            entropy += np.sum(-probs * np.log2(probs + 1e-10))
+        pieces, squares, probs = self.piecewisegrid.support()
+        entropy = np.sum(-probs * np.log2(probs + 1e-10))
         return round(2 ** entropy)
 
     def update_with_sense(self, sense_result: List[Tuple[chess.Square, chess.Piece]]):
@@ -53,9 +63,9 @@ class PiecewiseInformationSet(base.InformationSet):
         move, captured_piece = move_result
         self.piecewisegrid.handle_player_move(move, captured_piece)
 
-    def propagate_opponent_move(self, possible_moves, captured_square: bool,
-                                captured_piece: chess.Piece):
-        self.piecewisegrid.handle_enemy_move(possible_moves, captured_square, captured_piece)
+    def propagate_opponent_move(self, possible_moves, captured_piece: bool,
+                                captured_square: Optional[chess.Square]):
+        self.piecewisegrid.handle_enemy_move(possible_moves, captured_piece, captured_square)
 
     def mirror(self):
         return self.piecewisegrid.mirror()
@@ -1,5 +1,3 @@
-import copy
-
 from player import Player
 from base import SenseEngine, PolicyEngine, InformationSet, SimulationEngine, EngineSpec
 from game import Game
@@ -9,6 +7,14 @@ import chess
 import numpy as np
 import random
 
+import geometry
+
+# squares the knights may land on: ranks 3 to 8 for white, 1 to 6 for black
+KNIGHT_ROUTES = {color: geometry.knight_distances([2 <= chess.square_rank(square) < 8 if color == chess.WHITE
+                                                   else 0 <= chess.square_rank(square) < 6
+                                                   for square in chess.SQUARES])
+                 for color in chess.COLORS}
+
 
 class KnightAgent(Player):
     def __init__(self):
@@ -70,38 +76,16 @@ class KnightAgent(Player):
         knightsquare = chess.square(knightpos[0], knightpos[1])
         kingsquare = chess.square(kingpos[0], kingpos[1])
 
-        stack = [[x] for x in self.knight_moves_from_square(knightsquare)]
-        while len(stack) > 0:
-            path = stack[0]
-            stack = stack[1:]
-
-            # if len(path) >= 3:
-            # temp = 12
-
-            if path[-1].to_square == kingsquare:
-                return path
-
-            next_moves = self.knight_moves_from_square(path[-1].to_square)
-
-            for move in next_moves:
-                newpath = copy.deepcopy(path)
-                newpath.append(move)
-                stack.append(newpath)
-
-    def knight_moves_from_square(self, square):
-        file, rank = chess.square_file(square), chess.square_rank(square)
-
-        knight_directions = [(2, 1), (1, 2), (-1, 2), (-2, 1), (1, -2), (2, -1), (-2, -1), (-1, -2)]
-
-        moves = []
-        for dir in knight_directions:
-            upperbound = 8 if self.color == chess.WHITE else 6
-            lowerbound = 2 if self.color == chess.WHITE else 0
-            if file + dir[0] < 8 and file + dir[0] >= 0 and rank + dir[1] < upperbound and rank + dir[1] >= lowerbound:
-                moves.append(chess.Move(square, chess.square(file + dir[0], rank + dir[1])))
-
-        random.shuffle(moves)
-        return moves
+        # follow the precomputed shortest route, there is none if the king is out of reach
+        distances, next_hops = KNIGHT_ROUTES[self.color]
+        if distances[knightsquare, kingsquare] <= 0:
+            return None
+        path = []
+        square = knightsquare
+        while square != kingsquare:
+            path.append(chess.Move(square, int(next_hops[square, kingsquare])))
+            square = path[-1].to_square
+        return path
 
 
 class KnightSenseEngine(SenseEngine):
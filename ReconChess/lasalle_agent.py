@@ -10,7 +10,9 @@ from game import Game
 from policy_engine_ismcts import ISMCTSPolicyEngine
 from engines import PiecewiseSenseEngine, ExpUCB, PiecewiseInformationSet, feature_output_to_move, move_to_feature_index
 from base import mirror, mirror_sense_result, flip_move
+from board_batch import BoardBatch, KING_ATTACKS, SQUARE_BITS, plane
 
+from motion_model import MotionModel
 from prob_board import PiecewiseGrid
 
 import os
@@ -46,7 +48,8 @@ class LaSalleAgent(Player):
             board.set_piece_at(chess.E1, chess.Piece(chess.QUEEN, chess.WHITE))
             board.set_piece_at(chess.D8, chess.Piece(chess.KING, chess.BLACK))
             board.set_piece_at(chess.E8, chess.Piece(chess.QUEEN, chess.BLACK))
-        self.piecewisegrid = PiecewiseGrid(board)
+        # try fitting against knight moves only
+        self.piecewisegrid = PiecewiseGrid(board, motion_model=MotionModel(movers='n'))
 
         self.firstmove = True if color == chess.WHITE else False
 
@@ -92,39 +95,8 @@ class LaSalleAgent(Player):
         chances += random_chances
         piece_types += random_piece_types
         """
-        # try fitting against knight moves only
-        board = self.piecewisegrid.gen_certain_board()  # gen board is slow and not necessarily needed like this here
-        moves = []
-        knight_grid = self.piecewisegrid.piece_grids[:, :, 1] + self.piecewisegrid.piece_grids[:, :, 6]
-        for file in range(8):
-            for rank in range(8):
-                if knight_grid[rank, file] > 0:
-                    square = chess.square(file, rank)
-                    moves.extend(self.knight_moves_from_square(square, board))
-
-        chances = [1.0 / len(moves) for move in moves]
-        piece_types = ['n'] * len(moves)
-
-        print("OPPONENT MOVES: ")
-        print(moves)
-
-        self.piecewisegrid.handle_enemy_move(list(zip(moves, piece_types, chances)), captured_piece, captured_square)
-
-    def knight_moves_from_square(self, square, board):
-        file, rank = chess.square_file(square), chess.square_rank(square)
-
-        knight_directions = [(2, 1), (1, 2), (-1, 2), (-2, 1), (1, -2), (2, -1), (-2, -1), (-1, -2)]
-
-        moves = []
-        for dir in knight_directions:
-            upperbound = 8
-            lowerbound = 0
-            if file + dir[0] < 8 and file + dir[0] >= 0 and rank + dir[1] < upperbound and rank + dir[1] >= lowerbound \
-                    and board.piece_at(chess.square(file + dir[0], rank + dir[1])) is None:
-                moves.append(chess.Move(square, chess.square(file + dir[0], rank + dir[1])))
-
-        random.shuffle(moves)
-        return moves
+        # the grid's motion model spreads the knights over their moves
+        self.piecewisegrid.handle_enemy_move([], captured_piece, captured_square)
 
     def choose_sense(self, possible_sense, possible_moves, seconds_left):
         """
@@ -166,6 +138,35 @@ class LaSalleAgent(Player):
         bx, by = chess.square_file(b), chess.square_rank(b)
         return (ax - bx) ** 2 + (ay - by) ** 2
 
+    def close_capture(self, samples: BoardBatch):
+        """
+        looks for a capture of an enemy knight, queen, bishop or rook on the sampled boards, taking knights from
+        anywhere and the others only from next to them or when they are close to d2
+        :return: the first such capture in order of boards, piece types, enemy squares and attacker squares, None
+                 if there is none
+        """
+        board_index, capture = len(samples), None
+        for piece_type, piece_text in [(chess.KNIGHT, 'k'), (chess.QUEEN, 'q'), (chess.BISHOP, 'b'),
+                                       (chess.ROOK, 'r')]:
+            # check uncertainty
+            sl = [p == piece_text for p in self.piecewisegrid.piece_types]
+            dist = self.piecewisegrid.piece_grids[:, :, sl].flatten()
+            entropy = np.sum(dist * np.log2(dist + 1e-10))
+            if entropy > 0:
+                continue
+            pieces = samples.pieces[:, plane(piece_type, chess.BLACK)]
+            for enemy_square in chess.SquareSet(int(np.bitwise_or.reduce(pieces))):
+                on_square = (pieces & SQUARE_BITS[enemy_square]) > 0
+                attackers = samples.attackers(chess.WHITE, np.where(on_square, enemy_square, -1))
+                if self.sq_dist(chess.D2, enemy_square) >= 3 and piece_type != chess.KNIGHT:
+                    # squares at a distance below 3 are the ones around enemy_square
+                    attackers &= KING_ATTACKS[enemy_square]
+                found = np.flatnonzero(attackers)
+                if len(found) > 0 and found[0] < board_index:
+                    board_index = found[0]
+                    capture = chess.Move(chess.lsb(int(attackers[board_index])), enemy_square)
+        return capture
+
     def choose_move(self, possible_moves, seconds_left):
         """
         Choose a move to enact from a list of possible moves.
@@ -188,35 +189,21 @@ class LaSalleAgent(Player):
                     move = flip_move(move)
                 return move
 
-        for i in range(self.piecewisegrid.num_board_states()):
-            board = self.piecewisegrid.gen_board()
-            for piece_type, piece_text in [(chess.KNIGHT, 'k'), (chess.QUEEN, 'q'), (chess.BISHOP, 'b'),
-                                           (chess.ROOK, 'r')]:
-                for enemy_square in board.pieces(piece_type, chess.BLACK):
-                    # check uncertainty
-                    sl = [p == piece_text for p in self.piecewisegrid.piece_types]
-                    dist = self.piecewisegrid.piece_grids[:, :, sl].flatten()
-                    entropy = np.sum(dist * np.log2(dist + 1e-10))
-                    if entropy > 0:
-                        continue
-                    attackers = board.attackers(chess.WHITE, enemy_square)
-                    for attacker_sq in attackers:
-                        if self.sq_dist(attacker_sq, enemy_square) < 3 or self.sq_dist(chess.D2,
-                                                                                       enemy_square) < 3 or piece_type == chess.KNIGHT:
-                            move = chess.Move(attacker_sq, enemy_square)
-                            if self.color == chess.BLACK:
-                                move = flip_move(move)
-                            print(f'req move: {move}')
-                            return move
+        samples = BoardBatch.from_squares(self.piecewisegrid.gen_boards(self.piecewisegrid.num_board_states()),
+                                          self.piecewisegrid.piece_types)
+        move = self.close_capture(samples)
+        if move is not None:
+            if self.color == chess.BLACK:
+                move = flip_move(move)
+            print(f'req move: {move}')
+            return move
 
         # change this to depend on total uncertainty
         num_samples = self.piecewisegrid.num_board_states() + 3
         print(f'Testing {num_samples} samples')
-        samples = []
-        for sample in range(num_samples):
-            board = self.piecewisegrid.gen_board()
+        samples = self.piecewisegrid.to_boards(self.piecewisegrid.gen_boards(num_samples))
+        for board in samples:
             board.color = chess.WHITE
-            samples.append(board)
 
         # compute best moves
         moves = []
@@ -239,9 +226,7 @@ class LaSalleAgent(Player):
         scores = []
 
         # generate new sample
-        samples = []
-        for sample in range(num_samples):
-            samples.append(self.piecewisegrid.gen_board())
+        samples = self.piecewisegrid.to_boards(self.piecewisegrid.gen_boards(num_samples))
         print(f'Testing {len(samples)} Samples')
         for move in moves:
             evaluation_samples = [board for board in samples if board.is_legal(move)]
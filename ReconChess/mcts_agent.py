@@ -16,18 +16,24 @@ from player import Player
 import chess
 
 from engines import ISMCTSPolicyEngine, PiecewiseSenseEngine, StockFishEvaluationEngine, PiecewiseInformationSet, \
-    ExpUCB, NetworkPolySimEngine, PolicyNetworkUCB, StaticSenseEngine
+    ExpUCB, NetworkPolySimEngine, PolicyNetworkUCB, StaticSenseEngine, CachedSimulationEngine, CaptureHeuristicPrior
 from game import Game
 import base as base
 from eval_engine_network import feature_output_to_move
+from time_manager import TimeManager
 from util import flip_move, mirror, mirror_sense_result
 
 
 class MCTSAgent(Player):
 
-    def __init__(self, network):
+    def __init__(self, network, use_clock=False):
+        """
+        :param use_clock: search every move for a share of the game clock, see TimeManager. by default every move is
+                          searched for a fixed number of iterations, which keeps self-play fast
+        """
         super().__init__()
         self.network = network
+        self.use_clock = use_clock
 
     def handle_game_start(self, color, board):
         """
@@ -37,12 +43,14 @@ class MCTSAgent(Player):
         :param board: chess.Board -- initial board state
         """
         sense_engine = PiecewiseSenseEngine()
-        sim_engine = StockFishEvaluationEngine(depth=1)
+        sim_engine = CachedSimulationEngine(StockFishEvaluationEngine(depth=1))
         network_policy_engine = NetworkPolySimEngine(self.network)
         ucb_engine = PolicyNetworkUCB(network_policy_engine)
         #ucb_engine = ExpUCB()
         self.engine_spec = base.EngineSpec(sense_engine, sim_engine, ucb_engine)
-        self.policy_engine = ISMCTSPolicyEngine(self.engine_spec, num_iters=100)
+        self.time_manager = TimeManager() if self.use_clock else None
+        self.policy_engine = ISMCTSPolicyEngine(self.engine_spec, num_iters=100, reuse_trees=True,
+                                                widening=base.ProgressiveWidening(CaptureHeuristicPrior()))
         if color == chess.BLACK:
             board: chess.Board
             board.set_piece_at(chess.D1, chess.Piece(chess.KING, chess.WHITE))
@@ -113,6 +121,7 @@ class MCTSAgent(Player):
         self.info_set.propagate_opponent_move(list(zip(moves, piece_types, chances)), captured_piece, captured_square)
         """
         self.info_set.propagate_opponent_move([], captured_piece, captured_square)
+        self.policy_engine.observe_opponent_move(captured_square)
     def choose_sense(self, possible_sense, possible_moves, seconds_left):
         """
         This function is called to choose a square to perform a sense on.
@@ -125,6 +134,7 @@ class MCTSAgent(Player):
         :example: choice = chess.A1
         """
         sense_loc = self.engine_spec.sense_engine.choose_sense(self.info_set)
+        self.sense_location = sense_loc
         if self.color == chess.BLACK:
             sense_loc = mirror(sense_loc)
         return sense_loc
@@ -146,6 +156,7 @@ class MCTSAgent(Player):
         if self.color == chess.BLACK:
             sense_result = mirror_sense_result(sense_result)
         self.info_set.update_with_sense(sense_result)
+        self.policy_engine.observe_sense(self.sense_location, sense_result)
         print()
 
     def choose_move(self, possible_moves, seconds_left):
@@ -162,7 +173,8 @@ class MCTSAgent(Player):
         :example: choice = chess.Move(chess.G7, chess.G8, promotion=chess.KNIGHT) *default is Queen
         """
 
-        policy = self.policy_engine.generate_policy(self.info_set)
+        time_budget = None if self.time_manager is None else self.time_manager.allocate(seconds_left)
+        policy = self.policy_engine.generate_policy(self.info_set, time_budget)
         move = feature_output_to_move(policy)
         if self.color == chess.WHITE:
             pass
@@ -184,6 +196,7 @@ class MCTSAgent(Player):
         if self.color == chess.BLACK:
             taken_move = flip_move(taken_move)
             captured_square = mirror(captured_square)
+        self.policy_engine.observe_move(taken_move)
         if taken_move is not None:
             self.info_set.update_with_move((taken_move, captured_piece))
             print()
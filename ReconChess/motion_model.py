@@ -0,0 +1,95 @@
+from typing import List
+
+import chess
+import numpy as np
+
+import geometry
+
+# row of every piece type in the transition tables
+MOTION_TYPES = 'rnbqkp'
+
+
+def line_masks(directions) -> np.ndarray:
+    masks = np.zeros((64, 64), dtype=np.bool_)
+    for square in chess.SQUARES:
+        for i in directions:
+            masks[square, geometry.RAYS[square][i]] = True
+    return masks
+
+
+def black_pawn_pushes() -> np.ndarray:
+    pushes = np.zeros((64, 64), dtype=np.bool_)
+    for square in chess.SQUARES:
+        rank = chess.square_rank(square)
+        if rank > 0:
+            pushes[square, square - 8] = True
+        if rank == 6:
+            pushes[square, square - 16] = True
+    return pushes
+
+
+def empty_board_moves() -> np.ndarray:
+    """
+    non-capturing moves of the enemy's (black) pieces on an empty board
+    :return: (6, 64, 64) boolean array indexed by [MOTION_TYPES index, from, to]
+    """
+    straight, diagonal = line_masks(geometry.STRAIGHT_DIRECTIONS), line_masks(geometry.DIAGONAL_DIRECTIONS)
+    return np.stack([straight, geometry.KNIGHT_MASKS, diagonal, straight | diagonal, geometry.KING_MASKS,
+                     black_pawn_pushes()])
+
+
+EMPTY_BOARD_MOVES = empty_board_moves()
+# BETWEEN_INDICATOR[from * 64 + to] marks the squares a move from from to to passes over
+BETWEEN_INDICATOR = np.array([geometry.bitboard_to_mask(int(mask)) for mask in geometry.BETWEEN_MASKS.reshape(4096)],
+                             dtype=np.float64)
+
+
+class MotionModel:
+    """
+    diffuses the enemy pieces of a PiecewiseGrid over one enemy move without sampling any boards. the enemy is
+    assumed to pick uniformly among its non-capturing moves. a move only counts as far as it is possible on the
+    current belief: its path has to be clear and its target empty, both judged by treating the squares as
+    independently occupied with the belief's occupancy.
+
+    castling and promotions aren't modelled, the captures are left to PiecewiseGrid.handle_enemy_move.
+    """
+
+    def __init__(self, movers: str = MOTION_TYPES):
+        """
+        :param movers: symbols of the piece types that may move, all of them by default
+        """
+        self.movers = np.array([symbol in movers for symbol in MOTION_TYPES])
+
+    def transitions(self, piece_grids: np.ndarray) -> np.ndarray:
+        """
+        :param piece_grids: (8, 8, 32) grids of a PiecewiseGrid
+        :return: (6, 64, 64) chance that each move of each piece type can be made, indexed like EMPTY_BOARD_MOVES
+        """
+        empty = 1.0 - np.clip(piece_grids.reshape(64, 32).sum(axis=1), 0.0, 1.0)
+        # chance that the squares between from and to are all empty, summed in log space. squares that are surely
+        # occupied are counted on their own to keep the logs finite.
+        blocked = BETWEEN_INDICATOR @ (empty <= 0.0) > 0
+        clear = np.exp(BETWEEN_INDICATOR @ np.log(np.where(empty > 0.0, empty, 1.0)))
+        clear = np.where(blocked, 0.0, clear).reshape(64, 64)
+        return EMPTY_BOARD_MOVES * self.movers[:, None, None] * (clear * empty[None, :])
+
+    def propagate(self, piece_grids: np.ndarray, piece_types: List[str]) -> np.ndarray:
+        """
+        moves the enemy pieces (the first 16) one move forward in a single batched matrix multiply
+        :param piece_types: piece symbols of the grid's pieces
+        :return: new (8, 8, 32) grids, each piece keeping its total mass
+        """
+        kinds = [MOTION_TYPES.index(symbol.lower()) for symbol in piece_types[:16]]
+        moves = self.transitions(piece_grids)[kinds]
+        grids = piece_grids.reshape(64, 32)[:, :16].T
+
+        arrived = np.matmul(grids[:, None, :], moves)[:, 0, :]
+        left = grids * moves.sum(axis=2)
+        # every possible move of every piece is equally likely, so a piece moves in proportion to its options
+        total = left.sum()
+        if total <= 0.0:
+            return piece_grids.copy()
+
+        propagated = piece_grids.copy()
+        propagated.reshape(64, 32)[:, :16] += ((arrived - left) / total).T
+        return propagated
@@ -1,4 +1,8 @@
+import contextlib
+import itertools
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import chess
 import numpy as np
@@ -7,18 +11,92 @@ import base as base
 
 from collections import namedtuple
 from typing import List, Tuple, Any, Dict, Type, Mapping
-from game import Game
+from game import Game, SimGame
 import math
 # from tqdm import tqdm
 from eval_engine_network import move_to_feature_index, feature_output_to_move
 from info_set_piecewise import PiecewiseInformationSet
+from time_manager import deadline_after, past_deadline
+from tree_store import TreeStore
+from util import SenseObservation
 
 eps = 1e-10
+NodeStatistics = namedtuple('NodeStatistics', ['incoming_edge', 'visit_count', 'total_reward', 'children'])
+
+
+def node_statistics(node: base.Node, depth):
+    """
+    copies the statistics of a node and its descendants into plain picklable tuples
+    :param depth: number of levels below node to include
+    :return: NodeStatistics whose children map child keys to NodeStatistics
+    """
+    children = {}
+    if depth > 0:
+        for key, child in node.children.items():
+            children[key] = node_statistics(child, depth - 1)
+    return NodeStatistics(node.incoming_edge, node.visit_count, node.total_reward, children)
+
+
+def merge_statistics(stats: List[NodeStatistics]):
+    """
+    sums the statistics of independent searches that share the same root
+    """
+    children = {}
+    for stat in stats:
+        for key, child in stat.children.items():
+            children.setdefault(key, []).append(child)
+    children = {key: merge_statistics(child_stats) for key, child_stats in children.items()}
+    return NodeStatistics(stats[0].incoming_edge, sum(stat.visit_count for stat in stats),
+                          sum(stat.total_reward for stat in stats), children)
+
+
+def policy_from_statistics(root: NodeStatistics):
+    """
+    builds the 8x8x73 move policy from the root statistics of a search
+    """
+    policy = np.ones((8, 8, 73))
+    policy *= float('-inf')
+
+    if len(root.children) == 0:
+        # mf reached a terminal game state so don't make any moves
+        return policy
+    best_sense = max(root.children.values(), key=lambda child: child.total_reward)
+    moves = sorted(best_sense.children.values(), key=lambda child: child.total_reward, reverse=True)
+
+    for node in moves:
+        # children of moves that turned into a pass have no taken move to put in the policy
+        if node.incoming_edge[1] is not None:
+            policy[move_to_feature_index(node.incoming_edge[1])] = node.total_reward
+
+    return policy
 
 
 class ISMCTSPolicyEngine(base.PolicyEngine):
-    def __init__(self, player_engine_spec: base.EngineSpec, opponent_engine_spec=None, white=True, num_iters=10):
+    def __init__(self, player_engine_spec: base.EngineSpec, opponent_engine_spec=None, white=True, num_iters=10,
+                 tree_backend='object', belief_cache_size=512, num_threads=1, virtual_loss=100.0,
+                 sim_engine_factory=None, batch_size=1, reuse_trees=False, lazy_expansion=True,
+                 widening: base.ProgressiveWidening = None):
+        """
+        :param tree_backend: 'object' to build the search trees out of node objects, 'array' to keep node statistics
+                             in a numpy backed TreeStore
+        :param belief_cache_size: number of lazily materialized node beliefs each tree keeps around
+        :param num_threads: number of threads searching the shared trees at the same time
+        :param virtual_loss: reward taken off every node on a path while its simulation is in flight, so concurrent
+                             threads spread out over different leaves
+        :param sim_engine_factory: callable taking a player index and returning a new simulation engine. when given,
+                                   every search thread gets its own simulation engines so that blocking engine calls
+                                   can overlap
+        :param batch_size: number of leaves collected (spread out with virtual loss) before they are all scored in a
+                           single score_boards call and backpropagated together
+        :param reuse_trees: keep the player's tree between generate_policy calls. the observe_* methods descend it
+                            along what actually happened, and the matching subtree becomes the next search's root
+        :param lazy_expansion: expanded play nodes only record their candidate moves, children are created when they
+                               are first selected
+        :param widening: progressive widening that limits the moves considered at play nodes, all moves when None
+        """
         super().__init__()
+        if tree_backend not in ('object', 'array'):
+            raise ValueError(f'unknown tree backend {tree_backend}')
         if opponent_engine_spec is None:
             self.engine_specs = [player_engine_spec, player_engine_spec]
         else:
@@ -26,11 +104,28 @@ class ISMCTSPolicyEngine(base.PolicyEngine):
         self.trees = []
         self.white = white
         self.num_iters = num_iters
+        self.tree_backend = tree_backend
+        self.belief_cache_size = belief_cache_size
+        self.num_threads = num_threads
+        self.virtual_loss = virtual_loss
+        self.sim_engine_factory = sim_engine_factory
+        self.batch_size = batch_size
+        self.reuse_trees = reuse_trees
+        self.lazy_expansion = lazy_expansion
+        self.widening = widening
+        # keys from the root of the last search to the node the next search starts at
+        self.reuse_path = None
+        self.reuse_sense = None
+        self.thread_sim_engines = []
+        self.thread_state = threading.local()
 
     def sense_engine(self, player):
         return self.engine_specs[player].sense_engine
 
     def sim_engine(self, player):
+        sim_engines = getattr(self.thread_state, 'sim_engines', None)
+        if sim_engines is not None:
+            return sim_engines[player]
         return self.engine_specs[player].sim_engine
 
     def ucb_engine(self, player):
@@ -52,30 +147,105 @@ class ISMCTSPolicyEngine(base.PolicyEngine):
         self.num_iters = tmp
         return self.trees[0].total_reward
 
-    def generate_policy(self, player_info_set: base.InformationSet):
-        player_info_set.propagate_opponent_move([], None, False)
+    def generate_policy(self, player_info_set: base.InformationSet, time_budget=None):
+        """
+        :param time_budget: seconds the search may take. when given, the search runs until the budget is used up
+                            (but at least one iteration) instead of for num_iters iterations
+        """
+        deadline = deadline_after(time_budget)
+        p1_info_set, p2_info_set = self.root_info_sets(player_info_set)
+        self.mcts(p1_info_set, p2_info_set, self.reused_root(p1_info_set), deadline)
+        statistics = self.root_statistics()
+        if self.reuse_trees and len(statistics.children) > 0:
+            # the policy plays the moves of the best sense child, so the next turn continues below it
+            self.reuse_path = [max(statistics.children, key=lambda key: statistics.children[key].total_reward)]
+        return policy_from_statistics(statistics)
+
+    def current_policy(self):
+        """
+        builds the best policy from the statistics the search has gathered so far
+        """
+        return policy_from_statistics(self.root_statistics())
+
+    def observe_move(self, taken_move):
+        """
+        records the move that was actually taken after the last generate_policy call
+        :param taken_move: taken move from the player's (white) perspective, None if no move was made
+        """
+        if self.reuse_path is not None:
+            self.reuse_path.append(taken_move)
+
+    def observe_opponent_move(self, captured_square):
+        """
+        records the result of the opponent's move that followed the player's move
+        :param captured_square: square where the opponent captured a piece from the player's perspective, or None
+        """
+        if self.reuse_path is not None:
+            self.reuse_path.append('_pass' if captured_square is None else captured_square)
+
+    def observe_sense(self, sense_location, sense_result):
+        """
+        records the player's sense before the next generate_policy call, only the matching sense child is kept
+        """
+        self.reuse_sense = (sense_location, SenseObservation.from_result(sense_location, sense_result))
+
+    def reused_root(self, p1_info_set: base.InformationSet):
+        """
+        descends the previous tree along the observed sense, move and opponent move result
+        :return: the matching subtree promoted to root, or None to start a new tree
+        """
+        path, sense = self.reuse_path, self.reuse_sense
+        self.reuse_path = None
+        self.reuse_sense = None
+        if not self.reuse_trees or path is None or len(path) != 3 or len(self.trees) == 0:
+            return None
+
+        node = self.trees[0]
+        for key in path:
+            if key not in node.children:
+                return None
+            node = node.children[key]
+        if sense is not None:
+            node.prune(sense)
+        return node.promote(p1_info_set)
+
+    @staticmethod
+    def root_info_sets(player_info_set: base.InformationSet):
+        """
+        prepares the information sets both search trees are rooted at
+        :return: (player information set, opponent information set)
+        """
+        player_info_set.propagate_opponent_move([], False, None)
 
         other_info_set = player_info_set.random_sample()
-        other_info_set = PiecewiseInformationSet(other_info_set)
-
-        self.mcts(player_info_set.__copy__(), other_info_set)
-        policy = np.ones((8, 8, 73))
-        policy *= float('-inf')
-
-        if len(self.trees[0].children) == 0:
-            # mf reached a terminal game state so don't make any moves
-            return policy
-        best_sense = max(self.trees[0].children.values(), key=lambda child: child.total_reward)
-        moves = sorted(best_sense.children.values(), key=lambda child: child.total_reward, reverse=True)
-
-        for node in moves:
-            node: base.OpponentNode
-            if node.incoming_edge[1] is not None:
-                policy[move_to_feature_index(node.incoming_edge[1])] = node.total_reward
-            else:
-                print(node.incoming_edge)
-
-        return policy
+        if isinstance(player_info_set, PiecewiseInformationSet):
+            grid = player_info_set.piecewisegrid
+            other_info_set = PiecewiseInformationSet(other_info_set, grid.sparse, grid.motion_model)
+        else:
+            other_info_set = PiecewiseInformationSet(other_info_set)
+        return player_info_set.__copy__(), other_info_set
+
+    def root_statistics(self):
+        """
+        collects the statistics of the player's root, its sense children and their move children
+        :return: NodeStatistics
+        """
+        return node_statistics(self.trees[0], depth=2)
+
+    def close(self):
+        """
+        shuts down the simulation engines, closing engines shared by both players once
+        """
+        sim_engines = []
+        for engine_spec in self.engine_specs:
+            if not any(engine_spec.sim_engine is sim_engine for sim_engine in sim_engines):
+                sim_engines.append(engine_spec.sim_engine)
+        for thread_sim_engines in self.thread_sim_engines:
+            sim_engines += thread_sim_engines
+        self.thread_sim_engines = []
+        for sim_engine in sim_engines:
+            if hasattr(sim_engine, 'close'):
+                sim_engine.close()
 
     def get_turn(self, player):
         if player == 0:
@@ -83,49 +253,139 @@ class ISMCTSPolicyEngine(base.PolicyEngine):
         else:
             return not self.white
 
-    def mcts(self, p1_info_set: base.InformationSet, p2_info_set: base.InformationSet):
-        player = 0
-        self.trees = [base.SelfNode(p1_info_set, chess.WHITE, incoming_edge=None, parent=None),
-                      base.OpponentNode(p2_info_set, chess.BLACK, incoming_edge=None, parent=None)]
+    def new_trees(self, p1_info_set: base.InformationSet, p2_info_set: base.InformationSet, root=None):
+        """
+        :param root: reused root of the player's tree, a new root is created when None
+        """
+        caches = [base.BeliefCache(self.belief_cache_size), base.BeliefCache(self.belief_cache_size)]
+        if self.tree_backend == 'array':
+            if root is None:
+                root = TreeStore(32 * self.num_iters, caches[0]).root(base.SelfNode, p1_info_set, chess.WHITE)
+            opponent_root = TreeStore(32 * self.num_iters, caches[1]).root(base.OpponentNode, p2_info_set, chess.BLACK)
+            return [root, opponent_root]
+        if root is None:
+            root = base.SelfNode(p1_info_set, chess.WHITE, incoming_edge=None, parent=None, belief_cache=caches[0])
+        opponent_root = base.OpponentNode(p2_info_set, chess.BLACK, incoming_edge=None, parent=None,
+                                          belief_cache=caches[1])
+        return [root, opponent_root]
+
+    def mcts(self, p1_info_set: base.InformationSet, p2_info_set: base.InformationSet, root=None, deadline=None):
+        """
+        :param deadline: time.monotonic() deadline. when given, the search runs until the deadline instead of for
+                         num_iters iterations
+        """
+        self.trees = self.new_trees(p1_info_set, p2_info_set, root)
+
+        if self.num_threads > 1:
+            self.mcts_threaded(p1_info_set, deadline)
+        else:
+            for iters in self.iteration_batches(deadline):
+                self.iterate(p1_info_set, iters)
+
+        #self.print_trees()
 
-        for i in range(self.num_iters):
-            # perform initial determinization
+    def iteration_batches(self, deadline=None):
+        """
+        yields batches of iteration indices until num_iters iterations have been handed out or, with a deadline,
+        until the deadline has passed. the first batch is always handed out.
+        """
+        iters = itertools.count() if deadline is not None else iter(range(self.num_iters))
+        batch = list(itertools.islice(iters, self.batch_size))
+        while len(batch) > 0:
+            yield batch
+            if past_deadline(deadline):
+                return
+            batch = list(itertools.islice(iters, self.batch_size))
+
+    def iterate(self, p1_info_set: base.InformationSet, iters):
+        """
+        runs select/expand for a batch of iterations on the shared trees, scores all of their leaves at once and
+        backpropagates the rewards
+        :param iters: iteration indices of the batch
+        """
+        virtual_loss = self.virtual_loss if self.num_threads > 1 or self.batch_size > 1 else 0.0
+        leaves = []
+        # perform initial determinizations for the whole batch
+        determinizations = p1_info_set.random_samples(len(iters))
+        for i, determinization in zip(iters, determinizations):
+            player = 0
             trees = self.trees.copy()
-            determinization = p1_info_set.random_sample()
-            trees, game_state = self.select(trees, player, determinization, i)
+            trees, game_state = self.select(trees, player, SimGame(determinization.truth_board), i)
             if not game_state.is_over():
                 self.expand(trees, game_state, i)
-            rewards = self.simulate(game_state)
-            self.backprop(trees, rewards)
-
-        #self.print_trees()
+            if virtual_loss:
+                self.add_virtual_loss(trees)
+            leaves.append((trees, game_state))
+
+        all_rewards = self.simulate_batch([game_state for trees, game_state in leaves])
+        for (trees, game_state), rewards in zip(leaves, all_rewards):
+            self.backprop(trees, rewards, virtual_loss)
+
+    def mcts_threaded(self, p1_info_set: base.InformationSet, deadline=None):
+        if self.sim_engine_factory is not None:
+            while len(self.thread_sim_engines) < self.num_threads:
+                self.thread_sim_engines.append([self.sim_engine_factory(player) for player in range(len(self.trees))])
+
+        batches = self.iteration_batches(deadline)
+        iter_lock = threading.Lock()
+
+        def worker(thread_id):
+            if self.sim_engine_factory is not None:
+                self.thread_state.sim_engines = self.thread_sim_engines[thread_id]
+            try:
+                while True:
+                    with iter_lock:
+                        iters = next(batches, None)
+                    if iters is None:
+                        return
+                    self.iterate(p1_info_set, iters)
+            finally:
+                self.thread_state.sim_engines = None
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            futures = [executor.submit(worker, thread_id) for thread_id in range(self.num_threads)]
+            for future in futures:
+                future.result()
+
+    def node_lock(self, node: base.Node):
+        return node.lock if self.num_threads > 1 else contextlib.nullcontext()
+
+    def add_virtual_loss(self, trees: List[base.Node]):
+        for tree in trees:
+            if tree is not None:
+                tree.backprop(-self.virtual_loss)
+
+    def backprop(self, trees: List[base.Node], rewards, virtual_loss=0.0):
+        """
+        :param virtual_loss: virtual loss that was added to the paths of trees and has to be settled
+        """
+        for tree, reward in zip(trees, rewards):
+            if tree is not None:
+                if virtual_loss:
+                    tree.backprop(reward + virtual_loss, visits=0)
+                else:
+                    tree.backprop(reward)
+
+    def simulate(self, game_state: SimGame):
+        return self.simulate_batch([game_state])[0]
+
+    def simulate_batch(self, game_states: List[SimGame]):
+        """
+        scores the leaves of a batch of iterations with one score_boards call per simulation engine. when both players
+        share an engine, their boards are scored together.
+        :return: list of per player rewards for every game state
+        """
+        boards = [[game_state.truth_board for game_state in game_states],
+                  [game_state.truth_board.mirror() for game_state in game_states]]
+        sim_engines = [self.sim_engine(player) for player in range(len(self.trees))]
+        if sim_engines[0] is sim_engines[1]:
+            scores = sim_engines[0].score_boards(boards[0] + boards[1])
+            scores = [scores[:len(game_states)], scores[len(game_states):]]
+        else:
+            scores = [sim_engine.score_boards(player_boards) for sim_engine, player_boards in zip(sim_engines, boards)]
+        return [[scores[player][j] for player in range(len(self.trees))] for j in range(len(game_states))]
 
-    def backprop(self, trees: List[base.Node], rewards):
-        trees = trees.copy()
-        rooted = 0
-        while rooted != len(trees):
-            rooted = 0
-            for player in range(len(trees)):
-                if trees[player] is None:
-                    continue
-                trees[player].visit_count += 1
-                trees[player].total_reward += rewards[player]
-                trees[player] = trees[player].parent
-
-            for tree in trees:
-                rooted += 1 if tree is None else 0
-
-    def simulate(self, game_state: Game):
-        rewards = []
-        for player in range(len(self.trees)):
-            if player == 0:
-                rewards.append(self.sim_engine(player).score_boards([game_state.truth_board])[0])
-            else:
-                rewards.append(self.sim_engine(player).score_boards([game_state.truth_board.mirror()])[0])
-
-        return rewards
-
-    def expand(self, trees: List[base.Node], game_state: Game, i):
+    def expand(self, trees: List[base.Node], game_state: SimGame, i):
         player = None
         for i, tree in enumerate(trees):
             if isinstance(tree, base.SelfNode):
@@ -136,36 +396,47 @@ class ISMCTSPolicyEngine(base.PolicyEngine):
             return trees, game_state
 
         game_state.turn = self.get_turn(player)
-        sense_location = trees[player].select_child(game_state, self.sense_engine(player), i)
-        trees[player] = trees[player].traverse(game_state, sense_location, self.sim_engine(player))
+        with self.node_lock(trees[player]):
+            sense_location = trees[player].select_child(game_state, self.sense_engine(player), i)
+            trees[player] = trees[player].traverse(game_state, sense_location, self.sim_engine(player))
 
-        trees[player].expand(game_state, self.engine_specs[player])
-        move_action = trees[player].select_child(game_state, self.ucb_engine(player), i)
+        with self.node_lock(trees[player]):
+            trees[player].expand(game_state, self.engine_specs[player], self.lazy_expansion)
+            move_action = trees[player].select_child(game_state, self.ucb_engine(player), i, self.widening)
 
         for p in [player, not player]:
             game_state.turn = self.get_turn(p)
-            trees[p] = trees[p].traverse(game_state, move_action, self.engine_specs[player])
+            with self.node_lock(trees[p]):
+                trees[p] = trees[p].traverse(game_state, move_action, self.engine_specs[player])
 
         return trees
 
-    def select(self, trees: List[base.Node], player, game_state: Game, i):
+    def select(self, trees: List[base.Node], player, game_state: SimGame, i):
         if game_state.is_over():
             return trees, game_state
         for tree in trees:
-            if len(tree.unexplored_children(game_state, self.sense_engine(player))) > 0:
+            with self.node_lock(tree):
+                unexplored = tree.unexplored_children(game_state, self.sense_engine(player))
+            if len(unexplored) > 0:
                 return trees, game_state
 
         # sense action
-        sense_action = trees[player].select_child(game_state, self.sense_engine(player), i)
-        trees[player] = trees[player].traverse(game_state, sense_action, self.engine_specs[player])
+        with self.node_lock(trees[player]):
+            sense_action = trees[player].select_child(game_state, self.sense_engine(player), i)
+            trees[player] = trees[player].traverse(game_state, sense_action, self.engine_specs[player])
 
         # move action
-        move_action = trees[player].select_child(game_state, self.ucb_engine(player), i)
+        with self.node_lock(trees[player]):
+            if not trees[player].is_expanded():
+                # another search thread added this play node and hasn't expanded it yet
+                trees[player].expand(game_state, self.engine_specs[player], self.lazy_expansion)
+            move_action = trees[player].select_child(game_state, self.ucb_engine(player), i, self.widening)
 
         # propagate player trees to the next state
         for p in [player, not player]:
             game_state.turn = self.get_turn(p)
-            trees[p] = trees[p].traverse(game_state, move_action, self.engine_specs[player])
+            with self.node_lock(trees[p]):
+                trees[p] = trees[p].traverse(game_state, move_action, self.engine_specs[player])
         return self.select(trees, not player, game_state, i)
 
     def print_trees(self):
@@ -0,0 +1,126 @@
+import multiprocessing as mp
+import random
+import traceback
+
+import numpy as np
+
+import base as base
+from policy_engine_ismcts import ISMCTSPolicyEngine, merge_statistics, policy_from_statistics
+from time_manager import deadline_after
+
+
+def send_error(conn, error: Exception):
+    worker_traceback = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    try:
+        conn.send((None, error, worker_traceback))
+    except Exception:
+        # the exception itself couldn't be pickled
+        conn.send((None, RuntimeError(repr(error)), worker_traceback))
+
+
+def search_worker(engine_factory, conn):
+    """
+    worker loop of a root parallel search. the policy engine (and with it any stockfish process) is created once and
+    reused for every search request until the parent sends None. every request is answered with
+    (statistics, None, None), or with (None, exception, traceback) when the search or building the engine failed.
+    """
+    policy_engine: ISMCTSPolicyEngine = None
+    engine_error = None
+    try:
+        policy_engine = engine_factory()
+    except Exception as e:
+        engine_error = e
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            if engine_error is not None:
+                send_error(conn, engine_error)
+                continue
+            p1_info_set, p2_info_set, seed, time_budget = request
+            random.seed(seed)
+            np.random.seed(seed)
+            try:
+                policy_engine.mcts(p1_info_set, p2_info_set, deadline=deadline_after(time_budget))
+                statistics = policy_engine.root_statistics()
+            except Exception as e:
+                send_error(conn, e)
+                continue
+            conn.send((statistics, None, None))
+    finally:
+        if policy_engine is not None:
+            policy_engine.close()
+        conn.close()
+
+
+class RootParallelISMCTSPolicyEngine(base.PolicyEngine):
+    def __init__(self, engine_factory, num_workers=None, seed=None, start_method=None):
+        """
+        runs independent ISMCTS searches from the same root in a pool of persistent worker processes and sums their
+        root statistics before building the policy.
+        :param engine_factory: picklable callable that builds the ISMCTSPolicyEngine each worker searches with
+        :param num_workers: number of worker processes, defaults to the number of cores
+        :param seed: base seed for the workers' random number generators
+        :param start_method: multiprocessing start method, defaults to the platform default
+        """
+        super().__init__()
+        self.engine_factory = engine_factory
+        self.num_workers = mp.cpu_count() if num_workers is None else num_workers
+        self.seed = random.randrange(2 ** 31) if seed is None else seed
+        self.context = mp.get_context(start_method)
+        self.workers = []
+        self.connections = []
+        self.num_searches = 0
+        self.statistics = None
+        # root statistics of every worker's last search
+        self.worker_statistics = []
+
+    def start(self):
+        if len(self.workers) > 0:
+            return
+        for i in range(self.num_workers):
+            parent_conn, child_conn = self.context.Pipe()
+            worker = self.context.Process(target=search_worker, args=(self.engine_factory, child_conn), daemon=True)
+            worker.start()
+            child_conn.close()
+            self.workers.append(worker)
+            self.connections.append(parent_conn)
+
+    def generate_policy(self, player_info_set: base.InformationSet, time_budget=None):
+        """
+        a failed search raises a RuntimeError with the worker's traceback, caused by the worker's exception
+        :param time_budget: seconds each worker may search, see ISMCTSPolicyEngine.generate_policy
+        """
+        self.start()
+        p1_info_set, p2_info_set = ISMCTSPolicyEngine.root_info_sets(player_info_set)
+
+        for i, conn in enumerate(self.connections):
+            seed = (self.seed + self.num_searches * self.num_workers + i) % 2 ** 32
+            conn.send((p1_info_set, p2_info_set, seed, time_budget))
+        self.num_searches += 1
+
+        # every worker answers before anything is raised, so the pipes are ready for the next search
+        results = [conn.recv() for conn in self.connections]
+        for statistics, error, worker_traceback in results:
+            if error is not None:
+                raise RuntimeError('search worker failed:\n' + worker_traceback) from error
+        self.worker_statistics = [statistics for statistics, _, _ in results]
+        self.statistics = merge_statistics(self.worker_statistics)
+        return policy_from_statistics(self.statistics)
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(None)
+            conn.close()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.connections = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
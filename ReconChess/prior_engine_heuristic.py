@@ -0,0 +1,34 @@
+import chess
+import numpy as np
+from typing import List
+
+import base as base
+from game import Game
+
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 100}
+
+
+class CaptureHeuristicPrior(base.PriorEngine):
+    """
+    rates moves by what they do on the determinization: taking the king first, then captures ordered by most
+    valuable victim / least valuable attacker, then promotions
+    """
+
+    def __init__(self, promotion_bonus=8.0):
+        self.promotion_bonus = promotion_bonus
+
+    def move_priors(self, info_set: base.InformationSet, game_state: Game, moves: List[chess.Move]) -> np.ndarray:
+        board = game_state.truth_board
+        enemy_king_square = board.king(not board.turn)
+        priors = np.zeros(len(moves))
+        for i, move in enumerate(moves):
+            if move.to_square == enemy_king_square:
+                priors[i] = 1000
+                continue
+            attacker = board.piece_at(move.from_square)
+            victim = board.piece_at(move.to_square)
+            if victim is not None and attacker is not None and victim.color != attacker.color:
+                priors[i] += 10 * PIECE_VALUES[victim.piece_type] - PIECE_VALUES[attacker.piece_type]
+            if move.promotion is not None:
+                priors[i] += self.promotion_bonus
+        return priors
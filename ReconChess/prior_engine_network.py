@@ -0,0 +1,36 @@
+import weakref
+
+import chess
+import numpy as np
+from typing import List
+
+import base as base
+from eval_engine_network import NetworkPolySimEngine
+from game import Game
+from util import flip_move
+
+
+class NetworkPrior(base.PriorEngine):
+    """
+    rates moves by the probability the policy network assigns them in the player's belief
+    """
+
+    def __init__(self, network_policy_engine: NetworkPolySimEngine):
+        self.network_policy_engine = network_policy_engine
+        # policy of every belief the network has seen. node beliefs aren't changed once derived, a node whose belief
+        # changes gets a new one when the belief cache is cleared, so a policy never goes stale
+        self.policies = weakref.WeakKeyDictionary()
+
+    def policy(self, info_set: base.InformationSet):
+        policy = self.policies.get(info_set)
+        if policy is None:
+            policy = self.network_policy_engine.generate_policy(info_set)
+            self.policies[info_set] = policy
+        return policy
+
+    def move_priors(self, info_set: base.InformationSet, game_state: Game, moves: List[chess.Move]) -> np.ndarray:
+        policy = self.policy(info_set)
+        if game_state.turn == chess.BLACK:
+            # beliefs are kept from white's perspective
+            moves = [flip_move(move) for move in moves]
+        return np.array([self.network_policy_engine.prob_given_action(policy, move) for move in moves])
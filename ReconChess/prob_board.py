@@ -6,8 +6,8 @@ import numpy as np
 import random
 import math
 
-# to convolve uncertainties
-from scipy import signal
+import geometry
+from util import sense_symbols
 
 #order = [4, 20, 3, 19, 7, 23, 0, 16, 6, 22, 1, 17, 5, 21, 2, 18, 8, 24, 9, 25, 10, 26, 11, 27, 12, 28, 13, 29, 14, 30,
          #15, 31]
@@ -15,18 +15,184 @@ order = [20, 19, 23, 16, 22, 17, 21, 18, 24, 25, 26, 27, 28, 29, 30, 31, 4, 3, 7
 
 import copy
 
+
+class SparseGrids:
+    """
+    piece grids stored as the support of every piece: squares[offsets[i]:offsets[i + 1]] are the squares piece i
+    may be on, in increasing order, and probs the chance of each. instances are never modified, so they can be
+    shared between copies of a grid.
+    """
+    __slots__ = ('offsets', 'squares', 'probs')
+
+    def __init__(self, offsets: np.ndarray, squares: np.ndarray, probs: np.ndarray):
+        self.offsets = offsets
+        self.squares = squares
+        self.probs = probs
+
+    @staticmethod
+    def from_dense(piece_grids: np.ndarray) -> 'SparseGrids':
+        by_piece = piece_grids.reshape(64, 32).T
+        pieces, squares = np.nonzero(by_piece)
+        return SparseGrids(np.searchsorted(pieces, np.arange(33)).astype(np.int32), squares.astype(np.int8),
+                           by_piece[pieces, squares])
+
+    def pieces(self) -> np.ndarray:
+        """
+        :return: piece index of every entry
+        """
+        return np.repeat(np.arange(32), np.diff(self.offsets))
+
+    def to_dense(self) -> np.ndarray:
+        by_piece = np.zeros((32, 64))
+        by_piece[self.pieces(), self.squares] = self.probs
+        return by_piece.T.reshape(8, 8, 32)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.squares.nbytes + self.probs.nbytes
+
+
+class GridAttribute:
+    """
+    (8, 8, 32) grid attribute of a PiecewiseGrid. sparse grids keep it as SparseGrids between updates and only
+    expand it while an update works on it, see PiecewiseGrid.compact.
+    """
+
+    def __set_name__(self, owner, name):
+        self.dense_name = '_' + name
+        self.sparse_name = '_' + name + '_sparse'
+
+    def __get__(self, grid, owner):
+        if grid is None:
+            return self
+        dense = grid.__dict__.get(self.dense_name)
+        if dense is None:
+            sparse = grid.__dict__.get(self.sparse_name)
+            if sparse is None:
+                raise AttributeError(self.dense_name[1:])
+            dense = grid.__dict__[self.dense_name] = sparse.to_dense()
+        return dense
+
+    def __set__(self, grid, value):
+        grid.__dict__[self.dense_name] = value
+        grid.__dict__[self.sparse_name] = None
+
+    def view(self, grid):
+        """
+        the grid for reading only, expanded without keeping the dense copy around
+        """
+        dense = grid.__dict__.get(self.dense_name)
+        return dense if dense is not None else grid.__dict__[self.sparse_name].to_dense()
+
+    def sparse(self, grid):
+        """
+        :return: the SparseGrids of the grid, None while it is expanded
+        """
+        return grid.__dict__.get(self.sparse_name) if grid.__dict__.get(self.dense_name) is None else None
+
+    def share(self, grid, other):
+        """
+        hands the compacted grid of grid to other
+        """
+        other.__dict__[self.sparse_name] = grid.__dict__[self.sparse_name]
+        other.__dict__[self.dense_name] = None
+
+    def compact(self, grid):
+        dense = grid.__dict__.get(self.dense_name)
+        if dense is not None:
+            grid.__dict__[self.sparse_name] = SparseGrids.from_dense(dense)
+            grid.__dict__[self.dense_name] = None
+
+
+class EnemyMoveTable:
+    """
+    hypotheses about the enemy's last move, one row for every enemy piece that could have made it: a rook move
+    gets a row for each rook. chances are per move, so both rooks move the full chance of their move. tables are
+    never modified, pruning makes a new one.
+    """
+    DTYPE = np.dtype([('from_square', np.int8), ('to_square', np.int8), ('piece', np.int8), ('move', np.int32),
+                      ('chance', np.float64)])
+    # enemy pieces a move by a piece type could have been made with, any other piece type is a pawn
+    PIECE_INDICES = {'r': [0, 7], 'n': [1, 6], 'b': [2, 5], 'q': [3], 'k': [4]}
+
+    def __init__(self, rows: np.ndarray, symbols: np.ndarray, by_from=None, by_to=None):
+        """
+        :param rows: array of DTYPE
+        :param symbols: symbol of the piece of every row
+        :param by_from: (64, len(rows)) mask of the rows moving from each square, computed if not given
+        :param by_to: same for the squares moved to
+        """
+        self.rows = rows
+        self.symbols = symbols
+        self.by_from = by_from if by_from is not None else np.arange(64)[:, None] == rows['from_square']
+        self.by_to = by_to if by_to is not None else np.arange(64)[:, None] == rows['to_square']
+
+    @staticmethod
+    def from_moves(possible_moves: List[Tuple[chess.Move, str, float]], piece_types: List[str]) -> 'EnemyMoveTable':
+        """
+        :param possible_moves: list of (move, piece type symbol, chance) tuples
+        :param piece_types: symbols of the grid's pieces
+        """
+        if len(possible_moves) == 0:
+            return EnemyMoveTable.EMPTY
+        rows = [(move.from_square, move.to_square, piece, i, chance)
+                for i, (move, piece_type, chance) in enumerate(possible_moves)
+                for piece in EnemyMoveTable.PIECE_INDICES.get(piece_type, [8 + chess.square_file(move.from_square)])]
+        rows = np.array(rows, dtype=EnemyMoveTable.DTYPE)
+        return EnemyMoveTable(rows, np.array(piece_types)[rows['piece']])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def of_type(self, symbol: str) -> np.ndarray:
+        """
+        :return: mask of the rows moving a piece of type symbol
+        """
+        return self.symbols == symbol
+
+    def keep(self, mask: np.ndarray) -> 'EnemyMoveTable':
+        return EnemyMoveTable(self.rows[mask], self.symbols[mask], self.by_from[:, mask], self.by_to[:, mask])
+
+    def normalized(self) -> 'EnemyMoveTable':
+        """
+        :return: table whose move chances sum to one, counting every move once however many rows it has
+        """
+        rows = self.rows.copy()
+        _, first_rows = np.unique(rows['move'], return_index=True)
+        rows['chance'] /= np.sum(rows['chance'][first_rows])
+        return EnemyMoveTable(rows, self.symbols, self.by_from, self.by_to)
+
+
+EnemyMoveTable.EMPTY = EnemyMoveTable(np.zeros(0, dtype=EnemyMoveTable.DTYPE), np.zeros(0, dtype='<U1'))
+
+
 class PiecewiseGrid:
+    piece_grids = GridAttribute()
+    # grids before the last enemy move, kept to revise that move once the sense result is in
+    piece_grids_temp = GridAttribute()
+
     def __copy__(self):
-        newgrid = PiecewiseGrid(chess.Board())
-        newgrid.piece_grids = np.copy(self.piece_grids)
-        newgrid.piece_types = copy.deepcopy(self.piece_types)
-        newgrid.own_pieces = copy.deepcopy(self.own_pieces)
-        newgrid.captured = copy.deepcopy(self.captured_list)
-        newgrid.promoted = copy.deepcopy(self.promoted)
-        newgrid.enemy_moves = copy.deepcopy(self.enemy_moves)
-        newgrid.enemy_pawn_columns = copy.deepcopy(self.enemy_pawn_columns)
+        # filled in directly rather than through __init__, which would build a grid from a board first
+        newgrid = PiecewiseGrid.__new__(PiecewiseGrid)
+        newgrid.sparse = self.sparse
+        newgrid.motion_model = self.motion_model
+        if self.sparse:
+            self.compact()
+            PiecewiseGrid.piece_grids.share(self, newgrid)
+        else:
+            newgrid.piece_grids = np.copy(self.piece_grids)
+        # entries of these lists are replaced, never modified, so shallow copies do. the move table is never modified
+        newgrid.piece_types = list(self.piece_types)
+        newgrid.own_pieces = list(self.own_pieces)
+        newgrid.captured_list = list(self.captured_list)
+        newgrid.promoted = list(self.promoted)
+        newgrid.enemy_moves = self.enemy_moves
+        newgrid.enemy_pawn_columns = [list(columns) for columns in self.enemy_pawn_columns]
         newgrid.base_uncertainty = self.base_uncertainty.copy()
         newgrid.last_sensed = self.last_sensed.copy()
+        # the caches are never modified in place, so they can be shared
+        newgrid.certain_board_cache = self.certain_board_cache
+        newgrid.uncertainty_cache = self.uncertainty_cache
         return newgrid
 
     def mirror(self):
@@ -39,7 +205,7 @@ class PiecewiseGrid:
 
         self.swap(self.captured_list, slice(0, 16), slice(16, 32))
         self.swap(self.promoted, slice(0, 16), slice(16, 32))
-        self.enemy_moves = []
+        self.enemy_moves = EnemyMoveTable.EMPTY
 
         self.base_uncertainty = np.zeros((8, 8))
         self.last_sensed = np.zeros((8, 8))
@@ -50,13 +216,23 @@ class PiecewiseGrid:
             rank, file = np.unravel_index(np.argmax(self.piece_grids[:, :, i + 24]), (8, 8))
             self.enemy_pawn_columns.append([file])
 
+        self.invalidate()
+        self.compact()
 
     def swap(self, arr, slice1: slice, slice2: slice):
         temp = copy.deepcopy(arr[slice1])
         arr[slice1] = arr[slice2]
         arr[slice2] = temp
 
-    def __init__(self, board: chess.Board):
+    def __init__(self, board: chess.Board, sparse=False, motion_model=None):
+        """
+        :param sparse: store the grids as the support of every piece between updates. copies, sampling and the
+                       memory a grid takes then scale with how uncertain it is rather than with the board.
+        :param motion_model: MotionModel that moves the enemy pieces when an enemy move comes without any
+                             hypotheses. without one such a move leaves the grids as they are.
+        """
+        self.sparse = sparse
+        self.motion_model = motion_model
         self.piece_grids = np.zeros((8, 8, 32))
         self.piece_types = ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'] + ['p'] * 8
         self.piece_types = self.piece_types + [x.upper() for x in self.piece_types]
@@ -64,12 +240,16 @@ class PiecewiseGrid:
         self.own_pieces = [False] * 16 + [True] * 16
         self.captured_list = [None] * 32
         self.promoted = [False] * 32
-        self.enemy_moves = []
+        self.enemy_moves = EnemyMoveTable.EMPTY
         self.enemy_pawn_columns = [ [i] for i in range(8) ] # possible columns the enemy's pawns could be in
 
         self.base_uncertainty = np.zeros((8, 8))
         self.last_sensed = np.zeros((8, 8))
 
+        # derived from piece_grids and only rebuilt after the handle_* methods change the grids
+        self.certain_board_cache = None
+        self.uncertainty_cache = None
+
         for i in range(32):
             piece = chess.Piece.from_symbol(self.piece_types[i])
             pieces = list(board.pieces(piece.piece_type, piece.color))
@@ -80,47 +260,108 @@ class PiecewiseGrid:
                 board.set_piece_at(pieces[0], None)
             else:
                 self.captured_list[i] = []
+        self.compact()
+
+    def compact(self):
+        """
+        sparse grids go back to their compact form once an update is done with them
+        """
+        if self.sparse:
+            PiecewiseGrid.piece_grids.compact(self)
+            PiecewiseGrid.piece_grids_temp.compact(self)
+
+    def grids_view(self):
+        """
+        :return: piece_grids for reading, without expanding sparse grids for good
+        """
+        return PiecewiseGrid.piece_grids.view(self)
+
+    def support(self):
+        """
+        :return: (pieces, squares, probs) of every square with a chance of holding a piece
+        """
+        sparse = PiecewiseGrid.piece_grids.sparse(self)
+        if sparse is not None:
+            return sparse.pieces(), sparse.squares, sparse.probs
+        by_piece = self.piece_grids.reshape(64, 32).T
+        pieces, squares = np.nonzero(by_piece)
+        return pieces, squares, by_piece[pieces, squares]
+
+    def nbytes(self):
+        """
+        :return: bytes taken by the grids
+        """
+        total = 0
+        for attribute in (PiecewiseGrid.piece_grids, PiecewiseGrid.piece_grids_temp):
+            for name in (attribute.dense_name, attribute.sparse_name):
+                if self.__dict__.get(name) is not None:
+                    total += self.__dict__[name].nbytes
+        return total
+
+    def invalidate(self):
+        """
+        drops the cached certain board and uncertainties. must be called after changing piece_grids from outside
+        the handle_* methods.
+        """
+        self.certain_board_cache = None
+        self.uncertainty_cache = None
+
+    def project(self, iterations=20, tolerance=1e-3):
+        """
+        fits the grids to one piece per square by iterative proportional fitting. the (square x piece) matrix gets
+        a column for the chance of each square being empty, then squares are scaled to sum to one and pieces to
+        their total mass in turn. squares and pieces a grid rules out stay ruled out.
+        :param iterations: most rounds of scaling
+        :param tolerance: stop once no square holds more than 1 + tolerance pieces
+        """
+        grids = self.piece_grids.reshape(64, 32)
+        masses = grids.sum(axis=0)
+        alive = masses > 0.001
+        matrix = grids[:, alive]
+
+        # scaling only wears down the mass other pieces have on the square of a certain piece slowly, so it is
+        # taken off up front unless that would leave a piece nowhere to be
+        sure = matrix.max(axis=0) > 0.999
+        cleared = np.where(np.any(matrix[:, sure] > 0.999, axis=1)[:, None] & ~sure[None, :], 0.0, matrix)
+        movable = cleared.sum(axis=0) > 0.001
+        matrix[:, movable] = cleared[:, movable] * (masses[alive][movable] / cleared[:, movable].sum(axis=0))
+
+        empty = np.maximum(1.0 - matrix.sum(axis=1), 1e-3)
+        free = 64.0 - np.sum(masses[alive])
+        if free <= 0.0:
+            return
+
+        for _ in range(iterations):
+            totals = matrix.sum(axis=1) + empty
+            if np.max(totals) < 1.0 + tolerance:
+                break
+            matrix /= totals[:, None]
+            empty /= totals
+            matrix *= masses[alive] / matrix.sum(axis=0)
+            empty *= free / empty.sum()
+
+        grids[:, alive] = matrix
+        self.piece_grids = grids.reshape(8, 8, 32)
 
     # possible moves represents a probability distribution. it is stored as a list of tuples of the form (move, piece_type, chance)
     # move chances are stored as numpy array
-    def update_prob_board_from_moves(self, possible_moves):
-        for move, piece_type, chance in possible_moves:
-            # todo: add possibility of pawn switching columns
-            # self.piece_types = ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'] + ['p'] * 8
-
-            move_indices = []
-            if piece_type == 'r':
-                move_indices.append(0)
-                move_indices.append(7)
-            elif piece_type == 'n':
-                move_indices.append(1)
-                move_indices.append(6)
-            elif piece_type == 'b':
-                move_indices.append(2)
-                move_indices.append(5)
-            elif piece_type == 'q':
-                move_indices.append(3)
-            elif piece_type == 'k':
-                move_indices.append(4)
-            else:  # pawn
-                file = chess.square_file(move.from_square)
-                move_indices.append(8 + file)
-
-            for move_index in move_indices:
-                from_file = chess.square_file(move.from_square)
-                from_rank = chess.square_rank(move.from_square)
-
-                to_file = chess.square_file(move.to_square)
-                to_rank = chess.square_rank(move.to_square)
-
-                prob = self.piece_grids_temp[from_rank, from_file, move_index] * chance
-                self.piece_grids[from_rank, from_file, move_index] -= prob
-                self.piece_grids[to_rank, to_file, move_index] += prob
+    def update_prob_board_from_moves(self, possible_moves: 'EnemyMoveTable'):
+        """
+        moves the mass every hypothesis gives its piece from the grids before the enemy move over to its to square
+        """
+        if len(possible_moves) == 0:
+            return
+        # todo: add possibility of pawn switching columns
+        rows = possible_moves.rows
+        from_ranks, from_files = rows['from_square'] // 8, rows['from_square'] % 8
+        prob = self.piece_grids_temp[from_ranks, from_files, rows['piece']] * rows['chance']
+        np.subtract.at(self.piece_grids, (from_ranks, from_files, rows['piece']), prob)
+        np.add.at(self.piece_grids, (rows['to_square'] // 8, rows['to_square'] % 8, rows['piece']), prob)
 
     # possible moves represents a probability distribution. it is stored as a list of tuples of the form (move, piece_type, chance)
     def handle_enemy_move(self, possible_moves: List[Tuple[chess.Move, chess.PieceType, float]], captured_piece: bool, captured_square: chess.Square):
         self.piece_grids_temp = self.piece_grids.copy()
-        self.enemy_moves = possible_moves if not captured_piece else []
+        self.enemy_moves = EnemyMoveTable.from_moves(possible_moves if not captured_piece else [], self.piece_types)
         if captured_piece: # TODO: Fix this, something here is not quite working
             # print("The enemy captured our piece")
             file = chess.square_file(captured_square)
@@ -131,83 +372,13 @@ class PiecewiseGrid:
                 if file - 1 in column or file + 1 in column and not file in column:
                     column.append(file)
 
-            piece_chances = np.array([0.0] * 32)
-            board = self.gen_certain_board()
-
             # take our own piece out of the game
             our_piece = np.argmax(self.piece_grids[rank, file, 16:32]) + 16
             # print("The enemy has captured our piece of " + self.piece_types[our_piece])
             self.captured_list[our_piece] = []
             self.piece_grids[:, :, our_piece] = 0.0
 
-            for i in range(16):
-                piece_grid = self.piece_grids[:, :, i]
-                if not self.captured_list[i] is None:
-                    continue
-
-                if self.piece_types[i] == 'r' or self.piece_types[i] == 'q':
-                    x = file
-                    while x < 8 and board.piece_at(chess.square(x, rank)) == None:
-                        piece_chances[i] += piece_grid[rank, x]
-                        x += 1
-                    x = file
-                    while x >= 0 and board.piece_at(chess.square(x, rank)) == None:
-                        piece_chances[i] += piece_grid[rank, x]
-                        x -= 1
-
-                    y = rank
-                    while y < 8 and board.piece_at(chess.square(file, y)) == None:
-                        piece_chances[i] += piece_grid[y, file]
-                        y += 1
-
-                    y = rank
-                    while y >= 0 and board.piece_at(chess.square(file, y)) == None:
-                        piece_chances[i] += piece_grid[y, file]
-                        y -= 1
-
-                if self.piece_types[i] == 'b' or self.piece_types[i] == 'q':
-                    i = 0
-                    while file + i < 8 and rank + i < 8 and board.piece_at(chess.square(file + i, rank + i)) == None:
-                        piece_chances[i] += piece_grid[rank + i, file + i]
-                        i += 1
-                    i = 0
-                    while file - i >= 0 and rank + i < 8 and board.piece_at(chess.square(file - i, rank + i)) == None:
-                        piece_chances[i] += piece_grid[rank + i, file - i]
-                        i += 1
-                    i = 0
-                    while file - i >= 0 and rank - i >= 0 and board.piece_at(chess.square(file - i, rank - i)) == None:
-                        piece_chances[i] += piece_grid[rank - i, file - i]
-                        i += 1
-                    i = 0
-                    while file + i < 8 and rank - i >= 0 and board.piece_at(chess.square(file + i, rank - i)) == None:
-                        piece_chances[i] += piece_grid[rank - i, file + i]
-                        i += 1
-
-                if self.piece_types[i] == 'n':
-                    if file + 2 < 8 and rank + 1 < 8:
-                        piece_chances[i] += piece_grid[rank + 1, file + 2]
-                    if file + 1 < 8 and rank + 2 < 8:
-                        piece_chances[i] += piece_grid[rank + 2, file + 1]
-
-                    if file - 1 >= 0 and rank + 2 < 8:
-                        piece_chances[i] += piece_grid[rank + 2, file - 1]
-                    if file - 2 >= 0 and rank + 1 < 8:
-                        piece_chances[i] += piece_grid[rank + 1, file - 2]
-
-                    if file + 1 < 8 and rank - 2 >= 0:
-                        piece_chances[i] += piece_grid[rank - 2, file + 1]
-                    if file + 2 < 8 and rank - 1 >= 0:
-                        piece_chances[i] += piece_grid[rank - 1, file + 2]
-
-                    if file - 2 >= 0 and rank - 1 >= 0:
-                        piece_chances[i] += piece_grid[rank - 1, file - 2]
-                    if file - 1 >= 0 and rank - 2 >= 0:
-                        piece_chances[i] += piece_grid[rank - 2, file - 1]
-
-                if self.piece_types[i] == 'p' and rank - 1 >= 0 and file - 1 >= 0:
-                    piece_chances[i] += piece_grid[rank - 1, file - 1]
-                if self.piece_types[i] == 'p' and rank - 1 >= 0 and file + 1 < 8:
-                    piece_chances[i] += piece_grid[rank - 1, file + 1]
+            piece_chances = self.capture_chances(captured_square)
 
             if np.sum(piece_chances > 0.001):
                 piece_chances /= np.sum(piece_chances)
@@ -232,71 +403,86 @@ class PiecewiseGrid:
             for i in range(32):
                 if self.captured_list[i] is None:
                     self.piece_grids[rank, file, i] = piece_chances[i]
+        elif len(self.enemy_moves) == 0 and self.motion_model is not None:
+            self.piece_grids = self.motion_model.propagate(self.piece_grids, self.piece_types)
         else:
             self.update_prob_board_from_moves(self.enemy_moves)
+        self.project()
+        self.invalidate()
+        self.compact()
+
+    def capture_chances(self, square):
+        """
+        rates how likely each enemy piece is to have captured on square by the probability mass it has on the squares
+        it could have captured from. the squares of certain pieces block sliding attacks.
+        :return: (32,) array, zero for our pieces and captured enemy pieces
+        """
+        if isinstance(square, bool) or square not in chess.SQUARES:
+            raise ValueError(f'capture square must be a chess.Square, got {square!r}')
+        certain = np.max(self.piece_grids, axis=2).reshape(64) > 0.99
+        occupied = geometry.mask_to_bitboard(certain) & ~chess.BB_SQUARES[square]
+        masks = geometry.attacker_masks(square, occupied, chess.BLACK)
+
+        # mass of every enemy piece on the squares of every attack pattern
+        reach = masks @ self.piece_grids.reshape(64, 32)[:, :16]
+        piece_chances = np.zeros(32)
+        piece_chances[:16] = np.sum(reach * geometry.attack_patterns(self.piece_types[:16]), axis=0)
+        piece_chances[[i for i in range(16) if self.captured_list[i] is not None]] = 0.0
+        return piece_chances
 
     def get_board_uncertainty(self):
+        if self.uncertainty_cache is None:
+            certainties = np.max(self.grids_view()[:, :, :16], axis=2)
+            certainties[certainties < 0.99] = 0.0
+            certainties[certainties >= 0.99] = 0.1
+            self.uncertainty_cache = self.piece_uncertainty(), certainties
+        uncertainty, certainties = self.uncertainty_cache
+
+        # update count of when certain pieces were last sensed
+        self.last_sensed += certainties
+        self.last_sensed[self.last_sensed > 1.0] = 1.0
+
+        #uncertainty += self.last_sensed
+        return uncertainty + self.base_uncertainty
+
+    def piece_uncertainty(self):
+        """
+        :return: (8, 8) uncertainty of every square, raised on the squares enemy pieces could attack our king from
+        """
         KING_ATTACK = 0.25
         PIECE_PIN = 0.15
 
-        uncertainty = 0.5 - np.abs(0.5 - self.piece_grids)
+        piece_grids = self.grids_view()
+        uncertainty = 0.5 - np.abs(0.5 - piece_grids)
 
-        board = self.gen_certain_board()
+        board = self.certain_board()
 
         # find location of your own king
-        rank, file = np.unravel_index(np.argmax(self.piece_grids[:, :, 20]), (8, 8))
+        king = int(np.argmax(piece_grids[:, :, 20]))
+        by_square = uncertainty.reshape(64, 32)
 
         # add uncertainty from knight attacks
         knights = [self.piece_types[i] == 'n' and self.captured_list[i] is None for i in range(32)]
-        knight_directions = [(2, 1), (1, 2), (-1, 2), (-2, 1), (1, -2), (2, -1), (-2, -1), (-1, -2)]
-        for dir in knight_directions:
-            x = file + dir[0]
-            y = rank + dir[1]
-            if x < 8 and y < 8 and x >= 0 and y >= 0 and board.piece_at(chess.square(x,y)) == None:
-                try:
-                    uncertainty[y, x, knights] += KING_ATTACK
-                except IndexError as ie:
-                    # print("ERROR WHEN TRYING TO INDEX KNIGHTS")
-                    # print(knights)
-                    pass
+        for square in geometry.KNIGHT_SQUARES[king]:
+            if board.piece_at(square) is None:
+                by_square[square, knights] += KING_ATTACK
 
         # add uncertainty from sliding attacks
         straight_attackers = [(self.piece_types[i] == 'q' or self.piece_types[i] == 'r') and self.captured_list[i] is None for i in range(32)]
         diagonal_attackers = [(self.piece_types[i] == 'q' or self.piece_types[i] == 'b') and self.captured_list[i] is None for i in range(32)]
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for i, dir in enumerate(directions):
-            x = file + dir[0]
-            y = rank + dir[1]
+        for i, ray in enumerate(geometry.RAYS[king]):
+            attackers = straight_attackers if i in geometry.STRAIGHT_DIRECTIONS else diagonal_attackers
             num_hits = 0
-
-            while x < 8 and x >= 0 and y < 8 and y >= 0 and num_hits < 2:
-                piece = board.piece_at(chess.square(x, y))
+            for square in ray:
+                if num_hits >= 2:
+                    break
+                piece = board.piece_at(square)
                 if not piece is None:
                     num_hits += 1 if piece.color == chess.WHITE else 2
                 else:
-                    try:
-                        uncertainty[y, x, straight_attackers if i < 4 else diagonal_attackers] += KING_ATTACK if num_hits == 0 else PIECE_PIN
-                    except IndexError as ie:
-                        # print("ERROR WHEN TRYING TO INDEX SLIDING")
-                        # print(straight_attackers)
-                        # print(diagonal_attackers)
-                        pass
-                x += dir[0]
-                y += dir[1]
-
-        uncertainty = np.max(uncertainty, axis=2)
-
-        # update count of when certain pieces were last sensed
-        certainties = np.max(self.piece_grids[:, :, :16], axis=2)
-        certainties[certainties < 0.99] = 0.0
-        certainties[certainties >= 0.99] = 0.1
-        self.last_sensed += certainties
-        self.last_sensed[self.last_sensed > 1.0] = 1.0
-
-        #uncertainty += self.last_sensed
-        uncertainty += self.base_uncertainty
+                    by_square[square, attackers] += KING_ATTACK if num_hits == 0 else PIECE_PIN
 
-        return uncertainty
+        return np.max(uncertainty, axis=2)
 
     def get_total_uncertainty(self):
         return np.sum(self.get_board_uncertainty())
@@ -312,7 +498,7 @@ class PiecewiseGrid:
         """
 
         # finds which 3x3 squares have the highest uncertainties
-        uncertainties = signal.convolve2d(self.get_board_uncertainty(), np.ones((3, 3)), mode="same")
+        uncertainties = geometry.window_sums(self.get_board_uncertainty())
 
         rank, file = np.unravel_index(np.argmax(uncertainties), (8, 8))
         return chess.square(file, rank)
@@ -323,6 +509,7 @@ class PiecewiseGrid:
         board.
         :param sense_result: A list of tuples, where each tuple contains a :class:`Square` in the sense, and if there
                              was a piece on the square, then the corresponding :class:`chess.Piece`, otherwise `None`.
+                             A SenseObservation works as well and is read without building pieces.
         :example:
         [
             (A8, Piece(ROOK, BLACK)), (B8, Piece(KNIGHT, BLACK)), (C8, Piece(BISHOP, BLACK)),
@@ -330,14 +517,17 @@ class PiecewiseGrid:
             (A6, None), (B6, None), (C8, None)
         ]
         """
+        # (square, piece symbol or None) pairs, uppercase symbols are our own pieces
+        sense_result = sense_symbols(sense_result)
 
         if len(self.enemy_moves) > 0:
             maxes = self.piece_grids_temp.max(axis=2)
 
             # prune enemy moves that are no longer possible
-            # might not be the most efficient algorithm for this, but it works for now
+            moves = self.enemy_moves
+            keep = np.ones(len(moves), dtype=np.bool_)
             for loc in sense_result:
-                if not loc[1] is None and loc[1].color == chess.WHITE:
+                if not loc[1] is None and loc[1].isupper():
                     continue
 
                 file = chess.square_file(loc[0])
@@ -345,8 +535,7 @@ class PiecewiseGrid:
 
                 # if there was no piece in the square previously and there is one there now, we know that piece moved
                 if maxes[rank, file] < 0.001 and not loc[1] is None:
-                    piece_type = loc[1].symbol()
-                    self.enemy_moves = [x for x in self.enemy_moves if x[1] == piece_type and x[0].to_square == loc[0]] # we know the move ended at this square
+                    keep &= moves.of_type(loc[1]) & moves.by_to[loc[0]] # we know the move ended at this square
 
                 # if we know where a piece is for certain, we can make some inferences
                 if maxes[rank, file] > 0.999:
@@ -354,28 +543,26 @@ class PiecewiseGrid:
                     piece_type = self.piece_types[piece_index]
 
                     if loc[1] == None:  # if it's no longer there, it must have moved. eliminate all moves which don't start from this square and involve this piece
-                        self.enemy_moves = [x for x in self.enemy_moves if x[1] == piece_type and x[0].from_square == loc[0]] # we know the move started at this square
-                    elif loc[1].symbol() == piece_type:  # if it's still there, it can't have moved
-                        self.enemy_moves = [x for x in self.enemy_moves if x[0].from_square != loc[0]]
+                        keep &= moves.of_type(piece_type) & moves.by_from[loc[0]] # we know the move started at this square
+                    elif loc[1] == piece_type:  # if it's still there, it can't have moved
+                        keep &= ~moves.by_from[loc[0]]
 
-                    self.enemy_moves = [x for x in self.enemy_moves if x[0].to_square != loc[0] or x[1] == piece_type]
+                    keep &= ~moves.by_to[loc[0]] | moves.of_type(piece_type)
 
                 if loc[1] is None:
-                    self.enemy_moves = [x for x in self.enemy_moves if x[0].to_square != loc[0]]
+                    keep &= ~moves.by_to[loc[0]]
 
                 # TODO: Add more inferences for how the pieces might have moved
 
             self.piece_grids = self.piece_grids_temp.copy()
+            self.enemy_moves = moves.keep(keep)
 
             if len(self.enemy_moves) == 0: # We literally have no clue what move the enemy could have made
                 # print("The bot has no idea what move the enemy made")
                 pass
             else:
                 # renormalize move probabilities
-                moves, piece_types, chances = zip(*self.enemy_moves)
-                chances = np.array(chances)
-                chances /= np.sum(chances)
-                self.enemy_moves = list(zip(moves, piece_types, chances.tolist()))
+                self.enemy_moves = self.enemy_moves.normalized()
 
         # make a second update to probability grid with more informed enemy moves
         self.update_prob_board_from_moves(self.enemy_moves)
@@ -384,7 +571,7 @@ class PiecewiseGrid:
         handled = [False] * 32
         for loc in sense_result:
             # we don't check our own pieces in the sense result
-            if not loc[1] is None and loc[1].color == chess.WHITE:
+            if not loc[1] is None and loc[1].isupper():
                 continue
 
             file = chess.square_file(loc[0])
@@ -399,8 +586,8 @@ class PiecewiseGrid:
                 piece_index = 0
 
                 for i in range(16):
-                    if self.piece_types[i] == loc[1].symbol() and self.piece_grids[rank, file, i] > max and not handled[i] \
-                            and (not loc[1].symbol() == 'p' or file in self.enemy_pawn_columns[i - 8]):
+                    if self.piece_types[i] == loc[1] and self.piece_grids[rank, file, i] > max and not handled[i] \
+                            and (not loc[1] == 'p' or file in self.enemy_pawn_columns[i - 8]):
                         max = self.piece_grids[rank, file, i]
                         piece_index = i
 
@@ -413,6 +600,9 @@ class PiecewiseGrid:
         divider = self.piece_grids.sum((0, 1)).reshape(1, 1, 32)
         divider[divider < 0.001] = 1
         self.piece_grids /= divider
+        self.project()
+        self.invalidate()
+        self.compact()
 
     def handle_player_move(self, completed_move: chess.Move, captured_piece: bool):
         # player passed and there is nothing to handle
@@ -452,63 +642,85 @@ class PiecewiseGrid:
         divider = self.piece_grids.sum((0, 1)).reshape(1, 1, 32)
         divider[divider < 0.001] = 1
         self.piece_grids /= divider
+        self.invalidate()
+        self.compact()
 
         if np.sum(self.piece_grids[:, :, 4]) < 0.01:
             # print("CODE RED WE LOST THE KING!!!!")
             pass
 
     def gen_certain_board(self):
-        board = chess.Board()
-        board.set_piece_map({})
-        for i in range(32):
-            piece_grid = self.piece_grids[:, :, i]
-            if np.max(piece_grid) > 0.99:
-                location = np.argmax(piece_grid)
-                board.set_piece_at(location, chess.Piece.from_symbol(self.piece_types[i]))
+        return self.certain_board().copy()
 
-        return board
+    def certain_board(self):
+        """
+        :return: cached board of the pieces whose square is certain, not to be modified
+        """
+        if self.certain_board_cache is None:
+            grids = self.grids_view().reshape(64, 32)
+            locations = np.argmax(grids, axis=0)
+            board = chess.Board()
+            # later pieces overwrite earlier ones on the same square, like set_piece_at did
+            board.set_piece_map({int(locations[i]): chess.Piece.from_symbol(self.piece_types[i])
+                                 for i in np.nonzero(np.max(grids, axis=0) > 0.99)[0]})
+            self.certain_board_cache = board
+        return self.certain_board_cache
 
     def gen_board(self):
-        spaces = []
-        piece_map = {}
+        return self.to_board(self.gen_boards(1)[0])
+
+    def gen_boards(self, n: int, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        samples n boards at once. pieces are placed one at a time in order, each on a square drawn from its grid
+        with the squares already taken on that board zeroed out. a piece with nowhere left to go is left off.
+        :param rng: generator to draw from, by default one seeded from numpy's global state
+        :return: (n, 32) int8 array holding the square of each piece on each board, -1 if it isn't on the board
+        """
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2 ** 31))
+        squares = np.full((n, 32), -1, dtype=np.int8)
+        occupied = np.zeros((n, 64), dtype=np.bool_)
+        rows = np.arange(n)
+        # flattened (rank, file) indices of the grids are chess squares
+        pieces, support, probs = self.support()
+        offsets = np.searchsorted(pieces, np.arange(33))
 
         for i in order:
             if not self.captured_list[i] is None:
                 continue
 
-            # transposing from numpy format to board format begins here
-            piece_grid = np.copy(self.piece_grids[:, :, i]).flatten()
-
-            if np.sum(piece_grid) < 0.001:
+            piece_support, piece_probs = support[offsets[i]:offsets[i + 1]], probs[offsets[i]:offsets[i + 1]]
+            if np.sum(piece_probs) < 0.001:
                 continue
 
-            piece_grid_copy = piece_grid.copy()
-            piece_grid[spaces] = 0
-            if np.sum(piece_grid) < 0.001:
-                # print("Oh no, no where to place this piece")
-                #b = chess.Board()
-                #b.set_piece_map(piece_map)
-                ## print(b)
-                # print(piece_grid_copy)
-                pass
-            else:
-                piece_grid /= np.sum(piece_grid)
+            cdf = np.cumsum(np.where(occupied[:, piece_support], 0.0, piece_probs), axis=1)
+            totals = cdf[:, -1]
+            placed = totals >= 0.001
+            # inverse cdf sampling, clipped in case rounding puts the draw past the last square
+            picks = (cdf <= (rng.random(n) * totals)[:, None]).sum(axis=1)
+            picks = piece_support[np.minimum(picks, len(piece_support) - 1)[placed]]
+            squares[placed, i] = picks
+            occupied[rows[placed], picks] = True
 
-                num = np.random.choice(64, 1, p=piece_grid)[0]
-                # and ends here when flattened index is reinterpreted as board index
-                piece_map[num] = chess.Piece.from_symbol(self.piece_types[i])
-
-                spaces.append(num)
+        return squares
 
+    def to_board(self, squares: np.ndarray) -> chess.Board:
+        """
+        :param squares: one row of gen_boards
+        :return: the board it encodes
+        """
         board = chess.Board()
-        board.set_piece_map(piece_map)
+        board.set_piece_map({int(square): chess.Piece.from_symbol(self.piece_types[i])
+                             for i, square in enumerate(squares) if square >= 0})
         return board
 
-    def num_board_states(self) -> int:
-        piece_grids_copy = self.piece_grids.copy()
-        piece_grids_copy[piece_grids_copy == 0] = 1.0 # entropy is zero when probability is zero or one, but log breaks with zero
+    def to_boards(self, squares: np.ndarray) -> List[chess.Board]:
+        return [self.to_board(row) for row in squares]
 
-        entropy = -np.sum(piece_grids_copy * np.log2(piece_grids_copy))
+    def num_board_states(self) -> int:
+        # entropy is zero when probability is zero or one, so only the support counts
+        pieces, squares, probs = self.support()
+        entropy = -np.sum(probs * np.log2(probs))
         entropy = 2 ** entropy
 
         return math.ceil(entropy)
\ No newline at end of file
@@ -7,6 +7,8 @@ from typing import List
 
 
 class RandomSenseEngine(base.SenseEngine):
+    deterministic = False
+
     def choose_sense(self, board: base.InformationSet) -> chess.Square:
         """
         Returns a uniform distribution to sense
@@ -63,7 +63,10 @@ class Net(nn.Module):
         self.fc3 = torch.nn.Linear(128, 1, bias=True)
 
     def forward(self, x):
-        x = torch.tensor(x[None,]).float()
+        x = torch.as_tensor(x).float()
+        if x.dim() == 3:
+            # single position, add the batch dimension
+            x = x[None]
         out = self.layer1(x)
         out = self.layer2(out)
         out = self.layer3(out)
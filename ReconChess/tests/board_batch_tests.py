@@ -0,0 +1,64 @@
+import random
+import unittest
+
+import chess
+import numpy as np
+
+from board_batch import BoardBatch
+from prob_board import PiecewiseGrid
+from util import SenseObservation
+
+
+def random_boards(n, seed=0):
+    random.seed(seed)
+    boards = []
+    for i in range(n):
+        board = chess.Board()
+        for ply in range(random.randint(0, 100)):
+            moves = list(board.pseudo_legal_moves)
+            if len(moves) == 0:
+                break
+            board.push(random.choice(moves))
+        boards.append(board)
+    return boards
+
+
+class BoardBatchTestCases(unittest.TestCase):
+    def test_matches_boards(self):
+        boards = random_boards(50)
+        batch = BoardBatch.from_boards(boards)
+        for i, board in enumerate(batch.to_boards()):
+            self.assertEqual(board.board_fen(), boards[i].board_fen())
+            self.assertEqual(board.turn, boards[i].turn)
+            self.assertEqual(board.castling_rights, boards[i].castling_rights)
+        for color in chess.COLORS:
+            kings = batch.kings(color)
+            self.assertEqual([None if king < 0 else king for king in kings], [board.king(color) for board in boards])
+            for square in [chess.A1, chess.D4, chess.E5, chess.H8]:
+                attackers = batch.attackers(color, np.full(len(boards), square))
+                self.assertEqual([int(mask) for mask in attackers],
+                                 [board.attackers_mask(color, square) for board in boards])
+            self.assertEqual(list(batch.can_capture_king(color)),
+                             [board.king(not color) is None or bool(board.attackers(color, board.king(not color)))
+                              for board in boards])
+
+    def test_material_and_sense(self):
+        board = chess.Board('r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4')
+        batch = BoardBatch.from_boards([board, chess.Board.empty()])
+        self.assertEqual(list(batch.material()), [0, 0])
+        self.assertEqual(batch.piece_counts()[0].sum(), 32)
+        for square in [chess.A1, chess.E7, chess.C4]:
+            self.assertEqual(batch.observations(square)[0], SenseObservation.from_board(board, square))
+            self.assertTrue(all(symbol is None for _, symbol in batch.observations(square)[1].symbols()))
+        self.assertTrue(np.array_equal(batch.attackers(chess.WHITE, [chess.E5, -1]), [chess.BB_F3, 0]))
+
+    def test_from_squares(self):
+        grid = PiecewiseGrid(chess.Board())
+        squares = grid.gen_boards(10, np.random.default_rng(0))
+        boards = BoardBatch.from_squares(squares, grid.piece_types).to_boards()
+        self.assertEqual([board.board_fen() for board in boards],
+                         [board.board_fen() for board in grid.to_boards(squares)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import chess
+import numpy as np
+
+import base as base
+from eval_engine_cache import CachedSimulationEngine
+
+
+class CountingEngine(base.SimulationEngine):
+    def __init__(self):
+        self.scored = []
+
+    def score_boards(self, boards):
+        self.scored.append(len(boards))
+        return np.array([len(board.piece_map()) + 100 * board.turn for board in boards], dtype=np.float64)
+
+    def best_moves(self, boards):
+        return [None] * len(boards)
+
+
+class CachedSimulationEngineTestCases(unittest.TestCase):
+    def test_hits(self):
+        inner = CountingEngine()
+        engine = CachedSimulationEngine(inner)
+        board = chess.Board()
+        moved = chess.Board()
+        moved.push(chess.Move.from_uci('e2e4'))
+
+        np.testing.assert_array_equal(engine.score_boards([board, moved, board.copy()]), [132, 32, 132])
+        self.assertEqual(inner.scored, [2])
+        np.testing.assert_array_equal(engine.score_boards([moved, board]), [32, 132])
+        self.assertEqual(inner.scored, [2])
+        self.assertEqual((engine.hits, engine.misses), (2, 3))
+        # the mirrored board has the other side to move, so it is a different entry
+        engine.score_boards([board.mirror()])
+        self.assertEqual(inner.scored, [2, 1])
+        self.assertEqual(engine.best_moves([board]), [None])
+
+    def test_eviction(self):
+        boards = []
+        board = chess.Board()
+        for uci in ['e2e4', 'e7e5', 'g1f3', 'b8c6']:
+            board.push(chess.Move.from_uci(uci))
+            boards.append(board.copy())
+
+        for eviction in ['lru', 'clock']:
+            inner = CountingEngine()
+            engine = CachedSimulationEngine(inner, capacity=2, eviction=eviction)
+            engine.score_boards(boards[:2])
+            engine.score_boards(boards[:1])
+            engine.score_boards(boards[2:3])
+            self.assertEqual(len(engine), 2)
+            engine.score_boards(boards[:1])
+            # the recently used first board survived, the second one was evicted
+            self.assertEqual(inner.scored, [2, 1], eviction)
+            engine.score_boards(boards[1:2])
+            self.assertEqual(inner.scored, [2, 1, 1], eviction)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import random
+import unittest
+
+import chess
+
+from game import Game, MoveCache, SimGame
+from util import SenseObservation, mirror_sense_result
+
+
+def reference_moves(board, turn):
+    # pseudo legal moves once the opponent's pieces are taken off, plus every diagonal pawn move
+    no_opponents = board.copy()
+    for square in chess.SquareSet(board.occupied_co[not turn]):
+        no_opponents.remove_piece_at(square)
+    moves = list(no_opponents.generate_pseudo_legal_moves())
+    for square in board.pieces(chess.PAWN, turn):
+        for attacked_square in board.attacks(square):
+            if not no_opponents.piece_at(attacked_square):
+                promotions = chess.PIECE_TYPES[1:-1] if chess.square_rank(attacked_square) in [0, 7] else []
+                moves += [chess.Move(square, attacked_square)] + \
+                    [chess.Move(square, attacked_square, promotion) for promotion in promotions]
+    return moves
+
+
+class GameTestCases(unittest.TestCase):
+    def test_get_moves(self):
+        random.seed(0)
+        game = Game()
+        for ply in range(80):
+            for turn in chess.COLORS:
+                game.turn = turn
+                self.assertEqual(game.get_moves(), reference_moves(game.truth_board, turn))
+            moves = list(game.truth_board.pseudo_legal_moves)
+            if len(moves) == 0 or game.truth_board.king(chess.WHITE) is None or \
+                    game.truth_board.king(chess.BLACK) is None:
+                break
+            game.truth_board.push(random.choice(moves))
+        # the cached list is handed out as a copy
+        game.get_moves().clear()
+        self.assertEqual(game.get_moves(), reference_moves(game.truth_board, game.turn))
+
+    def test_moves_without_opponent_pieces(self):
+        # positions with castling, en passant and promotions, where opponent pieces block castling or get in the way
+        random.seed(0)
+        game = Game()
+        for fen in ['r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPpP/R3K2R w KQkq - 0 1',
+                    'r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1', 'r3k1nr/1P6/8/2pP4/8/8/6p1/R2QK2R w KQkq c6 0 1']:
+            board = chess.Board(fen)
+            for ply in range(40):
+                masked = game._without_opponent_pieces(board, board.turn)
+                self.assertEqual(game._moves_without_opponent_pieces(board, board.turn),
+                                 list(masked.generate_pseudo_legal_moves()))
+                moves = list(board.pseudo_legal_moves)
+                if len(moves) == 0:
+                    break
+                board.push(random.choice(moves))
+
+    def test_move_cache_capacity(self):
+        Game.set_move_cache_capacity(2)
+        try:
+            game = Game()
+            for move in ['e2e4', 'e7e5', 'g1f3', 'b8c6']:
+                game.get_moves()
+                game.turn = not game.turn
+                game.truth_board.push(chess.Move.from_uci(move))
+                self.assertLessEqual(len(Game.rbc_moves.entries), 2)
+            # moves are still checked against the cached set when a move is made
+            self.assertIsNone(game.handle_move(chess.Move(chess.E1, chess.E8))[1])
+            game.truth_board.pop()
+            self.assertEqual(game.handle_move(chess.Move(chess.F1, chess.B5))[1], chess.Move(chess.F1, chess.B5))
+        finally:
+            Game.set_move_cache_capacity(MoveCache().capacity)
+
+    def test_sense(self):
+        game = Game()
+        game.truth_board = chess.Board('r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4')
+        for square in [chess.A1, chess.E7, chess.C4, chess.H5]:
+            observation = game.sense(square)
+            self.assertEqual(observation.pieces(), game.handle_sense(square))
+            self.assertEqual(SenseObservation.from_result(square, game.handle_sense(square)), observation)
+            mirrored = mirror_sense_result(game.handle_sense(square))
+            self.assertEqual(observation.mirror(), SenseObservation.from_result(63 - square, mirrored))
+            self.assertEqual(sorted(observation.mirror().pieces()), sorted(mirrored))
+            self.assertEqual(observation.mirror().mirror(), observation)
+        self.assertEqual(game.sense(chess.A1).symbols(),
+                         [(chess.A2, 'P'), (chess.B2, 'P'), (chess.A1, 'R'), (chess.B1, 'N')])
+
+
+class SimGameTestCases(unittest.TestCase):
+    def test_matches_game(self):
+        random.seed(0)
+        game, sim_game = Game(), SimGame()
+        for ply in range(60):
+            if game.is_over():
+                break
+            # requested moves include pawn captures onto empty squares and moves through hidden pieces
+            move = random.choice(game.get_moves())
+            self.assertEqual(sim_game.push(move), game.handle_move(move))
+            self.assertEqual(sim_game.truth_board, game.truth_board)
+            self.assertEqual(sim_game.opponent_move_result(), game.opponent_move_result())
+            self.assertEqual(sim_game.handle_sense(chess.D4), game.handle_sense(chess.D4))
+            game.turn = sim_game.turn = not game.turn
+        self.assertEqual(sim_game.is_over(), game.is_over())
+
+    def test_push_pop(self):
+        sim_game = SimGame(chess.Board('4k3/8/8/p7/8/8/8/R3K3 w - - 0 1'))
+        # the rook is stopped by the pawn on its way and takes it
+        _, taken_move, captured_square, _ = sim_game.push(chess.Move(chess.A1, chess.A8))
+        self.assertEqual(taken_move, chess.Move(chess.A1, chess.A5))
+        self.assertEqual(captured_square, chess.A5)
+        sim_game.push(None)
+        self.assertIsNone(sim_game.opponent_move_result())
+        sim_game.pop()
+        self.assertEqual(sim_game.opponent_move_result(), chess.A5)
+        sim_game.pop()
+        self.assertEqual(sim_game.truth_board, chess.Board('4k3/8/8/p7/8/8/8/R3K3 w - - 0 1'))
+        self.assertIsNone(sim_game.opponent_move_result())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+import chess
+import numpy as np
+
+import geometry
+
+
+class GeometryTestCases(unittest.TestCase):
+    def test_knight_distances(self):
+        self.assertEqual(geometry.KNIGHT_DISTANCES[chess.A1, chess.H8], 6)
+        self.assertEqual(geometry.KNIGHT_DISTANCES[chess.A1, chess.B2], 4)
+        hop = geometry.KNIGHT_NEXT_HOPS[chess.G1, chess.E6]
+        self.assertIn(hop, geometry.KNIGHT_SQUARES[chess.G1])
+        self.assertEqual(geometry.KNIGHT_DISTANCES[hop, chess.E6], geometry.KNIGHT_DISTANCES[chess.G1, chess.E6] - 1)
+
+    def test_restricted_knight_distances(self):
+        # without the second rank the knight has to go around, c2 can't be reached at all
+        allowed = [chess.square_rank(square) != 1 for square in chess.SQUARES]
+        distances, next_hops = geometry.knight_distances(allowed)
+        self.assertEqual(distances[chess.A1, chess.A3], 4)
+        self.assertEqual(next_hops[chess.A1, chess.A3], chess.B3)
+        self.assertEqual(distances[chess.A1, chess.C2], -1)
+
+    def test_between(self):
+        self.assertEqual(geometry.BETWEEN_SQUARES[chess.H8][chess.E5], [chess.G7, chess.F6])
+        self.assertEqual(geometry.BETWEEN_SQUARES[chess.A1][chess.B3], [])
+        self.assertEqual(int(geometry.BETWEEN_MASKS[chess.E1, chess.A1]), chess.between(chess.E1, chess.A1))
+
+    def test_sense_windows(self):
+        self.assertEqual(geometry.SENSE_WINDOWS[chess.H1], (chess.G2, chess.H2, chess.G1, chess.H1))
+        self.assertEqual(len(geometry.SENSE_WINDOWS[chess.E4]), 9)
+        self.assertTrue(np.all([len(window) >= 4 for window in geometry.SENSE_WINDOWS.values()]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import chess
+import numpy as np
+
+from engines import Game, ParticleInformationSet
+from info_set_particle import RESAMPLERS
+
+
+class ParticleInformationSetTestCases(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_sense_filters_particles(self):
+        info_set = ParticleInformationSet(Game(), num_particles=128)
+        info_set.propagate_opponent_move([], False, None)
+        # the e pawn was seen on e5, so every board should have it there
+        info_set.update_with_sense([(chess.E5, chess.Piece(chess.PAWN, chess.BLACK)), (chess.E7, None)])
+        for game in info_set.random_samples(20):
+            self.assertEqual(game.truth_board.piece_at(chess.E5), chess.Piece(chess.PAWN, chess.BLACK))
+            self.assertIsNone(game.truth_board.piece_at(chess.E7))
+
+    def test_capture(self):
+        game = Game()
+        game.truth_board = chess.Board('4k3/8/8/8/3q4/8/8/R3K3 w - - 0 1')
+        info_set = ParticleInformationSet(game, num_particles=32)
+        info_set.propagate_opponent_move([], True, chess.A1)
+        # only the queen can have taken the rook
+        board = info_set.random_sample().truth_board
+        self.assertEqual(board.piece_at(chess.A1), chess.Piece(chess.QUEEN, chess.BLACK))
+        self.assertEqual(len(board.piece_map()), 3)
+        self.assertEqual(info_set.size(), 1)
+
+    def test_own_move(self):
+        game = Game()
+        game.truth_board = chess.Board('r3k3/8/8/8/8/8/8/4K2R w K - 0 1')
+        info_set = ParticleInformationSet(game, num_particles=16)
+        info_set.update_with_move((chess.Move(chess.E1, chess.G1), False))
+        board = info_set.random_sample().truth_board
+        self.assertEqual(board.piece_at(chess.G1), chess.Piece(chess.KING, chess.WHITE))
+        self.assertEqual(board.piece_at(chess.F1), chess.Piece(chess.ROOK, chess.WHITE))
+        self.assertAlmostEqual(np.sum(info_set.raw), 4.0)
+
+    def test_resamplers(self):
+        weights = np.array([0.5, 0.0, 0.25, 0.25])
+        for name, resample in RESAMPLERS.items():
+            indices = resample(weights, 400, np.random.default_rng(0))
+            self.assertEqual(len(indices), 400, name)
+            self.assertNotIn(1, indices, name)
+            self.assertAlmostEqual(np.mean(indices == 0), 0.5, delta=0.1, msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
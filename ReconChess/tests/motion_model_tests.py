@@ -0,0 +1,47 @@
+import unittest
+
+import chess
+import numpy as np
+
+from motion_model import MotionModel
+from prob_board import PiecewiseGrid
+
+
+class MotionModelTestCases(unittest.TestCase):
+    def test_certain_board(self):
+        grid = PiecewiseGrid(chess.Board())
+        grids = MotionModel().propagate(grid.piece_grids, grid.piece_types)
+        # black has 20 moves at the start, each as likely as the others
+        knight, pawn = grid.piece_types.index('n', 5), grid.piece_types.index('p')
+        self.assertAlmostEqual(grids[5, 5, knight], 1 / 20)
+        self.assertAlmostEqual(grids[7, 6, knight], 18 / 20)
+        self.assertAlmostEqual(grids[4, 0, pawn], 1 / 20)
+        self.assertAlmostEqual(grids[6, 0, pawn], 18 / 20)
+        # the back rank is blocked in and our pieces don't move
+        self.assertTrue(np.array_equal(grids[:, :, grid.piece_types.index('r')], grid.piece_grids[:, :, 0]))
+        self.assertTrue(np.array_equal(grids[:, :, 16:], grid.piece_grids[:, :, 16:]))
+        self.assertTrue(np.allclose(grids.sum(axis=(0, 1)), 1.0))
+
+    def test_uncertain_blocker(self):
+        grid = PiecewiseGrid(chess.Board('r3k3/8/8/8/8/8/8/4K3 w - - 0 1'))
+        rook, king = grid.piece_types.index('r'), grid.piece_types.index('k')
+        # the king may be standing on a6, in the way of the rook half of the time
+        grid.piece_grids[:, :, king] = 0
+        grid.piece_grids[7, 4, king] = grid.piece_grids[5, 0, king] = 0.5
+        grids = MotionModel(movers='r').propagate(grid.piece_grids, grid.piece_types)
+        self.assertAlmostEqual(grids[6, 0, rook] / grids[3, 0, rook], 2.0)
+        self.assertAlmostEqual(grids[5, 0, rook] / grids[6, 0, rook], 0.5)
+        self.assertTrue(np.array_equal(grids[:, :, king], grid.piece_grids[:, :, king]))
+
+    def test_handle_enemy_move(self):
+        grid = PiecewiseGrid(chess.Board(), motion_model=MotionModel(movers='n'))
+        grid.handle_enemy_move([], False, None)
+        knight = grid.piece_types.index('n')
+        self.assertAlmostEqual(grid.piece_grids[5, 2, knight], 0.25)
+        grid.handle_sense_result([(chess.C6, chess.Piece(chess.KNIGHT, chess.BLACK))])
+        self.assertAlmostEqual(grid.piece_grids[5, 2, knight], 1.0)
+        self.assertAlmostEqual(grid.piece_grids[7, 1, knight], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import base as base
+from engines import ISMCTSPolicyEngine, PiecewiseSenseEngine, RandomEvaluationEngine, PiecewiseInformationSet, \
+    ExpUCB, RootParallelISMCTSPolicyEngine
+from game import Game
+
+
+def search_engine():
+    engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+    return ISMCTSPolicyEngine(engine_spec, num_iters=10)
+
+
+class FailingPolicyEngine(ISMCTSPolicyEngine):
+    def mcts(self, *args, **kwargs):
+        raise ValueError('search failed')
+
+
+def failing_search_engine():
+    engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+    return FailingPolicyEngine(engine_spec, num_iters=10)
+
+
+class RootParallelTestCases(unittest.TestCase):
+    def test_merged_statistics(self):
+        with RootParallelISMCTSPolicyEngine(search_engine, num_workers=2, seed=0) as policy_engine:
+            policy = policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+            worker_statistics = policy_engine.worker_statistics
+            self.assertEqual(len(worker_statistics), 2)
+            self.assertGreater(worker_statistics[0].visit_count, 0)
+            self.assertEqual(policy_engine.statistics.visit_count,
+                             sum(statistics.visit_count for statistics in worker_statistics))
+            self.assertEqual(policy.shape, (8, 8, 73))
+            # the workers stay up for the next search
+            policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+            self.assertEqual(policy_engine.num_searches, 2)
+
+    def test_worker_error(self):
+        with RootParallelISMCTSPolicyEngine(failing_search_engine, num_workers=2, seed=0) as policy_engine:
+            with self.assertRaisesRegex(RuntimeError, 'search worker failed') as context:
+                policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+            # the worker's exception is the cause, its traceback is in the message
+            self.assertIsInstance(context.exception.__cause__, ValueError)
+            self.assertIn('ValueError: search failed', str(context.exception))
+            # both workers answered, so the next search fails the same way instead of hanging
+            with self.assertRaisesRegex(RuntimeError, 'search worker failed'):
+                policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+
+
+if __name__ == '__main__':
+    unittest.main()
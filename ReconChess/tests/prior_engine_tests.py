@@ -0,0 +1,85 @@
+import random
+import unittest
+
+import chess
+
+import base as base
+from engines import CaptureHeuristicPrior, ExpUCB, PiecewiseInformationSet, PiecewiseSenseEngine, \
+    RandomEvaluationEngine, Net, NetworkPolySimEngine, NetworkPrior
+from game import Game
+
+
+def capture_game():
+    game = Game()
+    game.truth_board = chess.Board('4k3/8/8/3q4/4P3/8/8/4K3 w - - 0 1')
+    return game
+
+
+class CountingPolicyEngine(NetworkPolySimEngine):
+    def __init__(self):
+        super().__init__(Net())
+        self.calls = 0
+
+    def generate_policy(self, self_info_set):
+        self.calls += 1
+        return super().generate_policy(self_info_set)
+
+
+class PriorEngineTestCases(unittest.TestCase):
+    def test_capture_prior(self):
+        game = capture_game()
+        moves = [chess.Move(chess.E1, chess.E2), chess.Move(chess.E4, chess.D5), chess.Move(chess.E4, chess.E5)]
+        priors = CaptureHeuristicPrior().move_priors(None, game, moves)
+        self.assertEqual(list(priors), [0, 89, 0])
+
+    def test_limit(self):
+        widening = base.ProgressiveWidening(CaptureHeuristicPrior(), c=2.0, alpha=0.5)
+        self.assertEqual(widening.limit(0), 1)
+        self.assertEqual(widening.limit(1), 2)
+        self.assertEqual(widening.limit(100), 20)
+
+    def test_admitted_moves_grow(self):
+        widening = base.ProgressiveWidening(CaptureHeuristicPrior(), c=1.0)
+        game = capture_game()
+        random.seed(0)
+        admitted = []
+        for visit_count in range(30):
+            # most moves share a prior of 0, the order they come in mustn't matter
+            moves = game.get_moves()
+            random.shuffle(moves)
+            admitted.append(set(widening.admit(None, game, moves, moves, visit_count)))
+        for n in range(len(admitted) - 1):
+            self.assertLessEqual(admitted[n], admitted[n + 1])
+        self.assertIn(chess.Move(chess.E4, chess.D5), admitted[0])
+        self.assertEqual(len(admitted[-1]), widening.limit(29))
+
+    def test_widened_selection(self):
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        widening = base.ProgressiveWidening(CaptureHeuristicPrior(), c=1.0)
+        root = base.SelfNode(PiecewiseInformationSet(capture_game()), chess.WHITE, None, None)
+        game = capture_game()
+        play_node = root.traverse(game, chess.E4, engine_spec)
+        play_node.expand(game, engine_spec)
+        # an unvisited node only admits the move with the best prior
+        self.assertEqual(play_node.select_child(game, engine_spec.ucb_engine, 1, widening),
+                         chess.Move(chess.E4, chess.D5))
+
+
+    def test_network_prior_cache(self):
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        policy_engine = CountingPolicyEngine()
+        widening = base.ProgressiveWidening(NetworkPrior(policy_engine), c=1.0)
+        root = base.SelfNode(PiecewiseInformationSet(capture_game()), chess.WHITE, None, None)
+        game = capture_game()
+        play_node = root.traverse(game, chess.E4, engine_spec)
+        play_node.expand(game, engine_spec)
+        for i in range(1, 6):
+            play_node.select_child(game, engine_spec.ucb_engine, i, widening)
+        self.assertEqual(policy_engine.calls, 1)
+        # a new root belief is passed on to the play node, which needs a new policy
+        root.info_set = PiecewiseInformationSet(capture_game())
+        play_node.select_child(game, engine_spec.ucb_engine, 6, widening)
+        self.assertEqual(policy_engine.calls, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from copy import copy
+
+import chess
+import numpy as np
+
+import geometry
+from prob_board import PiecewiseGrid
+
+
+def capture_grid(fen):
+    grid = PiecewiseGrid(chess.Board(fen))
+    chances = grid.capture_chances(chess.D4)
+    return {symbol: chances[[i for i in range(16) if grid.piece_types[i] == symbol]].sum() for symbol in 'rnbqkp'}
+
+
+class PiecewiseGridTestCases(unittest.TestCase):
+    def test_capture_chances(self):
+        chances = capture_grid('3rk3/b7/8/4pn2/3N4/8/8/4K3 w - - 0 1')
+        self.assertEqual(chances, {'r': 1.0, 'n': 1.0, 'b': 1.0, 'q': 0.0, 'k': 0.0, 'p': 1.0})
+
+    def test_blocked_capture(self):
+        # the rook is blocked by a pawn of ours, the bishop by one of its own pawns
+        chances = capture_grid('3rk3/b7/1p1P4/8/3N4/8/8/4K3 w - - 0 1')
+        self.assertEqual(chances['r'], 0.0)
+        self.assertEqual(chances['b'], 0.0)
+
+    def test_capture_square_checked(self):
+        grid = PiecewiseGrid(chess.Board())
+        for square in [True, None, 64]:
+            with self.assertRaises(ValueError):
+                grid.capture_chances(square)
+
+    def test_handle_enemy_move(self):
+        grid = PiecewiseGrid(chess.Board('3rk3/8/8/8/3N4/8/8/4K3 w - - 0 1'))
+        grid.handle_enemy_move([], True, chess.D4)
+        rook = grid.piece_types.index('r')
+        self.assertAlmostEqual(grid.piece_grids[3, 3, rook], 1.0)
+        self.assertAlmostEqual(np.sum(grid.piece_grids[:, :, rook]), 1.0)
+
+    def test_gen_boards(self):
+        grid = PiecewiseGrid(chess.Board())
+        # spread the enemy queen over two squares, one of which the king also might be on
+        queen, king = grid.piece_types.index('q'), grid.piece_types.index('k')
+        grid.piece_grids[:, :, queen] = 0
+        grid.piece_grids[4, 3, queen] = grid.piece_grids[7, 4, queen] = 0.5
+        squares = grid.gen_boards(1000, np.random.default_rng(0))
+        self.assertEqual(squares.shape, (1000, 32))
+        self.assertTrue(np.all(squares[:, king] == chess.E8))
+        # the king is placed first, so the queen is pushed off e8
+        self.assertTrue(np.all(squares[:, queen] == chess.D5))
+        boards = grid.to_boards(squares[:2])
+        self.assertEqual(boards[0].piece_at(chess.D5), chess.Piece(chess.QUEEN, chess.BLACK))
+        self.assertEqual(len(boards[0].piece_map()), 32)
+
+    def test_gen_boards_distribution(self):
+        grid = PiecewiseGrid(chess.Board('4k3/8/8/8/8/8/8/4K3 w - - 0 1'))
+        king = grid.piece_types.index('k')
+        grid.piece_grids[:, :, king] = 0
+        grid.piece_grids[7, 4, king], grid.piece_grids[7, 3, king] = 0.25, 0.75
+        squares = grid.gen_boards(4000, np.random.default_rng(0))
+        self.assertAlmostEqual(np.mean(squares[:, king] == chess.D8), 0.75, delta=0.03)
+        self.assertTrue(np.all(squares[:, grid.piece_types.index('q')] == -1))
+
+    def test_certain_board_cache(self):
+        grid = PiecewiseGrid(chess.Board())
+        self.assertEqual(grid.gen_certain_board(), chess.Board())
+        uncertainty = grid.get_board_uncertainty()
+        grid.handle_player_move(chess.Move(chess.E2, chess.E4), False)
+        board = chess.Board()
+        board.push(chess.Move(chess.E2, chess.E4))
+        self.assertEqual(grid.gen_certain_board().board_fen(), board.board_fen())
+        # the king can now be attacked along the opened file
+        self.assertGreater(grid.get_board_uncertainty()[1, 4], uncertainty[1, 4])
+
+    def test_sparse_grid(self):
+        dense, sparse = PiecewiseGrid(chess.Board()), PiecewiseGrid(chess.Board(), sparse=True)
+        for grid in (dense, sparse):
+            grid.handle_player_move(chess.Move(chess.E2, chess.E4), False)
+            moves = [(chess.Move(chess.E7, chess.E5), 'p', 0.5), (chess.Move(chess.D7, chess.D5), 'p', 0.5)]
+            grid.handle_enemy_move(moves, False, None)
+            grid.handle_sense_result([(chess.D5, None)])
+        self.assertEqual(sparse.choose_sense(), dense.choose_sense())
+        self.assertTrue(np.array_equal(sparse.gen_boards(20, np.random.default_rng(0)),
+                                       dense.gen_boards(20, np.random.default_rng(0))))
+        copied = copy(sparse)
+        self.assertLess(copied.nbytes() * 10, dense.nbytes())
+        self.assertTrue(np.array_equal(copied.piece_grids, dense.piece_grids))
+
+    def test_enemy_move_pruning(self):
+        grid = PiecewiseGrid(chess.Board())
+        moves = [(chess.Move(chess.G8, chess.F6), 'n', 0.25), (chess.Move(chess.E7, chess.E5), 'p', 0.25),
+                 (chess.Move(chess.D7, chess.D5), 'p', 0.5)]
+        grid.handle_enemy_move(moves, False, None)
+        self.assertEqual(len(grid.enemy_moves), 4)  # the knight move could have been made by either knight
+        # d5 and e5 are seen empty, so the knight moved
+        grid.handle_sense_result([(chess.D5, None), (chess.E5, None)])
+        self.assertEqual(len(grid.enemy_moves), 2)
+        self.assertTrue(np.all(grid.enemy_moves.rows['chance'] == 1.0))
+        knight = grid.piece_types.index('n', 5)
+        self.assertAlmostEqual(grid.piece_grids[5, 5, knight], 1.0)
+
+    def test_project(self):
+        grid = PiecewiseGrid(chess.Board('3rk3/8/8/8/8/8/8/4K3 w - - 0 1'))
+        rook, king = grid.piece_types.index('r'), grid.piece_types.index('k')
+        # both enemy pieces are more likely on d5 than anywhere else, and our king may be there as well
+        for piece, other in ((rook, chess.D8), (king, chess.E8)):
+            grid.piece_grids[:, :, piece] = 0
+            grid.piece_grids[4, 3, piece], grid.piece_grids[other // 8, other % 8, piece] = 0.75, 0.25
+        grid.handle_player_move(chess.Move(chess.E1, chess.D5), False)
+        grid.project()
+        self.assertAlmostEqual(grid.piece_grids[4, 3, rook], 0.0)
+        self.assertAlmostEqual(grid.piece_grids[7, 3, rook], 1.0)
+
+        grid.handle_player_move(chess.Move(chess.D5, chess.A1), False)
+        grid.piece_grids[4, 3, [rook, king]] = 0.75
+        grid.piece_grids[7, 3, rook] = grid.piece_grids[7, 4, king] = 0.25
+        grid.project()
+        self.assertLessEqual(np.max(grid.piece_grids.sum(axis=2)), 1.001)
+        self.assertTrue(np.allclose(grid.piece_grids[:, :, [rook, king]].sum(axis=(0, 1)), 1.0))
+        self.assertAlmostEqual(grid.piece_grids[7, 3, rook], grid.piece_grids[7, 4, king], places=3)
+
+    def test_window_sums(self):
+        sums = geometry.window_sums(np.ones((8, 8)))
+        self.assertEqual(sums[0, 0], 4)
+        self.assertEqual(sums[0, 3], 6)
+        self.assertEqual(sums[4, 4], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import time
+import unittest
+
+import base as base
+from engines import ISMCTSPolicyEngine, PiecewiseSenseEngine, RandomEvaluationEngine, PiecewiseInformationSet, ExpUCB
+from game import Game
+from time_manager import TimeManager
+
+
+class TimeManagerTestCases(unittest.TestCase):
+    def test_allocate(self):
+        time_manager = TimeManager(expected_game_length=50, min_moves_left=10, safety_margin=2.0, max_move_time=30.0)
+        self.assertAlmostEqual(time_manager.allocate(602.0), 12.0)
+        time_manager.moves_played = 45
+        self.assertAlmostEqual(time_manager.allocate(102.0), 10.0)
+        self.assertEqual(time_manager.allocate(10000.0), 30.0)
+        self.assertEqual(time_manager.allocate(1.0), 0.0)
+
+    def test_deadline(self):
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        policy_engine = ISMCTSPolicyEngine(engine_spec, num_iters=10)
+
+        policy_engine.generate_policy(PiecewiseInformationSet(Game()), time_budget=0.0)
+        self.assertEqual(policy_engine.trees[0].visit_count, 1)
+
+        start = time.monotonic()
+        policy_engine.generate_policy(PiecewiseInformationSet(Game()), time_budget=0.5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+        self.assertGreater(policy_engine.trees[0].visit_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
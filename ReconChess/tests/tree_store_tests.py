@@ -0,0 +1,214 @@
+import random
+import unittest
+
+import chess
+import numpy as np
+
+import base as base
+from engines import ISMCTSPolicyEngine, PiecewiseSenseEngine, RandomEvaluationEngine, PiecewiseInformationSet, ExpUCB
+from game import Game, SimGame
+from tree_store import TreeStore
+
+
+def run_search(tree_backend, num_iters=20, seed=0, **kwargs):
+    random.seed(seed)
+    np.random.seed(seed)
+    engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+    policy_engine = ISMCTSPolicyEngine(engine_spec, num_iters=num_iters, tree_backend=tree_backend, **kwargs)
+    policy = policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+    return policy_engine, policy
+
+
+class CountingEvaluationEngine(RandomEvaluationEngine):
+    def __init__(self):
+        self.batch_sizes = []
+
+    def score_boards(self, boards):
+        self.batch_sizes.append(len(boards))
+        return super().score_boards(boards)
+
+
+class CountingSenseEngine(PiecewiseSenseEngine):
+    def __init__(self):
+        self.calls = 0
+
+    def choose_sense(self, board):
+        self.calls += 1
+        return super().choose_sense(board)
+
+
+class TreeStoreTestCases(unittest.TestCase):
+    def test_grow(self):
+        store = TreeStore(capacity=2)
+        root = store.root(base.SelfNode, PiecewiseInformationSet(Game()), chess.WHITE)
+        for edge in range(10):
+            root.children[edge] = base.SelfNode.new(root, edge)
+        self.assertEqual(store.size, 11)
+        self.assertEqual(list(root.children.keys()), list(range(10)))
+        self.assertEqual(root.children[3].parent, root)
+
+    def test_backprop(self):
+        store = TreeStore()
+        root = store.root(base.OpponentNode, PiecewiseInformationSet(Game()), chess.WHITE)
+        root.children['_pass'] = base.SelfNode.new(root, '_pass')
+        root.children['_pass'].backprop(5.0)
+        root.children['_pass'].backprop(-1.0)
+        self.assertEqual(root.visit_count, 2)
+        self.assertEqual(root.total_reward, 4.0)
+        self.assertEqual(root.first.visit_count, 2)
+
+    def test_lazy_beliefs(self):
+        root = base.SelfNode(PiecewiseInformationSet(Game()), chess.WHITE, incoming_edge=None, parent=None,
+                             belief_cache=base.BeliefCache(capacity=1))
+        play_node = base.PlayNode.new(root, chess.E7, Game().handle_sense(chess.E7))
+        move = chess.Move(chess.E2, chess.E4)
+        first = base.OpponentNode.new(play_node, (move, move, None), None)
+        second = base.OpponentNode.new(play_node, (move, None, None), None)
+        self.assertIsNone(first.belief)
+        self.assertEqual(len(root.belief_cache), 0)
+
+        grids = first.info_set.raw.copy()
+        self.assertEqual(grids[3, 4, 28], 1.0)
+        second.info_set
+        self.assertEqual(len(root.belief_cache), 1)
+        np.testing.assert_array_equal(first.info_set.raw, grids)
+
+    def test_matches_object_backend(self):
+        object_engine, object_policy = run_search('object')
+        array_engine, array_policy = run_search('array')
+        np.testing.assert_array_equal(object_policy, array_policy)
+        for object_tree, array_tree in zip(object_engine.trees, array_engine.trees):
+            self.assertEqual(object_tree.visit_count, array_tree.visit_count)
+            self.assertAlmostEqual(object_tree.total_reward, array_tree.total_reward)
+            self.assertEqual(list(object_tree.children.keys()), list(array_tree.children.keys()))
+
+    def test_threaded_search(self):
+        for tree_backend in ['object', 'array']:
+            policy_engine, policy = run_search(tree_backend, num_iters=40, num_threads=4, virtual_loss=1e6)
+            root = policy_engine.trees[0]
+            self.assertEqual(root.visit_count, 40)
+            # every virtual loss has been settled again
+            self.assertLess(abs(root.total_reward), 1e6)
+            self.assertEqual(sum(child.visit_count for child in root.children.values()), 40)
+
+    def test_batched_search(self):
+        sim_engine = CountingEvaluationEngine()
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), sim_engine, ExpUCB())
+        policy_engine = ISMCTSPolicyEngine(engine_spec, num_iters=20, batch_size=8, virtual_loss=1e6)
+        policy_engine.generate_policy(PiecewiseInformationSet(Game()))
+        # both players share the engine, so each batch is scored in a single call
+        self.assertEqual(sim_engine.batch_sizes, [16, 16, 8])
+        root = policy_engine.trees[0]
+        self.assertEqual(root.visit_count, 20)
+        self.assertLess(abs(root.total_reward), 1e6)
+
+    def test_tree_reuse(self):
+        for tree_backend in ['object', 'array']:
+            random.seed(0)
+            np.random.seed(0)
+            engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+            policy_engine = ISMCTSPolicyEngine(engine_spec, num_iters=100, tree_backend=tree_backend,
+                                               reuse_trees=True)
+            info_set = PiecewiseInformationSet(Game())
+            policy_engine.generate_policy(info_set)
+
+            play_node = policy_engine.trees[0].children[policy_engine.reuse_path[0]]
+            move, opponent_node = max(play_node.children.items(), key=lambda item: item[1].visit_count)
+            self_node = opponent_node.children['_pass']
+            sense = list(self_node.children.keys())[0]
+            visits = self_node.visit_count
+            sense_visits = self_node.children[sense].visit_count
+
+            policy_engine.observe_move(move)
+            policy_engine.observe_opponent_move(None)
+            policy_engine.observe_sense(*sense)
+            policy_engine.generate_policy(info_set)
+            root = policy_engine.trees[0]
+            self.assertIsNone(root.parent)
+            self.assertEqual(root.visit_count, visits + 100)
+            self.assertGreaterEqual(root.children[sense].visit_count, sense_visits)
+
+    def test_lazy_expansion(self):
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        for root in [base.SelfNode(PiecewiseInformationSet(Game()), chess.WHITE, None, None),
+                     TreeStore().root(base.SelfNode, PiecewiseInformationSet(Game()), chess.WHITE)]:
+            game = Game()
+            play_node = root.traverse(game, chess.E2, engine_spec)
+            play_node.expand(game, engine_spec)
+            self.assertEqual(len(play_node.children), 0)
+            self.assertEqual(len(play_node.candidates), len(game.get_moves()))
+
+            move = play_node.select_child(game, engine_spec.ucb_engine, 1)
+            opponent_node = play_node.traverse(game, move, engine_spec)
+            self.assertEqual(list(play_node.children.keys()), [move])
+            self.assertEqual(opponent_node.incoming_edge[1], move)
+
+    def test_lazy_expansion_revised_moves(self):
+        # the rook's moves past a5 are cut short by the pawn, so they share the child of the capture
+        fen = '4k3/8/8/8/p7/8/8/R3K3 w - - 0 1'
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        visits = []
+        for lazy in (True, False):
+            random.seed(0)
+            game = SimGame(chess.Board(fen))
+            root = base.SelfNode(PiecewiseInformationSet(Game()), chess.WHITE, None, None)
+            play_node = root.traverse(game, chess.E2, engine_spec)
+            play_node.expand(game, engine_spec, lazy)
+            for i in range(1, 100):
+                child = play_node.traverse(game, play_node.select_child(game, engine_spec.ucb_engine, i),
+                                           engine_spec)
+                game.pop()
+                child.visit_count += 1
+                play_node.visit_count += 1
+            visits.append({move: child.visit_count for move, child in play_node.children.items()})
+        self.assertEqual(visits[0], visits[1])
+        self.assertNotIn(chess.Move(chess.A1, chess.A8), visits[0])
+        self.assertLessEqual(max(visits[0].values()) - min(visits[0].values()), 1)
+
+    def test_lazy_expansion_availability(self):
+        # children created late keep the availability they gathered before, as if they had been there all along
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        availability = []
+        for lazy, store in [(True, None), (True, TreeStore()), (False, None)]:
+            random.seed(0)
+            game = SimGame(chess.Board())
+            root = base.SelfNode(PiecewiseInformationSet(Game()), chess.WHITE, None, None) if store is None else \
+                store.root(base.SelfNode, PiecewiseInformationSet(Game()), chess.WHITE)
+            play_node = root.traverse(game, chess.E2, engine_spec)
+            play_node.expand(game, engine_spec, lazy)
+            for i in range(1, 60):
+                child = play_node.traverse(game, play_node.select_child(game, engine_spec.ucb_engine, i),
+                                           engine_spec)
+                game.pop()
+                child.visit_count += 1
+                play_node.visit_count += 1
+            availability.append({move: child.availability_count for move, child in play_node.children.items()})
+        self.assertEqual(availability[0], availability[1])
+        self.assertEqual(availability[0], {move: availability[2][move] for move in availability[0]})
+        self.assertEqual(set(availability[0].values()), {59})
+
+    def test_search_through_capture(self):
+        # every line of play starts with the king taking the pawn or moving away from it
+        random.seed(0)
+        np.random.seed(0)
+        engine_spec = base.EngineSpec(PiecewiseSenseEngine(), RandomEvaluationEngine(), ExpUCB())
+        policy_engine = ISMCTSPolicyEngine(engine_spec)
+        policy_engine.score_board(chess.Board('k7/8/8/8/8/8/1p6/K7 w - - 0 1'), 10)
+        self.assertEqual(policy_engine.trees[0].visit_count, 10)
+
+    def test_sense_memo(self):
+        for root in [base.SelfNode(PiecewiseInformationSet(Game()), chess.WHITE, None, None),
+                     TreeStore().root(base.SelfNode, PiecewiseInformationSet(Game()), chess.WHITE)]:
+            sense_engine = CountingSenseEngine()
+            sense_location = root.select_child(Game(), sense_engine, 1)
+            root.unexplored_children(Game(), sense_engine)
+            self.assertEqual(root.select_child(Game(), sense_engine, 2), sense_location)
+            self.assertEqual(sense_engine.calls, 1)
+
+            root.info_set = PiecewiseInformationSet(Game())
+            root.select_child(Game(), sense_engine, 3)
+            self.assertEqual(sense_engine.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import time
+import unittest
+
+import chess
+import numpy as np
+import torch
+
+from eval_engine_network import Net
+from game import Game
+from info_set_piecewise import PiecewiseInformationSet
+from player import Player
+from vec_game import BatchedNet, VecGame, label_examples
+
+
+class NetPlayer(Player):
+    """
+    plays the possible move the network rates highest for its starting belief
+    """
+
+    def __init__(self, net, delay=0.0):
+        """
+        :param delay: seconds the player thinks before choosing its move
+        """
+        super().__init__()
+        self.net = net
+        self.delay = delay
+        self.moves_chosen = 0
+
+    def handle_game_start(self, color, board):
+        self.info_set = PiecewiseInformationSet(Game())
+
+    def handle_opponent_move_result(self, captured_piece, captured_square):
+        pass
+
+    def choose_sense(self, possible_sense, possible_moves, seconds_left):
+        return chess.D4
+
+    def handle_sense_result(self, sense_result):
+        pass
+
+    def choose_move(self, possible_moves, seconds_left):
+        time.sleep(self.delay)
+        score, policy = self.net(self.info_set.raw[None, :])
+        self.moves_chosen += 1
+        return policy[0], possible_moves[int(torch.argmax(policy[0, :len(possible_moves)]))]
+
+    def handle_move_result(self, requested_move, taken_move, reason, captured_piece, captured_square):
+        pass
+
+    def handle_game_end(self, winner_color, win_reason):
+        pass
+
+
+class VecGameTestCases(unittest.TestCase):
+    def play(self, net, batched_net):
+        players = []
+
+        def new_players():
+            players.extend([NetPlayer(batched_net or net), NetPlayer(batched_net or net)])
+            return players[-2], players[-1]
+
+        results = VecGame(3, new_players, batched_net, max_moves=12).play(5)
+        return results, sum(player.moves_chosen for player in players)
+
+    def test_batched_play(self):
+        torch.manual_seed(0)
+        net = Net()
+        batched_net = BatchedNet(net)
+        results, moves_chosen = self.play(net, batched_net)
+        sequential_results, _ = self.play(net, None)
+
+        self.assertEqual(len(results), 5)
+        # every move of a turn is chosen in one forward pass, the last turns only have the last games left
+        self.assertEqual(sum(batched_net.batch_sizes), moves_chosen)
+        self.assertEqual(max(batched_net.batch_sizes), 3)
+        self.assertEqual(batched_net.batch_sizes[:3], [3, 3, 3])
+        for (winner, examples), (sequential_winner, sequential_examples) in zip(results, sequential_results):
+            self.assertEqual(winner, sequential_winner)
+            self.assertEqual(len(examples), 11)
+            for (raw, policy, reward), (_, sequential_policy, _) in zip(examples, sequential_examples):
+                self.assertEqual(reward, 0)
+                self.assertTrue(torch.allclose(policy, sequential_policy, atol=1e-5))
+
+    def test_clocks(self):
+        def seconds_used(n, batched):
+            net = Net()
+            batched_net = BatchedNet(net) if batched else None
+            env = VecGame(n, lambda: (NetPlayer(batched_net or net, 0.02), NetPlayer(batched_net or net, 0.02)),
+                          batched_net)
+            env.reset(n)
+            for turn in range(4):
+                env.step()
+            return max(Game().seconds_left_by_color[color] - slot.game.seconds_left_by_color[color]
+                       for slot in env.active_slots() for color in chess.COLORS)
+
+        # a game's clock only runs during its own phases, so playing more games side by side doesn't use it up faster.
+        # the fastest of a few runs keeps scheduling hiccups out of the comparison.
+        for batched in (False, True):
+            self.assertLess(min(seconds_used(3, batched) for run in range(3)),
+                            1.5 * min(seconds_used(1, batched) for run in range(3)) + 0.02)
+
+    def test_errors_reach_the_caller(self):
+        def fail(x):
+            raise ValueError('bad input')
+
+        batched_net = BatchedNet(fail)
+        with self.assertRaises(ValueError):
+            batched_net.map(lambda x: batched_net(np.zeros((1, 4))), [0, 1])
+
+    def test_label_examples(self):
+        examples = [[chess.WHITE, 'w', 'p', None], [chess.BLACK, 'b', 'p', None]]
+        self.assertEqual(label_examples(examples, chess.BLACK), [('w', 'p', -1), ('b', 'p', 1)])
+        self.assertEqual(label_examples(examples, None), [('w', 'p', 0), ('b', 'p', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
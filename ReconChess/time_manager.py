@@ -0,0 +1,50 @@
+import time
+
+
+class TimeManager:
+    """
+    splits the remaining game clock over the moves the game is still expected to last
+    """
+
+    def __init__(self, expected_game_length=50, min_moves_left=10, safety_margin=2.0, min_move_time=0.05,
+                 max_move_time=30.0):
+        """
+        :param expected_game_length: number of own moves a game is expected to take
+        :param min_moves_left: never plan for fewer remaining moves than this, so long games don't run out of time
+        :param safety_margin: seconds of the clock that are never allocated
+        :param min_move_time: smallest budget handed out for a move
+        :param max_move_time: largest budget handed out for a move, below the per turn limit of play_game
+        """
+        self.expected_game_length = expected_game_length
+        self.min_moves_left = min_moves_left
+        self.safety_margin = safety_margin
+        self.min_move_time = min_move_time
+        self.max_move_time = max_move_time
+        self.moves_played = 0
+
+    def moves_left(self):
+        return max(self.min_moves_left, self.expected_game_length - self.moves_played)
+
+    def allocate(self, seconds_left):
+        """
+        allocates the search time of the next move and counts it as played
+        :param seconds_left: seconds left on the player's clock
+        :return: search time budget in seconds
+        """
+        usable = seconds_left - self.safety_margin
+        budget = min(usable / self.moves_left(), self.max_move_time)
+        self.moves_played += 1
+        # with almost nothing left on the clock, still never exceed what is actually usable
+        return max(min(budget, usable), min(self.min_move_time, max(usable, 0.0)))
+
+
+def deadline_after(time_budget):
+    """
+    :param time_budget: seconds from now, or None for no deadline
+    :return: monotonic deadline, or None
+    """
+    return None if time_budget is None else time.monotonic() + time_budget
+
+
+def past_deadline(deadline):
+    return deadline is not None and time.monotonic() >= deadline
@@ -5,6 +5,7 @@ from torch import optim
 from engines import StockFishNNEvalEngine, RandomSenseEngine
 from game import Game
 from mcts_agent import MCTSAgent
+from vec_game import BatchedNet, VecGame, label_examples
 from copy import copy
 from engines import Net
 import pickle
@@ -26,13 +27,13 @@ def pit(n, newnet, oldnet):
     return white_wins / n
 
 
-def self_play_games(n, net, name=''):
+def self_play_games(n, net, name='', num_envs=8):
     examples = []
-    for e in range(n):
+    # the games are played side by side so the network answers all their queries in batches
+    batched_net = BatchedNet(net)
+    env = VecGame(num_envs, lambda: (MCTSAgent(batched_net), MCTSAgent(batched_net)), batched_net, MAX_MOVES)
+    for e, (winner, ex) in enumerate(env.play(n)):
         print(f"GAME {e}")
-        white = MCTSAgent(net)
-        black = MCTSAgent(net)
-        winner, ex = play_game(white, black)
         examples += ex
     pickle.dump(examples, open(name, 'wb'))
     return examples
@@ -72,15 +73,7 @@ def play_game(white_player: MCTSAgent, black_player: MCTSAgent):
     white_player.handle_game_end(winner_color, winner_reason)
     black_player.handle_game_end(winner_color, winner_reason)
 
-    for i, example in enumerate(examples):
-        if winner_color is None:
-            reward = 0
-        else:
-            reward = 1 if example[0] == winner_color else -1
-        example[-1] = reward
-        examples[i] = tuple(example[1:])
-
-    return winner_color, examples
+    return winner_color, label_examples(examples, winner_color)
 
 
 def play_turn(game, player):
@@ -0,0 +1,352 @@
+import threading
+
+import numpy as np
+
+import base as base
+
+SELF_NODE, PLAY_NODE, OPPONENT_NODE = 0, 1, 2
+
+
+class TreeStore:
+    """
+    array backed storage for a single ISMCTS tree. node statistics, parent offsets and edge ids live in preallocated
+    numpy arrays indexed by an integer node offset. the arrays double in size whenever they run out of room, so all
+    nodes of a store share the store's lock in threaded searches.
+    """
+
+    def __init__(self, capacity=1024, belief_cache: base.BeliefCache = None):
+        self.size = 0
+        self.capacity = capacity
+        self.lock = threading.RLock()
+
+        self.visit_count = np.zeros(capacity, dtype=np.int64)
+        self.total_reward = np.zeros(capacity, dtype=np.float64)
+        self.availability_count = np.zeros(capacity, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.edge_id = np.full(capacity, -1, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.player = np.zeros(capacity, dtype=np.bool_)
+
+        # children form a singly linked list of offsets so they can be walked in insertion order
+        self.first_child = np.full(capacity, -1, dtype=np.int64)
+        self.last_child = np.full(capacity, -1, dtype=np.int64)
+        self.next_sibling = np.full(capacity, -1, dtype=np.int64)
+        self.num_children = np.zeros(capacity, dtype=np.int64)
+
+        # python objects that can't be stored in numpy arrays. only pinned beliefs (such as the root's) are kept in
+        # info_sets, every other belief is rebuilt from its parent on demand and kept in the bounded belief cache
+        self.belief_cache = base.BeliefCache() if belief_cache is None else belief_cache
+        self.info_sets = []
+        self.child_keys = []
+        self.edges = []
+        self.edge_ids = {}
+        self.child_index = {}
+        self.candidates = {}
+        self.sense_memos = {}
+
+    def _grow(self):
+        old = self.capacity
+        self.capacity *= 2
+        for name, fill in [('visit_count', 0), ('total_reward', 0), ('availability_count', 0), ('parent', -1),
+                           ('edge_id', -1), ('kind', 0), ('player', False), ('first_child', -1),
+                           ('last_child', -1), ('next_sibling', -1), ('num_children', 0)]:
+            arr = getattr(self, name)
+            grown = np.full(self.capacity, fill, dtype=arr.dtype)
+            grown[:old] = arr
+            setattr(self, name, grown)
+
+    def intern_edge(self, edge):
+        """
+        maps an edge object (move tuple, sense result, captured square, ...) to a compact integer id
+        """
+        edge_id = self.edge_ids.get(edge)
+        if edge_id is None:
+            edge_id = len(self.edges)
+            self.edge_ids[edge] = edge_id
+            self.edges.append(edge)
+        return edge_id
+
+    def add(self, kind, info_set, player, incoming_edge, parent):
+        """
+        allocates a new node
+        :return: offset of the new node
+        """
+        with self.lock:
+            if self.size == self.capacity:
+                self._grow()
+            index = self.size
+            self.size += 1
+
+            self.kind[index] = kind
+            self.player[index] = player
+            self.parent[index] = parent
+            self.edge_id[index] = self.intern_edge(incoming_edge)
+            self.info_sets.append(info_set)
+            self.child_keys.append(None)
+            return index
+
+    def link(self, parent, key, child):
+        """
+        registers child as the child of parent that is reached through key
+        """
+        with self.lock:
+            if (parent, key) in self.child_index:
+                raise KeyError(f'node {parent} already has a child for {key}')
+            self.child_index[(parent, key)] = child
+            self.child_keys[child] = key
+            if self.first_child[parent] < 0:
+                self.first_child[parent] = child
+            else:
+                self.next_sibling[self.last_child[parent]] = child
+            self.last_child[parent] = child
+            self.num_children[parent] += 1
+
+    def prune(self, parent, key):
+        """
+        unlinks every child of parent except the one reached through key
+        """
+        with self.lock:
+            keep = self.child_index.get((parent, key), -1)
+            for child in self.children_of(parent):
+                if child != keep:
+                    del self.child_index[(parent, self.child_keys[child])]
+            self.first_child[parent] = keep
+            self.last_child[parent] = keep
+            self.num_children[parent] = 0 if keep < 0 else 1
+            if keep >= 0:
+                self.next_sibling[keep] = -1
+
+    def extract(self, index, info_set, capacity=1024):
+        """
+        copies the subtree below a node into a new, compacted store
+        :param info_set: belief pinned at the root of the new store
+        :return: the new store, whose root is at offset 0
+        """
+        with self.lock:
+            nodes = [index]
+            i = 0
+            while i < len(nodes):
+                nodes += self.children_of(nodes[i])
+                i += 1
+            nodes = np.array(nodes, dtype=np.int64)
+            size = len(nodes)
+            remap = np.full(self.size, -1, dtype=np.int64)
+            remap[nodes] = np.arange(size)
+
+            store = TreeStore(max(capacity, 2 * size), self.belief_cache)
+            store.size = size
+            for name in ['visit_count', 'total_reward', 'availability_count', 'kind', 'player', 'num_children']:
+                getattr(store, name)[:size] = getattr(self, name)[nodes]
+            for name in ['parent', 'first_child', 'last_child', 'next_sibling']:
+                offsets = getattr(self, name)[nodes]
+                getattr(store, name)[:size] = np.where(offsets >= 0, remap[offsets], -1)
+            store.parent[0] = -1
+            store.next_sibling[0] = -1
+
+            store.edge_id[:size] = [store.intern_edge(self.edges[self.edge_id[node]]) for node in nodes]
+            store.child_keys = [self.child_keys[node] for node in nodes]
+            store.child_keys[0] = None
+            store.info_sets = [None] * size
+            store.info_sets[0] = info_set.__copy__()
+            store.candidates = {int(remap[node]): dict(candidates) for node, candidates in self.candidates.items()
+                                if remap[node] >= 0}
+            for child in range(1, size):
+                store.child_index[(int(store.parent[child]), store.child_keys[child])] = child
+            return store
+
+    def children_of(self, index):
+        """
+        :return: list of child offsets of a node in insertion order
+        """
+        children = []
+        child = self.first_child[index]
+        while child >= 0:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def path_to_root(self, index):
+        path = []
+        while index >= 0:
+            path.append(index)
+            index = self.parent[index]
+        return path
+
+    def backprop(self, index, reward, visits=1):
+        with self.lock:
+            path = self.path_to_root(index)
+            self.visit_count[path] += visits
+            self.total_reward[path] += reward
+
+    def view(self, index):
+        return VIEW_TYPES[self.kind[index]].at(self, index)
+
+    def root(self, node_type, info_set, player):
+        """
+        creates the root of the tree
+        :param node_type: base.SelfNode or base.OpponentNode
+        :return: view of the root node
+        """
+        return VIEWS_BY_NODE_TYPE[node_type](info_set, player, None, None, store=self)
+
+
+class ChildMap:
+    """
+    dict-like view over the children of a node in a TreeStore
+    """
+
+    def __init__(self, store: TreeStore, index):
+        self.store = store
+        self.index = index
+
+    def __contains__(self, key):
+        return (self.index, key) in self.store.child_index
+
+    def __getitem__(self, key):
+        return self.store.view(self.store.child_index[(self.index, key)])
+
+    def __setitem__(self, key, node):
+        self.store.link(self.index, key, node.index)
+
+    def __len__(self):
+        return int(self.store.num_children[self.index])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [self.store.child_keys[child] for child in self.store.children_of(self.index)]
+
+    def values(self):
+        return [self.store.view(child) for child in self.store.children_of(self.index)]
+
+    def items(self):
+        return [(self.store.child_keys[child], self.store.view(child)) for child in self.store.children_of(self.index)]
+
+
+class NodeView:
+    """
+    thin view over a node in a TreeStore. subclasses mix in the behaviour of the matching base node type, so a view
+    can be used anywhere a regular node is expected.
+    """
+    kind = None
+
+    def __init__(self, info_set, player, incoming_edge, parent, belief_cache=None, store: TreeStore = None):
+        self.store = parent.store if store is None else store
+        self.index = self.store.add(self.kind, None if info_set is None else info_set.__copy__(), player,
+                                    incoming_edge, -1 if parent is None else parent.index)
+
+    @classmethod
+    def at(cls, store: TreeStore, index):
+        view = cls.__new__(cls)
+        view.store = store
+        view.index = index
+        return view
+
+    def new_child(self, node_type, *args, **kwargs):
+        return VIEWS_BY_NODE_TYPE[node_type](*args, store=self.store, **kwargs)
+
+    def backprop(self, reward, visits=1):
+        self.store.backprop(self.index, reward, visits)
+
+    def prune(self, key):
+        self.store.prune(self.index, key)
+
+    def promote(self, info_set):
+        store = self.store.extract(self.index, info_set, self.store.capacity)
+        store.belief_cache.clear()
+        return store.view(0)
+
+    @property
+    def lock(self):
+        return self.store.lock
+
+    @property
+    def belief(self):
+        return self.store.info_sets[self.index]
+
+    @belief.setter
+    def belief(self, info_set):
+        self.store.info_sets[self.index] = info_set
+
+    @property
+    def belief_cache(self):
+        return self.store.belief_cache
+
+    @property
+    def children(self):
+        return ChildMap(self.store, self.index)
+
+    @property
+    def incoming_edge(self):
+        return self.store.edges[self.store.edge_id[self.index]]
+
+    @property
+    def parent(self):
+        parent = self.store.parent[self.index]
+        return None if parent < 0 else self.store.view(parent)
+
+    @property
+    def player(self):
+        return bool(self.store.player[self.index])
+
+    @property
+    def visit_count(self):
+        return int(self.store.visit_count[self.index])
+
+    @visit_count.setter
+    def visit_count(self, value):
+        self.store.visit_count[self.index] = value
+
+    @property
+    def total_reward(self):
+        return float(self.store.total_reward[self.index])
+
+    @total_reward.setter
+    def total_reward(self, value):
+        self.store.total_reward[self.index] = value
+
+    @property
+    def availability_count(self):
+        return int(self.store.availability_count[self.index])
+
+    @availability_count.setter
+    def availability_count(self, value):
+        self.store.availability_count[self.index] = value
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+
+class SelfNodeView(NodeView, base.SelfNode):
+    kind = SELF_NODE
+
+    @property
+    def sense_memo(self):
+        return self.store.sense_memos.get(self.index)
+
+    @sense_memo.setter
+    def sense_memo(self, memo):
+        self.store.sense_memos[self.index] = memo
+
+
+class PlayNodeView(NodeView, base.PlayNode):
+    kind = PLAY_NODE
+
+    @property
+    def candidates(self):
+        return self.store.candidates.setdefault(self.index, {})
+
+
+class OpponentNodeView(NodeView, base.OpponentNode):
+    kind = OPPONENT_NODE
+
+
+VIEW_TYPES = [SelfNodeView, PlayNodeView, OpponentNodeView]
+VIEWS_BY_NODE_TYPE = {base.SelfNode: SelfNodeView, base.PlayNode: PlayNodeView, base.OpponentNode: OpponentNodeView}
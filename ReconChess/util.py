@@ -1,6 +1,8 @@
 import chess
 from collections import namedtuple
 
+import geometry
+
 Configuration = namedtuple('Config', 'white, white_args, black, black_args, verbose, num_games')
 
 
@@ -17,6 +19,93 @@ def flip_move(move: chess.Move):
         return move
     return chess.Move(int(mirror(move.from_square)), int(mirror(move.to_square)))
 
+def move_to_id(move: chess.Move):
+    """
+    packs a move into a compact integer id made of its from square, to square and promotion piece type
+    """
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def id_to_move(move_id):
+    promotion = move_id >> 12
+    return chess.Move(move_id & 63, move_id >> 6 & 63, promotion if promotion else None)
+
+
+class SenseObservation(bytes):
+    """
+    a sense result packed into bytes: the sense square followed by one piece code for every square of its window,
+    in the order of geometry.SENSE_WINDOWS. a code is 0 for an empty square, the piece type for a white piece and
+    the piece type + 6 for a black one. observations hash and compare as plain bytes.
+    """
+
+    @staticmethod
+    def from_board(board: chess.Board, square: chess.Square) -> 'SenseObservation':
+        black = board.occupied_co[chess.BLACK]
+        codes = [square]
+        for window_square in geometry.SENSE_WINDOWS[square]:
+            piece_type = board.piece_type_at(window_square)
+            codes.append(0 if piece_type is None else piece_type + 6 if black & chess.BB_SQUARES[window_square]
+                         else piece_type)
+        return SenseObservation(bytes(codes))
+
+    @staticmethod
+    def from_result(square: chess.Square, sense_result) -> 'SenseObservation':
+        """
+        :param sense_result: list of (square, chess.Piece or None) covering the window of square
+        """
+        if isinstance(sense_result, SenseObservation):
+            return sense_result
+        pieces = dict(sense_result)
+        return SenseObservation(bytes([square] + [piece_code(pieces[window_square])
+                                                  for window_square in geometry.SENSE_WINDOWS[square]]))
+
+    @property
+    def square(self) -> chess.Square:
+        return self[0]
+
+    def symbols(self):
+        """
+        :return: list of (square, piece symbol or None), without building any pieces
+        """
+        return [(window_square, CODE_SYMBOLS[code])
+                for window_square, code in zip(geometry.SENSE_WINDOWS[self[0]], self[1:])]
+
+    def pieces(self):
+        """
+        :return: the sense result as Game.handle_sense gives it, a list of (square, chess.Piece or None)
+        """
+        return [(window_square, None if symbol is None else chess.Piece.from_symbol(symbol))
+                for window_square, symbol in self.symbols()]
+
+    def mirror(self) -> 'SenseObservation':
+        """
+        the observation seen from the other side, see mirror_sense_result. turning the board around reverses the
+        window and swaps the colors.
+        """
+        return SenseObservation(bytes([63 - self[0]]) + self[:0:-1].translate(SWAP_COLORS))
+
+
+CODE_SYMBOLS = [None] + [chess.piece_symbol(piece_type).upper() for piece_type in chess.PIECE_TYPES] + \
+               [chess.piece_symbol(piece_type) for piece_type in chess.PIECE_TYPES]
+SWAP_COLORS = bytes.maketrans(bytes(range(13)), bytes([0] + list(range(7, 13)) + list(range(1, 7))))
+
+
+def piece_code(piece: chess.Piece):
+    return 0 if piece is None else piece.piece_type + (6 if piece.color == chess.BLACK else 0)
+
+
+def sense_symbols(sense_result):
+    """
+    :param sense_result: a SenseObservation or a list of (square, chess.Piece or None). other entries of the list
+                         are skipped.
+    :return: list of (square, piece symbol or None)
+    """
+    if isinstance(sense_result, SenseObservation):
+        return sense_result.symbols()
+    return [(square, None if piece is None else piece.symbol())
+            for square, piece in (loc for loc in sense_result if len(loc) == 2)]
+
+
 def mirror_sense_result(sense_result):
     new_results = []
     for result in sense_result:
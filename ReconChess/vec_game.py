@@ -0,0 +1,287 @@
+import threading
+import time
+from copy import copy
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+import chess
+import numpy as np
+import torch
+
+from game import Game
+from player import Player
+
+
+class BatchedNet:
+    """
+    wraps a network so the threads of BatchedNet.map share its forward passes. a thread asking for a forward pass
+    waits until every other running thread is waiting too (or done), then all the inputs go through the network as
+    one batch. calls from any other thread go straight to the network.
+    """
+
+    def __init__(self, net):
+        """
+        :param net: network taking an array of inputs and returning a tuple of tensors with one row per input, like
+                    eval_engine_network.Net
+        """
+        self.net = net
+        self.condition = threading.Condition()
+        self.workers = set()
+        self.running = 0
+        # [input, output, batch start] of every waiting thread, the rest is filled in by the thread running the batch
+        self.requests = []
+        self.batch_sizes = []
+        self.local = threading.local()
+
+    def waited(self) -> float:
+        """
+        :return: seconds the calling thread has spent waiting for other threads to join its batches
+        """
+        return getattr(self.local, 'waited', 0.0)
+
+    def forward(self, x):
+        if threading.get_ident() not in self.workers:
+            return self.net(x)
+        request = [np.asarray(x), None, None]
+        submitted = time.perf_counter()
+        with self.condition:
+            self.requests.append(request)
+            self._run_batch()
+            while request[1] is None:
+                self.condition.wait()
+        self.local.waited = self.waited() + request[2] - submitted
+        if isinstance(request[1], BaseException):
+            raise request[1]
+        return request[1]
+
+    __call__ = forward
+
+    def _run_batch(self):
+        # called with the condition held
+        if len(self.requests) == 0 or len(self.requests) < self.running:
+            return
+        requests, self.requests = self.requests, []
+        started = time.perf_counter()
+        for request in requests:
+            request[2] = started
+        sizes = [len(x) for x, _, _ in requests]
+        try:
+            outputs = self.net(np.concatenate([x for x, _, _ in requests]))
+            rows = zip(*[torch.split(output, sizes) for output in outputs])
+        except BaseException as e:
+            rows = [e] * len(requests)
+        for request, row in zip(requests, rows):
+            request[1] = row
+        self.batch_sizes.append(len(requests))
+        self.condition.notify_all()
+
+    def map(self, fn: Callable, items: List) -> List:
+        """
+        calls fn on every item, each in a thread of its own, batching the forward passes they make
+        :return: the results in order of items
+        """
+        results, errors = [None] * len(items), []
+        with self.condition:
+            self.running += len(items)
+
+        def work(i):
+            with self.condition:
+                self.workers.add(threading.get_ident())
+            try:
+                results[i] = fn(items[i])
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                with self.condition:
+                    self.workers.discard(threading.get_ident())
+                    self.running -= 1
+                    self._run_batch()
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(len(items))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return results
+
+
+class GameSlot:
+    """
+    one game of a VecGame with its players and what it has recorded so far
+    """
+
+    def __init__(self, game: Game, white_player: Player, black_player: Player):
+        self.game = game
+        self.players = [black_player, white_player]
+        self.move_number = 1
+        # seconds the player to move has spent on its own phases this turn
+        self.turn_seconds = 0.0
+        self.possible_moves = None
+        self.policy, self.move = None, None
+        # [color, information set, policy, reward] after every move
+        self.examples = []
+
+    def player(self) -> Player:
+        return self.players[self.game.turn]
+
+
+def label_examples(examples: List[list], winner_color: Optional[chess.Color]) -> List[tuple]:
+    """
+    fills in the reward of every example, 1 for the winner's, -1 for the loser's and 0 after a draw
+    :return: (information set, policy, reward) of every example
+    """
+    for example in examples:
+        if winner_color is None:
+            example[-1] = 0
+        else:
+            example[-1] = 1 if example[0] == winner_color else -1
+    return [tuple(example[1:]) for example in examples]
+
+
+class VecGame:
+    """
+    plays several games of recon chess in lockstep: every turn, all the games go through the sense phase, then all
+    of them choose their move, then all the moves are made. each phase runs the games' players in threads of their
+    own through a BatchedNet, so the network queries of all the players are answered in shared batches. a finished
+    game is replaced by a new one as long as there are games left to play. a game's clock only runs during its own
+    phases, see timed_phase.
+
+    players follow the protocol of MCTSAgent, in particular choose_move returns (policy, move).
+    """
+
+    def __init__(self, n: int, new_players: Callable[[], Tuple[Player, Player]], net: BatchedNet = None,
+                 max_moves: int = None, new_game: Callable[[], Game] = Game):
+        """
+        :param n: number of games played at the same time
+        :param new_players: returns the white and black player of a new game
+        :param net: the network the players query, without it the games are stepped one after the other
+        :param max_moves: games reaching this move number end in a draw, by default they are played to the end
+        :param new_game: returns the game to play
+        """
+        self.new_players = new_players
+        self.net = net
+        self.max_moves = max_moves
+        self.new_game = new_game
+        self.slots: List[Optional[GameSlot]] = [None] * n
+        self.games_left = 0
+
+    def reset(self, num_games: int = None):
+        """
+        starts games in all the free slots
+        :param num_games: number of games to play in total, no limit by default
+        """
+        self.games_left = num_games
+        for i, slot in enumerate(self.slots):
+            if slot is None:
+                self.slots[i] = self.start_game()
+
+    def start_game(self) -> Optional[GameSlot]:
+        if self.games_left is not None:
+            if self.games_left <= 0:
+                return None
+            self.games_left -= 1
+        white_player, black_player = self.new_players()
+        slot = GameSlot(self.new_game(), white_player, black_player)
+        white_player.handle_game_start(chess.WHITE, chess.Board())
+        black_player.handle_game_start(chess.BLACK, chess.Board())
+        slot.game.start()
+        return slot
+
+    def active_slots(self) -> List[GameSlot]:
+        return [slot for slot in self.slots if slot is not None]
+
+    def run_phase(self, phase: Callable[[GameSlot], None]):
+        slots = self.active_slots()
+        if self.net is None:
+            for slot in slots:
+                self.timed_phase(phase, slot)
+        else:
+            self.net.map(lambda slot: self.timed_phase(phase, slot), slots)
+
+    def timed_phase(self, phase: Callable[[GameSlot], None], slot: GameSlot):
+        """
+        runs phase with the game's clock only counting the time of this game's own phases, not the time the other
+        games spend on theirs or the time spent waiting for them to join a batch
+        """
+        slot.game.current_turn_start_time = datetime.now() - timedelta(seconds=slot.turn_seconds)
+        start, waited = time.perf_counter(), self.waited()
+        phase(slot)
+        slot.turn_seconds += time.perf_counter() - start - (self.waited() - waited)
+
+    def waited(self) -> float:
+        return 0.0 if self.net is None else self.net.waited()
+
+    @staticmethod
+    def end_turn(slot: GameSlot):
+        slot.game.current_turn_start_time = datetime.now() - timedelta(seconds=slot.turn_seconds)
+        slot.game.end_turn()
+        slot.turn_seconds = 0.0
+        slot.move_number += 1
+
+    def step(self) -> List[Tuple[Optional[chess.Color], List[tuple]]]:
+        """
+        plays one turn in every game and replaces the games that are over
+        :return: (winner color, examples) of every game that ended, see label_examples
+        """
+        for phase in (self.sense_phase, self.move_phase, self.result_phase):
+            self.run_phase(phase)
+
+        results = []
+        for i, slot in enumerate(self.slots):
+            if slot is None:
+                continue
+            self.end_turn(slot)
+            over = slot.game.is_over()
+            if over or (self.max_moves is not None and slot.move_number >= self.max_moves):
+                results.append(self.finish_game(slot, over))
+                self.slots[i] = self.start_game()
+        return results
+
+    def play(self, num_games: int) -> List[Tuple[Optional[chess.Color], List[tuple]]]:
+        """
+        plays num_games games to the end
+        :return: (winner color, examples) of every game in the order they ended
+        """
+        self.reset(num_games)
+        results = []
+        while len(self.active_slots()) > 0:
+            results += self.step()
+        return results
+
+    def finish_game(self, slot: GameSlot, over: bool) -> Tuple[Optional[chess.Color], List[tuple]]:
+        winner_color, winner_reason = slot.game.get_winner() if over else (None, None)
+        for player in slot.players:
+            player.handle_game_end(winner_color, winner_reason)
+        return winner_color, label_examples(slot.examples, winner_color)
+
+    @staticmethod
+    def sense_phase(slot: GameSlot):
+        game, player = slot.game, slot.player()
+        slot.possible_moves = game.get_moves()
+
+        # notify the player of the previous opponent's move
+        captured_square = game.opponent_move_result()
+        player.handle_opponent_move_result(captured_square is not None, captured_square)
+
+        sense = player.choose_sense(list(chess.SQUARES), slot.possible_moves, game.get_seconds_left())
+        player.handle_sense_result(game.handle_sense(sense))
+
+    @staticmethod
+    def move_phase(slot: GameSlot):
+        slot.policy, slot.move = slot.player().choose_move(slot.possible_moves, slot.game.get_seconds_left())
+
+    @staticmethod
+    def result_phase(slot: GameSlot):
+        game, player = slot.game, slot.player()
+        try:
+            requested_move, taken_move, captured_square, reason = game.handle_move(slot.move)
+        except Exception as e:
+            print(e)
+            requested_move, taken_move, captured_square, reason = slot.move, None, None, None
+        game.took_to_long_to_move = False
+
+        player.handle_move_result(requested_move, taken_move, reason, captured_square is not None,
+                                  captured_square)
+        slot.examples.append([game.turn, copy(player.info_set.raw), slot.policy, None])